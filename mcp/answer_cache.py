@@ -0,0 +1,194 @@
+import os
+import re
+import math
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import google.generativeai as genai
+
+from bigquery_client import run_sql
+from query_registry import registry
+from prefetch import detect_entities
+from feature_flags import enabled
+from metrics import ANSWER_CACHE_LOOKUPS
+
+# --- Answer cache ---
+# Popular questions ("what's the KPI for Italy?", "Italy KPI status?") are
+# answered from earlier answers instead of the Gemini + tool loop. A question
+# matches a cached one when both name the same markets, services, severities
+# and numbers, use the same negations and comparisons ("not overdue", "more
+# than" / "less than", which flip the meaning while barely changing the
+# words), the rest of the wording is similar enough (token overlap, or
+# embeddings when ANSWER_CACHE_EMBEDDING_MODEL is set) and the data has not
+# been reloaded since (update_history). Follow-ups that lean on earlier turns
+# ("and for Spain?", "why is that?") are never cached.
+
+ANSWER_CACHE_ENABLED = enabled("ANSWER_CACHE_ENABLED")
+# Minimum similarity (Jaccard on normalized words, or cosine with embeddings)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.8"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+# e.g. "models/text-embedding-004"; empty matches on normalized words only
+ANSWER_CACHE_EMBEDDING_MODEL = os.getenv("ANSWER_CACHE_EMBEDDING_MODEL", "")
+# Seconds between update_history checks
+ANSWER_CACHE_VERSION_CHECK_SECONDS = int(os.getenv("ANSWER_CACHE_VERSION_CHECK_SECONDS", "60"))
+
+# Words that point back into the conversation
+_CONTEXT_DEPENDENT = re.compile(
+    r"\b(it|its|that|this|those|these|them|they|there|same|also|again|previous|above|earlier|instead|"
+    r"else|more|other|what about|how about|and for|why)\b",
+    re.IGNORECASE,
+)
+_WORD = re.compile(r"[a-z0-9]+")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+# Negations and comparisons are matched exactly, never fuzzily
+_QUALIFIERS = {
+    "not", "no", "non", "never", "without", "except", "excluding", "more", "less", "fewer", "over", "under",
+    "above", "below", "before", "after", "greater", "least", "most", "longest", "shortest", "oldest", "newest",
+}
+_NEGATED_VERB = re.compile(r"n't\b|n’t\b")
+_STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "at", "to", "is", "are", "was", "be", "me", "my", "i", "we",
+    "our", "you", "your", "please", "can", "could", "would", "give", "show", "tell", "what", "whats", "which",
+    "how", "do", "does", "with", "by", "and", "or", "about", "current", "currently", "now", "today", "market",
+}
+
+Signature = Tuple[Any, ...]
+
+
+def _normalize(question: str, entity_words: List[str]) -> Tuple[Tuple[str, ...], frozenset]:
+    """
+    The negation/comparison words of a question and its other content words,
+    without entities, stopwords or plural endings.
+    """
+    text = _NEGATED_VERB.sub(" not", question.lower())
+    for word in entity_words:
+        text = text.replace(word.lower(), " ")
+    qualifiers, words = set(), set()
+    for word in _WORD.findall(text):
+        if word in _QUALIFIERS:
+            qualifiers.add(word)
+        elif word in _STOPWORDS or word.isdigit():
+            continue
+        else:
+            words.add(word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word)
+    return tuple(sorted(qualifiers)), frozenset(words)
+
+
+def question_parts(question: str) -> Tuple[Dict[str, List[str]], Tuple[str, ...], Tuple[str, ...], frozenset]:
+    """The entities, the numbers, the negation/comparison words and the remaining normalized words of a question."""
+    entities = detect_entities(question)
+    qualifiers, words = _normalize(question, entities["markets"] + entities["services"] + entities["severities"])
+    return entities, tuple(_NUMBER.findall(question)), qualifiers, words
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class AnswerCache:
+    def __init__(self):
+        # (data version, entity signature) -> entries, oldest first
+        self._buckets: "OrderedDict[Signature, List[Dict[str, Any]]]" = OrderedDict()
+        self._size = 0
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, question: str, earlier_user_turns: int) -> bool:
+        """False for follow-ups whose meaning depends on earlier turns."""
+        if not ANSWER_CACHE_ENABLED:
+            return False
+        return earlier_user_turns == 0 or not _CONTEXT_DEPENDENT.search(question)
+
+    def _data_version(self) -> Any:
+        now = time.time()
+        if self._version is None or now - self._checked_at >= ANSWER_CACHE_VERSION_CHECK_SECONDS:
+            rows = run_sql(registry.get("LAST_UPDATE").sql)["rows"]
+            self._version = str(rows[0][0]) if rows else None
+            self._checked_at = now
+        return self._version
+
+    def _key(self, question: str) -> Tuple[Signature, frozenset]:
+        entities, numbers, qualifiers, words = question_parts(question)
+        signature = (
+            self._data_version(),
+            tuple(sorted(entities["markets"])),
+            tuple(sorted(entities["services"])),
+            tuple(sorted(entities["severities"])),
+            numbers,
+            qualifiers,
+        )
+        return signature, words
+
+    def _similarity(self, entry: Dict[str, Any], words: frozenset, embedding: Optional[List[float]]) -> float:
+        if embedding is not None and entry.get("embedding") is not None:
+            return _cosine(embedding, entry["embedding"])
+        return _jaccard(words, entry["words"])
+
+    def _embed(self, question: str) -> Optional[List[float]]:
+        if not ANSWER_CACHE_EMBEDDING_MODEL:
+            return None
+        try:
+            return genai.embed_content(
+                model=ANSWER_CACHE_EMBEDDING_MODEL, content=question, task_type="semantic_similarity"
+            )["embedding"]
+        except Exception as e:
+            print(f"Answer cache embedding failed, matching on words: {e}")
+            return None
+
+    def get(self, question: str) -> Optional[str]:
+        """A cached answer for the question, if a similar enough one was answered on the same data."""
+        try:
+            signature, words = self._key(question)
+        except Exception as e:
+            print(f"Answer cache lookup skipped: {e}")
+            ANSWER_CACHE_LOOKUPS.labels(result="error").inc()
+            return None
+        embedding = self._embed(question)
+        now = time.time()
+        with self._lock:
+            entries = self._buckets.get(signature, [])
+            live = [e for e in entries if now - e["stored_at"] <= ANSWER_CACHE_TTL_SECONDS]
+            self._size -= len(entries) - len(live)
+            if live:
+                self._buckets[signature] = live
+                self._buckets.move_to_end(signature)
+            else:
+                self._buckets.pop(signature, None)
+            scored = [(self._similarity(e, words, embedding), e) for e in live]
+            best = max(scored, key=lambda s: s[0], default=(0.0, None))
+        if best[1] is None or best[0] < ANSWER_CACHE_SIMILARITY:
+            ANSWER_CACHE_LOOKUPS.labels(result="miss").inc()
+            return None
+        ANSWER_CACHE_LOOKUPS.labels(result="hit").inc()
+        return best[1]["answer"]
+
+    def put(self, question: str, answer: str):
+        try:
+            signature, words = self._key(question)
+        except Exception as e:
+            print(f"Answer not cached: {e}")
+            return
+        entry = {"words": words, "embedding": self._embed(question), "answer": answer, "stored_at": time.time()}
+        with self._lock:
+            self._buckets.setdefault(signature, []).append(entry)
+            self._buckets.move_to_end(signature)
+            self._size += 1
+            # Least recently used signatures go first
+            while self._size > ANSWER_CACHE_MAX_ENTRIES and self._buckets:
+                _, evicted = self._buckets.popitem(last=False)
+                self._size -= len(evicted)
+
+
+answer_cache = AnswerCache()
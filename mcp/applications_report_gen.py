@@ -1,71 +1,60 @@
 import os
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 from weasyprint import HTML
 import io
+import time
 import base64
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
-import numpy as np
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from difflib import SequenceMatcher
 from google.cloud import storage
 from google.oauth2 import service_account
 from bigquery_client import run_sql
-from bigquery_client import (
-    BG_MASTER_TABLE,
-    BG_VULNERABILITIES_TABLE,
-    BG_GLOBAL_SEVERITY_STATE_TABLE,
-    BG_MARKET_SEVERITY_STATE_TABLE,
-    BG_GLOBAL_KPI_SUMMARY,
-    BG_MARKET_KPI_SUMMARY,
-    BG_VULNS_TIME_TO_OVERDUE,
-    BG_GLOBAL_CURRENT_RISK_SUMMARY,
-    BG_MARKET_CURRENT_RISK_SUMMARY,
-    BG_VULNS_STATE_CLOSED,
-    BG_VULNS_STATE_OPEN,
-    BG_VULNS_STATE_PARKED,
-    BG_VULNS_STATE_VALIDATING,
-    BG_LAST_UPDATE
+from metrics import REPORT_PHASE_LATENCY, REPORT_QUERY_QUEUE, CHART_RENDER_LATENCY
+from tracing import submit_with_context, record_span
+from scheduler import scheduler
+from resilience import (
+    report_query, collect_sections, remaining, REPORT_DATA_DEADLINE_SECONDS
 )
+from report_storage import report_store
+from query_registry import registry, APPLICATION_SERVICES
+from risk_layer import risk_layer
 
 # Define directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
-QUERY_DIR = os.path.join(BASE_DIR, "queries")
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
+# Without these sections the report is not worth sending
+CRITICAL_SECTIONS = {"total_vulnerabilities_count"}
 
 # Set up Jinja2 environment
 jinja_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), autoescape=select_autoescape(['html', 'xml']))
 key_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-if key_path and os.path.exists(key_path):
-    creds = service_account.Credentials.from_service_account_file(key_path)
-    gcs_client = storage.Client(credentials=creds, project=creds.project_id)
-else:
-    gcs_client = storage.Client()
-gcs_bucket = gcs_client.bucket(GCS_BUCKET_NAME) if GCS_BUCKET_NAME else None
-
-# --- SQL Query Loader ---
-# This dictionary maps query names to their file names
-QUERY_FILES = {
-    "APP_SEVERITY_COUNT": "APP_SEVERITY_COUNT.sql",
-    "APP_SEVERITY_SERVICE_COUNT": "APP_SEVERITY_SERVICE_COUNT.sql",
-    "APP_CURRENT_RISK": "APP_CURRENT_RISK.sql",
-    "BLACKBOX_CURRENT_RISK": "BLACKBOX_CURRENT_RISK.sql",
-    "WHITEBOX_CURRENT_RISK": "WHITEBOX_CURRENT_RISK.sql",
-    "APP_VULN_TYPES": "APP_VULN_TYPES.sql",
-    "RECOMMENDATIONS": "RECOMMENDATIONS.sql",
-    "APP_TOT_CURRENT_RISK": "APP_TOT_CURRENT_RISK.sql",
-    "APP_TOT_VULN_COUNT": "APP_TOT_VULN_COUNT.sql",
-    "APP_VULN_TYPES_RISK": "APP_VULN_TYPES_RISK.sql",
-    "LAST_UPDATE": "LAST_UPDATE.sql",
-}
-
-QUERIES = {}
+gcs_client = None
+if GCS_BUCKET_NAME:
+    # Only build a client when reports can be uploaded (keeps offline imports working)
+    if key_path and os.path.exists(key_path):
+        creds = service_account.Credentials.from_service_account_file(key_path)
+        gcs_client = storage.Client(credentials=creds, project=creds.project_id)
+    else:
+        gcs_client = storage.Client()
+gcs_bucket = gcs_client.bucket(GCS_BUCKET_NAME) if gcs_client else None
 
+def _observe_phase(phase: str, scope: str, phase_start: int) -> int:
+    """
+    Records a report phase (metric + trace span) and returns the start of the next one.
+    Times are time.time_ns() values.
+    """
+    now = time.time_ns()
+    REPORT_PHASE_LATENCY.labels(report="application", phase=phase, scope=scope).observe((now - phase_start) / 1e9)
+    record_span(f"report.{phase}", phase_start, now, report="application", scope=scope)
+    return now
 
+
+@CHART_RENDER_LATENCY.labels(chart="severity_pie").time()
 def _create_pie_chart(title, data_dict, color_map):
     """
     Creates a pie chart from a dictionary of {label: value}
@@ -156,100 +145,68 @@ def get_unique_recommendations(reco_list, similarity_threshold=0.85):
     return unique_recommendations
 
 
-def load_query(name: str, file_name: str) -> str:
-    """Loads a query from a .sql file and formats it with table names."""
-    try:
-        with open(os.path.join(QUERY_DIR, file_name), 'r') as f:
-            # Format the query with the actual table names from the client
-            return f.read().format(
-                BG_MASTER_TABLE=BG_MASTER_TABLE,
-                BG_VULNERABILITIES_TABLE=BG_VULNERABILITIES_TABLE,
-                BG_GLOBAL_SEVERITY_STATE_TABLE=BG_GLOBAL_SEVERITY_STATE_TABLE,
-                BG_MARKET_SEVERITY_STATE_TABLE=BG_MARKET_SEVERITY_STATE_TABLE,
-                BG_GLOBAL_KPI_SUMMARY=BG_GLOBAL_KPI_SUMMARY,
-                BG_MARKET_KPI_SUMMARY=BG_MARKET_KPI_SUMMARY,
-                BG_VULNS_TIME_TO_OVERDUE=BG_VULNS_TIME_TO_OVERDUE,
-                BG_GLOBAL_CURRENT_RISK_SUMMARY=BG_GLOBAL_CURRENT_RISK_SUMMARY,
-                BG_MARKET_CURRENT_RISK_SUMMARY=BG_MARKET_CURRENT_RISK_SUMMARY,
-                BG_VULNS_STATE_CLOSED=BG_VULNS_STATE_CLOSED,
-                BG_VULNS_STATE_OPEN=BG_VULNS_STATE_OPEN,
-                BG_VULNS_STATE_PARKED=BG_VULNS_STATE_PARKED,
-                BG_VULNS_STATE_VALIDATING=BG_VULNS_STATE_VALIDATING,
-                BG_LAST_UPDATE=BG_LAST_UPDATE
-            )
-    except FileNotFoundError:
-        print(f"Error: Query file not found: {file_name}")
-        return ""
-    except Exception as e:
-        print(f"Error loading query {name}: {e}")
-        return ""
-
-# Load all queries into memory on startup
-for name, file_name in QUERY_FILES.items():
-    QUERIES[name] = load_query(name, file_name)
-
-
 def _get_data():
     """
     Fetches a comprehensive set of data for the report concurrently.
     """
     data = {"counts": {}}
 
-    # Use a ThreadPoolExecutor to run queries in parallel
-    executor = ThreadPoolExecutor(max_workers=20)
+    # Application metrics are the shared templates compiled for the service scope
+    queries = registry.for_scope("service")
+    app_services = {"services": APPLICATION_SERVICES}
+
+    # Run queries in parallel on the scheduler's shared report executor
+    executor = scheduler.report_query_executor
     futures = {}
 
+    def submit(query, key, **scope_values):
+        futures[submit_with_context(
+            executor, report_query, key, run_sql, query.sql, params=query.params(**scope_values)
+        )] = key
+
     # Define all queries to be run
     # --- Last update ---
-    futures[executor.submit(run_sql, QUERIES["LAST_UPDATE"])] = "last_update"
+    submit(registry.get("LAST_UPDATE"), "last_update")
 
     # --- Vulnerability Types ---
-    vuln_types_sql = QUERIES["APP_VULN_TYPES"]
-    futures[executor.submit(run_sql, vuln_types_sql, params=None)] = "vuln_types"
+    submit(registry.get("APP_VULN_TYPES"), "vuln_types")
 
     # --- Counts Total Vulnerabilities ---
-    total_vulnerabilities_sql = QUERIES["APP_TOT_VULN_COUNT"]
-    futures[executor.submit(run_sql, total_vulnerabilities_sql, params=None)] = "total_vulnerabilities_count"
+    submit(queries["COUNT_TOT_VULNS"], "total_vulnerabilities_count", **app_services)
 
     # --- App Severity Count ---
-    app_severity_count_sql = QUERIES["APP_SEVERITY_COUNT"]
-    futures[executor.submit(run_sql, app_severity_count_sql, params=None)] = "app_severity_count"
+    submit(queries["COUNT_TOT_VULNS_SEVERITY"], "app_severity_count", **app_services)
 
     # --- App Service Count ---
-    app_severity_service_count_sql = QUERIES["APP_SEVERITY_SERVICE_COUNT"]
-    futures[executor.submit(run_sql, app_severity_service_count_sql, params=None)] = "app_severity_service_count"
+    submit(registry.get("APP_SEVERITY_SERVICE_COUNT"), "app_severity_service_count")
 
     # --- Recommendation ---
-    recommendation_sql = QUERIES["RECOMMENDATIONS"]
-    futures[executor.submit(run_sql, recommendation_sql, params=None)] = "recommendation"
+    submit(registry.get("RECOMMENDATIONS"), "recommendation")
 
-    # --- Risk Query ---
+    # --- Risk ---
+    # Read from the precomputed risk layer (one load per data refresh)
     # This is the actual current risk
-    app_current_risk_sql = QUERIES["APP_CURRENT_RISK"]
-    futures[executor.submit(run_sql, app_current_risk_sql, params=None)] = "app_current_risk"
+    futures[submit_with_context(executor, risk_layer.active_risk, APPLICATION_SERVICES)] = "app_current_risk"
+    futures[submit_with_context(executor, risk_layer.active_risk, ["Black Box"])] = "black_current_risk"
+    futures[submit_with_context(executor, risk_layer.active_risk, ["White Box"])] = "white_current_risk"
 
-    black_current_risk_sql = QUERIES["BLACKBOX_CURRENT_RISK"]
-    futures[executor.submit(run_sql, black_current_risk_sql, params=None)] = "black_current_risk"
+    # Include closed and parked
+    futures[submit_with_context(executor, risk_layer.active_risk, APPLICATION_SERVICES, active_only=False)] = "app_tot_current_risk"
 
-    white_current_risk_sql = QUERIES["WHITEBOX_CURRENT_RISK"]
-    futures[executor.submit(run_sql, white_current_risk_sql, params=None)] = "white_current_risk"
+    futures[submit_with_context(executor, risk_layer.vuln_type_risk, APPLICATION_SERVICES)] = "app_vuln_types_risk"
 
-    # Include closed and parked
-    app_tot_current_risk_sql = QUERIES["APP_TOT_CURRENT_RISK"]
-    futures[executor.submit(run_sql, app_tot_current_risk_sql, params=None)] = "app_tot_current_risk"
-
-    app_vuln_types_risk_sql = QUERIES["APP_VULN_TYPES_RISK"]
-    futures[executor.submit(run_sql, app_vuln_types_risk_sql, params=None)] = "app_vuln_types_risk"
-
-    # Process results as they complete
-    results = {}
-    for future in as_completed(futures):
-        query_name = futures[future]
-        try:
-            results[query_name] = future.result()
-        except Exception as e:
-            print(f"Error running query {query_name}: {e}")
-            results[query_name] = None  # Handle failures gracefully
+    REPORT_QUERY_QUEUE.labels(report="application").inc(len(futures))
+    for future in futures:
+        future.add_done_callback(lambda _: REPORT_QUERY_QUEUE.labels(report="application").dec())
+
+    # Wait for the sections until the data deadline; late or failed ones are left out
+    left = remaining()
+    timeout = REPORT_DATA_DEADLINE_SECONDS if left is None else min(REPORT_DATA_DEADLINE_SECONDS, left)
+    results, missing = collect_sections(futures, timeout)
+    critical_missing = sorted(CRITICAL_SECTIONS.intersection(missing))
+    if critical_missing:
+        raise Exception(f"Report data unavailable: {', '.join(critical_missing)}")
+    data['missing_sections'] = [name.replace("_", " ") for name in missing]
 
     # --- Assemble Data ---
     # Last update
@@ -364,20 +321,27 @@ def _get_data():
 
 def application_report():
     """
-    Generates a PDF report, uploads it to GCS, and returns a
-    time-limited signed URL..
+    Generates a PDF report, stores it (GCS or the local report store) and
+    returns a time-limited download link.
     """
     print(f"Generating report")
-    if not gcs_bucket:
+    if not gcs_bucket and not report_store.local:
         raise Exception("GCS_BUCKET_NAME environment variable is not set.")
 
+    # Asked again (often because the last link expired): a new link to the same PDF
+    reused = report_store.reuse("application", gcs_bucket, "application", minutes=5)
+    if reused:
+        return reused
+
     base_name = f"VULNAI_Application_Report_{uuid.uuid4()}"
     file_name = f"{base_name}.pdf"
 
 
     try:
         # 1. Fetch all raw data concurrently
+        phase_start = time.time_ns()
         report_data = _get_data()
+        phase_start = _observe_phase("get_data", "application", phase_start)
 
         # 2. Prepare template context
         context = {
@@ -388,27 +352,17 @@ def application_report():
         # 3. Load and render the HTML template
         template = jinja_env.get_template("application_template.html")
         html_content = template.render(context)
+        phase_start = _observe_phase("render_html", "application", phase_start)
 
-        # 4. Convert HTML to PDF in memory
-        pdf_buffer = io.BytesIO()
-        HTML(string=html_content).write_pdf(pdf_buffer)
-        pdf_buffer.seek(0)
-
-        # 5. Upload to GCS
-        blob = gcs_bucket.blob(file_name)
-        blob.upload_from_file(
-            pdf_buffer,
-            content_type='application/pdf'
-        )
-
-        print(f"Report uploaded to GCS: {file_name}")
+        # 4+5. Convert HTML to PDF straight into the report store
+        pdf_bytes = report_store.save(gcs_bucket, file_name, HTML(string=html_content).write_pdf, "application")
+        phase_start = _observe_phase("stream_pdf", "application", phase_start)
+        print(f"Report stored: {file_name} ({pdf_bytes} bytes)")
 
-        # 6. Generate a 5-minute signed URL
-        signed_url = blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(minutes=5),
-            method="GET",
-        )
+        # 6. Generate a 5-minute download link
+        signed_url = report_store.link(gcs_bucket, file_name, minutes=5)
+        _observe_phase("sign_url", "application", phase_start)
+        report_store.remember("application", file_name)
 
         return signed_url
 
@@ -416,17 +370,8 @@ def application_report():
         print(f"Failed to generate report: {e}")
         # Optionally, upload an error report
         error_html = f"<html><body><h1>Failed to generate application report</h1><p>{e}</p></body></html>"
-        pdf_buffer = io.BytesIO()
-        HTML(string=error_html).write_pdf(pdf_buffer)
-        pdf_buffer.seek(0)
-
-        blob = gcs_bucket.blob(file_name)  # Overwrite if partial
-        blob.upload_from_file(pdf_buffer, content_type='application/pdf')
-
-        signed_url = blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(minutes=1),
-            method="GET",
-        )
+        # Overwrite if partial
+        report_store.save(gcs_bucket, file_name, HTML(string=error_html).write_pdf, "error")
+        signed_url = report_store.link(gcs_bucket, file_name, minutes=1)
         # Return the error URL so the user knows something went wrong
         return f"Failed to generate report. Error log: {signed_url}"
\ No newline at end of file
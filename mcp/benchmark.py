@@ -0,0 +1,279 @@
+"""
+Offline benchmark suite for the MCP server hot paths.
+
+BigQuery is replaced by a DuckDB stand-in (local_bq.LocalBigQuery) loaded with
+synthetic vulnerabilities_master-shaped data, GCS by fake_gcs.FakeBucket and
+Gemini by a scripted model, so the suite runs without GCP access.
+
+Usage:
+    python benchmark.py --rows 50000 --iterations 5 --output bench.json
+    python benchmark.py --compare bench_baseline.json --threshold 0.25
+
+Features that let a repeated request skip work are turned off with
+FULL_PATH_ONLY (feature_flags.py), so every iteration measures the full path;
+prompt assembly is timed on its own.
+
+Results are written as JSON (--output). With --compare, any benchmark whose median got
+slower than the baseline by more than --threshold makes the process exit 1.
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import platform
+import threading
+import statistics
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+# Reports must not build a real GCS client when imported offline
+os.environ.pop("GCS_BUCKET_NAME", None)
+# Every iteration takes the full path: no caches, prefetch, coalescing, model
+# routing, direct report dispatch, report reuse or rate limits (see feature_flags.py)
+os.environ["FULL_PATH_ONLY"] = "true"
+
+from local_bq import LocalBigQuery
+from fake_gcs import FakeBucket, FakeUploadTransport
+
+
+def _timeit(fn: Callable[[], Any], iterations: int, warmup: int = 1) -> Dict[str, float]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    p95_index = min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))
+    return {
+        "iterations": iterations,
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[p95_index], 3),
+        "mean_ms": round(statistics.fmean(samples), 3),
+    }
+
+
+# --- Scripted stand-in for the Gemini chat session ---
+
+def _function_call_response(name: str, args: Dict[str, Any]):
+    part = SimpleNamespace(function_call=SimpleNamespace(name=name, args=args))
+    return SimpleNamespace(candidates=[SimpleNamespace(content=SimpleNamespace(parts=[part]))])
+
+
+class _TextResponse:
+    def __init__(self, text: str):
+        part = SimpleNamespace(function_call=None, text=text)
+        self.candidates = [SimpleNamespace(content=SimpleNamespace(parts=[part]))]
+        self.text = text
+
+
+class ScriptedChatSession:
+    def __init__(self, script: List[Any]):
+        self._script = list(script)
+
+    def send_message(self, content, generation_config=None):
+        return self._script.pop(0)
+
+
+class ScriptedModel:
+    """Replays a fixed sequence of tool calls followed by a final text answer."""
+
+    def __init__(self, tool_calls: List[Dict[str, Any]], answer: str = "Fine. Here are your numbers."):
+        self.tool_calls = tool_calls
+        self.answer = answer
+
+    def start_chat(self, history=None):
+        script = [_function_call_response(c["name"], c["args"]) for c in self.tool_calls]
+        script.append(_TextResponse(self.answer))
+        return ScriptedChatSession(script)
+
+    def generate_content(self, contents, generation_config=None):
+        return _TextResponse("Summary of previous conversation: benchmark.")
+
+
+CHAT_TOOL_CALLS = [
+    {"name": "run_sql", "args": {"sql": "SELECT * FROM `gostlm.gost_bq.market_kpi_summary` WHERE market = 'Italy'"}},
+    {"name": "run_sql", "args": {"sql": "SELECT severity, state, service, vulnerability_count FROM `gostlm.gost_bq.markets_severity_state_service` WHERE market = 'Italy'"}},
+    {"name": "run_sql", "args": {"sql": "SELECT * FROM `gostlm.gost_bq.vulnerabilities_light` WHERE severity = 'Critical' ORDER BY published_at DESC"}},
+]
+
+
+def run_benchmarks(rows: int, iterations: int, market: str) -> Dict[str, Any]:
+    local = LocalBigQuery()
+    load_start = time.perf_counter()
+    local.load_synthetic(rows=rows)
+    load_ms = (time.perf_counter() - load_start) * 1000
+
+    # Import after the environment is prepared, then swap BigQuery and GCS
+    import report_generator
+    import applications_report_gen
+    import result_shaping
+    import market_resolver
+    import trend_store
+    import risk_layer
+    import report_storage
+    import model_router
+    import mcp_server
+    from query_registry import registry
+    from scheduler import scheduler, Overloaded
+    from fastapi import BackgroundTasks, Request
+    from weasyprint import HTML
+
+    for module in (report_generator, applications_report_gen, result_shaping, market_resolver, trend_store, risk_layer):
+        module.run_sql = local.run_sql
+    report_generator.run_sql_arrow = local.run_sql_arrow
+    risk_layer.run_sql_arrow = local.run_sql_arrow
+    report_generator.gcs_bucket = FakeBucket()
+    applications_report_gen.gcs_bucket = FakeBucket()
+    report_storage.upload_transport = FakeUploadTransport()
+
+    results: Dict[str, Dict[str, float]] = {}
+
+    # Report data fan-out
+    results["report.get_data.global"] = _timeit(lambda: report_generator._get_data("global"), iterations)
+    results["report.get_data.market"] = _timeit(lambda: report_generator._get_data(market), iterations)
+    results["application_report.get_data"] = _timeit(applications_report_gen._get_data, iterations)
+
+    # Charts
+    avg_rows = local.run_sql(registry.for_scope("global")["AVERAGE_TIME_PER_SEVERITY_OPEN"].sql)["rows"]
+    state_rows = local.run_sql(registry.for_scope("global")["VULNS_STATE_COUNT"].sql)["rows"]
+    results["chart.avg_time_bar"] = _timeit(
+        lambda: report_generator._create_avg_time_chart("Average Age", avg_rows), iterations
+    )
+    results["chart.pie"] = _timeit(lambda: report_generator._create_pie_chart("State", state_rows), iterations)
+
+    # Template rendering and PDF
+    data = report_generator._get_data("global")
+    context = {"market_name": "global", "generated_at": "2025-01-01", "data": data}
+    template = report_generator.jinja_env.get_template("overview_template.html")
+    html_content = template.render(context)
+    results["report.render_html"] = _timeit(lambda: template.render(context), iterations)
+    results["report.write_pdf"] = _timeit(lambda: HTML(string=html_content).write_pdf(io.BytesIO()), iterations)
+    results["report.generate_report.end_to_end"] = _timeit(lambda: report_generator.generate_report("global"), iterations)
+
+    # Recommendation dedup
+    reco_rows = local.run_sql(registry.get("RECOMMENDATIONS").sql)
+    reco_index = reco_rows["columns"].index("recommendation_list")
+    reco_lists = [row[reco_index] or [] for row in reco_rows["rows"]]
+    results["application_report.get_unique_recommendations"] = _timeit(
+        lambda: [applications_report_gen.get_unique_recommendations(r) for r in reco_lists], iterations
+    )
+
+    # Chat tool loop with a scripted model
+    mcp_server.MODEL = ScriptedModel(CHAT_TOOL_CALLS)
+    mcp_server.SUMMARY_MODEL = ScriptedModel([])
+    mcp_server.FAST_MODEL = ScriptedModel(CHAT_TOOL_CALLS[:1])
+    mcp_server.TOOL_MAP = dict(mcp_server.AVAILABLE_TOOLS)
+    request = mcp_server.ChatRequest(
+        messages=[mcp_server.Message(role="user", content=f"Give me an overview of {market}")]
+    )
+    http_request = Request({"type": "http", "headers": [], "client": ("127.0.0.1", 0)})
+    results["chat.tool_loop"] = _timeit(lambda: mcp_server.chat(request, BackgroundTasks(), http_request), iterations)
+    lookup_request = mcp_server.ChatRequest(
+        messages=[mcp_server.Message(role="user", content=f"How many open Critical vulnerabilities in {market}?")]
+    )
+    # The fast-model route is what this one measures, so the router is switched back on for it
+    model_router.ROUTER_ENABLED = True
+    try:
+        results["chat.tool_loop.lookup_route"] = _timeit(
+            lambda: mcp_server.chat(lookup_request, BackgroundTasks(), http_request), iterations
+        )
+    finally:
+        model_router.ROUTER_ENABLED = False
+
+    # Long transcript: earlier answers with large tables, trimmed to the token budget
+    table_answer = "| market | severity | state | count |\n" + "| Italy | High | Open | 12 |\n" * 60
+    long_request = mcp_server.ChatRequest(messages=[
+        mcp_server.Message(role="user" if i % 2 == 0 else "assistant", content=table_answer if i % 2 else f"Question {i} about {market}")
+        for i in range(40)
+    ] + [mcp_server.Message(role="user", content=f"Give me an overview of {market}")])
+    results["chat.tool_loop.long_history"] = _timeit(
+        lambda: mcp_server.chat(long_request, BackgroundTasks(), http_request), iterations
+    )
+    results["prompt.assemble"] = _timeit(
+        lambda: mcp_server.prompt_assembler.assemble(f"How many open Critical vulnerabilities in {market}?"), iterations
+    )
+
+    # Interactive run_sql while report bursts keep the report pool busy
+    interactive_sql = CHAT_TOOL_CALLS[0]["args"]["sql"]
+    stop = threading.Event()
+
+    def report_burst():
+        while not stop.is_set():
+            try:
+                scheduler.run_tool("generate_report", "benchmark", report_generator.generate_report, market="global")
+            except Overloaded:
+                time.sleep(0.05)
+
+    burst = [threading.Thread(target=report_burst, daemon=True) for _ in range(4)]
+    for thread in burst:
+        thread.start()
+    results["sched.run_sql_during_report_burst"] = _timeit(
+        lambda: scheduler.run_tool("run_sql", "benchmark", result_shaping.run_sql_for_model, sql=interactive_sql),
+        iterations,
+    )
+    stop.set()
+    for thread in burst:
+        thread.join()
+
+    return {
+        "meta": {
+            "rows": rows,
+            "iterations": iterations,
+            "market": market,
+            "synthetic_load_ms": round(load_ms, 3),
+            "python": platform.python_version(),
+            "timestamp": int(time.time()),
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Returns a description of every benchmark whose median regressed past `threshold`."""
+    regressions = []
+    for name, stats in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("median_ms"):
+            continue
+        change = (stats["median_ms"] - base["median_ms"]) / base["median_ms"]
+        stats["change_vs_baseline"] = round(change, 4)
+        if change > threshold:
+            regressions.append(f"{name}: {base['median_ms']}ms -> {stats['median_ms']}ms (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the MCP server.")
+    parser.add_argument("--rows", type=int, default=50000, help="Synthetic vulnerabilities to generate.")
+    parser.add_argument("--iterations", type=int, default=5)
+    parser.add_argument("--market", default="Italy")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the JSON results.")
+    parser.add_argument("--compare", help="Baseline JSON produced by a previous run.")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed median slowdown (0.25 = 25%%).")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.rows, args.iterations, args.market)
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        report["regressions"] = regressions
+
+    # Written to a file: the modules under test log to stdout
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results written to {args.output}")
+
+    if regressions:
+        print("Performance regressions detected:\n  " + "\n  ".join(regressions), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,19 @@
 from google.cloud import bigquery
-from google.cloud.bigquery import QueryJobConfig, ScalarQueryParameter
+from google.cloud.bigquery import QueryJobConfig, ScalarQueryParameter, ArrayQueryParameter
+from google.cloud.bigquery_storage import BigQueryReadClient
 from google.oauth2 import service_account
 import os
 import json
+import time
 from typing import List, Dict, Optional, Any
 from datetime import datetime
+from metrics import BQ_QUERY_LATENCY, BQ_BYTES_PROCESSED, LOCAL_MIRROR_QUERIES, current_tool_labels
+from tracing import tracer
+from local_mirror import LocalMirror, LOCAL_MIRROR_ENABLED
+from resilience import resilient_call, remaining, DeadlineExceeded
+from singleflight import SingleFlight, query_key
+from result_cache import result_cache
+from concurrent.futures import TimeoutError as FutureTimeoutError
 
 BG_MASTER_TABLE = "gostlm.gost_bq.vulnerabilities_master"
 BG_VULNERABILITIES_TABLE = "gostlm.gost_bq.vulnerabilities_light"
@@ -21,6 +30,19 @@ BG_VULNS_STATE_PARKED = "gostlm.gost_bq.state_parked"
 BG_VULNS_STATE_VALIDATING = "gostlm.gost_bq.state_validating"
 BG_LAST_UPDATE = "gostlm.gost_bq.update_history"
 
+# Tables copied into the local mirror (see local_mirror.py)
+MIRROR_TABLES = [
+    BG_MASTER_TABLE, BG_VULNERABILITIES_TABLE, BG_GLOBAL_SEVERITY_STATE_TABLE, BG_MARKET_SEVERITY_STATE_TABLE,
+    BG_GLOBAL_KPI_SUMMARY, BG_MARKET_KPI_SUMMARY, BG_VULNS_TIME_TO_OVERDUE, BG_GLOBAL_CURRENT_RISK_SUMMARY,
+    BG_MARKET_CURRENT_RISK_SUMMARY, BG_VULNS_STATE_CLOSED, BG_VULNS_STATE_OPEN, BG_VULNS_STATE_PARKED,
+    BG_VULNS_STATE_VALIDATING,
+]
+local_mirror = LocalMirror(MIRROR_TABLES, BG_LAST_UPDATE)
+# Concurrent identical queries share one BigQuery job
+query_flight = SingleFlight("bigquery")
+
+_bqstorage_client = None
+
 def get_bq_client():
     key_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
     if key_path and os.path.exists(key_path):
@@ -31,45 +53,166 @@ def get_bq_client():
 
 def list_tables(dataset: str) -> List[str]:
     client = get_bq_client()
-    return [t.table_id for t in client.list_tables(dataset)]
+    return resilient_call("bigquery", lambda: [t.table_id for t in client.list_tables(dataset, timeout=remaining())])
 
 def get_table_schema(fully_qualified: str) -> Dict:
     client = get_bq_client()
-    table = client.get_table(fully_qualified)
+    table = resilient_call("bigquery", lambda: client.get_table(fully_qualified, timeout=remaining()))
     return {
         "table": fully_qualified,
         "schema": [{"name": s.name, "type": s.field_type, "mode": s.mode} for s in table.schema],
     }
 
-def run_sql(sql: str, params: Optional[Dict[str, Any]] = None, max_results: int = 100):
-    """
-    Runs a SQL query, now with support for query parameters to prevent SQL injection.
-    """
-    client = get_bq_client()
+def start_local_mirror():
+    """Starts the background mirror sync when LOCAL_MIRROR_ENABLED is set."""
+    if not LOCAL_MIRROR_ENABLED:
+        print("Local mirror disabled (LOCAL_MIRROR_ENABLED=false).")
+        return
+    local_mirror.start(get_bq_client, get_bqstorage_client)
+
+def get_bqstorage_client():
+    """BigQuery Storage Read API client, created once and shared (it holds a gRPC channel)."""
+    global _bqstorage_client
+    if _bqstorage_client is None:
+        key_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+        if key_path and os.path.exists(key_path):
+            creds = service_account.Credentials.from_service_account_file(key_path)
+            _bqstorage_client = BigQueryReadClient(credentials=creds)
+        else:
+            _bqstorage_client = BigQueryReadClient()
+    return _bqstorage_client
+
+def _param_type(value: Any) -> str:
+    """Infers the BigQuery type of a query parameter value."""
+    if isinstance(value, bool):
+        return "BOOL"
+    elif isinstance(value, int):
+        return "INT64"
+    elif isinstance(value, float):
+        return "FLOAT64"
+    elif isinstance(value, datetime):
+        return "TIMESTAMP"
+    return "STRING"
+
+def _job_config(params: Optional[Dict[str, Any]]) -> QueryJobConfig:
     job_config = QueryJobConfig()
 
     if params:
         query_params = []
         for key, value in params.items():
-            # Infer type for BigQuery parameter
-            param_type = "STRING"
-            if isinstance(value, bool):
-                param_type = "BOOL"
-            elif isinstance(value, int):
-                param_type = "INT64"
-            elif isinstance(value, float):
-                param_type = "FLOAT64"
-            elif isinstance(value, datetime):
-                param_type = "TIMESTAMP"
-
-            query_params.append(ScalarQueryParameter(key, param_type, value))
+            # Lists become ARRAY parameters, e.g. `market IN UNNEST(@markets)`
+            if isinstance(value, (list, tuple)):
+                element_type = _param_type(value[0]) if value else "STRING"
+                query_params.append(ArrayQueryParameter(key, element_type, list(value)))
+            else:
+                query_params.append(ScalarQueryParameter(key, _param_type(value), value))
         job_config.query_parameters = query_params
+    return job_config
+
+def _run_job(sql: str, params: Optional[Dict[str, Any]], fetch, result_format: str):
+    """
+    Runs a query job with metrics and tracing; fetch(job, timeout) downloads the results.
+    Transient errors are retried and the job is bounded by the caller's deadline.
+    """
+    return resilient_call("bigquery", _run_job_once, sql, params, fetch, result_format)
+
+def _run_job_once(sql: str, params: Optional[Dict[str, Any]], fetch, result_format: str):
+    client = get_bq_client()
+    job_config = _job_config(params)
+    timeout = remaining()
+    if timeout is not None:
+        # BigQuery cancels the job itself once the caller has given up
+        job_config.job_timeout_ms = max(1000, int(timeout * 1000))
+
+    start = time.perf_counter()
+    labels = current_tool_labels()
+    with tracer.start_as_current_span("bigquery.query") as span:
+        span.set_attribute("db.statement", sql[:2000])
+        span.set_attribute("bq.result_format", result_format)
+        job = None
+        try:
+            job = client.query(sql, job_config=job_config, timeout=timeout)
+            span.set_attribute("bq.job_id", job.job_id)
+            payload, total_rows = fetch(job, remaining())
+        except FutureTimeoutError:
+            BQ_QUERY_LATENCY.labels(status="timeout", **labels).observe(time.perf_counter() - start)
+            if job is not None:
+                try:
+                    job.cancel()
+                except Exception as e:
+                    print(f"Could not cancel BigQuery job {job.job_id}: {e}")
+            raise DeadlineExceeded(f"BigQuery query did not finish within {timeout:.0f}s.")
+        except Exception:
+            BQ_QUERY_LATENCY.labels(status="error", **labels).observe(time.perf_counter() - start)
+            raise
+        BQ_QUERY_LATENCY.labels(status="ok", **labels).observe(time.perf_counter() - start)
+        BQ_BYTES_PROCESSED.labels(**labels).inc(job.total_bytes_processed or 0)
+        span.set_attribute("bq.bytes_processed", job.total_bytes_processed or 0)
+        span.set_attribute("bq.cache_hit", bool(job.cache_hit))
+        span.set_attribute("bq.total_rows", total_rows or 0)
+    return payload
+
+def run_sql(sql: str, params: Optional[Dict[str, Any]] = None, max_results: int = 100):
+    """
+    Runs a SQL query, now with support for query parameters to prevent SQL injection.
+    Eligible SELECTs are answered by the local mirror when it is in sync.
+    """
+    key = query_key(sql, params, "rows", max_results)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+    if local_mirror.can_serve(sql):
+        try:
+            return local_mirror.run_sql(sql, params, max_results)
+        except Exception as e:
+            LOCAL_MIRROR_QUERIES.labels(result="fallback").inc()
+            print(f"Local mirror query failed, falling back to BigQuery: {e}")
+
+    def fetch(job, timeout):
+        result = job.result(max_results=max_results, timeout=timeout)
+        rows = list(result)
+        cols = [schema.name for schema in result.schema]
+        data = [list(row) for row in rows]
+        # total_rows covers the full result, not only the fetched page
+        return {"columns": cols, "rows": data, "total_rows": result.total_rows}, result.total_rows
+
+    return query_flight.do(key, _run_job, sql, params, fetch, "rows")
+
+def prefetch_sql(sql: str, params: Optional[Dict[str, Any]] = None, max_results: int = 100) -> bool:
+    """
+    Runs a query ahead of time and keeps its result for the next identical run_sql call.
+    Returns False when a fresh result is already cached.
+    """
+    key = query_key(sql, params, "rows", max_results)
+    if result_cache.contains(key):
+        return False
+    result_cache.put(key, run_sql(sql, params, max_results))
+    return True
+
+def run_sql_arrow(sql: str, params: Optional[Dict[str, Any]] = None, max_results: Optional[int] = None):
+    """
+    Runs a SQL query and returns a pyarrow.Table instead of Python rows.
+    Uncapped results are streamed through the BigQuery Storage Read API;
+    callers convert to Python objects only where they need them.
+    """
+    if local_mirror.can_serve(sql):
+        try:
+            return local_mirror.run_sql_arrow(sql, params, max_results)
+        except Exception as e:
+            LOCAL_MIRROR_QUERIES.labels(result="fallback").inc()
+            print(f"Local mirror query failed, falling back to BigQuery: {e}")
+
+    def fetch(job, timeout):
+        if max_results:
+            # A single REST page; the Storage API always reads the whole table
+            result = job.result(max_results=max_results, timeout=timeout)
+            table = result.to_arrow(create_bqstorage_client=False)
+        else:
+            result = job.result(timeout=timeout)
+            table = result.to_arrow(bqstorage_client=get_bqstorage_client())
+        return table, result.total_rows
 
-    job = client.query(sql, job_config=job_config)
-    rows = list(job.result(max_results=max_results))
-    cols = [schema.name for schema in job.result().schema]
-    data = [list(row) for row in rows]
-    return {"columns": cols, "rows": data}
+    return query_flight.do(query_key(sql, params, "arrow", max_results), _run_job, sql, params, fetch, "arrow")
 
 
 def log_sql_query_to_bq(query: str):
@@ -0,0 +1,141 @@
+import re
+from typing import Any, Dict, Optional, Tuple
+
+# --- BigQuery Standard SQL -> DuckDB translation ---
+# Covers the constructs used by queries/*.sql and typical LLM-generated
+# SELECTs. Scalar helpers that DuckDB lacks (SAFE_DIVIDE, FORMAT_DATETIME)
+# are installed as macros by install_macros() instead of being rewritten.
+
+DUCKDB_MACROS = [
+    "CREATE OR REPLACE MACRO SAFE_DIVIDE(a, b) AS CASE WHEN b = 0 THEN NULL ELSE a / b END",
+    "CREATE OR REPLACE MACRO FORMAT_DATETIME(fmt, ts) AS strftime(ts, fmt)",
+    "CREATE OR REPLACE MACRO FORMAT_TIMESTAMP(fmt, ts) AS strftime(ts, fmt)",
+    "CREATE OR REPLACE MACRO FORMAT_DATE(fmt, d) AS strftime(d, fmt)",
+    "CREATE OR REPLACE MACRO DATETIME(s) AS CAST(s AS TIMESTAMP)",
+]
+
+# Functions that DuckDB accepts as-is or that translate_sql() rewrites.
+# Anything else makes a query ineligible for local execution.
+SUPPORTED_FUNCTIONS = {
+    "COUNT", "COUNTIF", "SUM", "AVG", "MIN", "MAX", "ROUND", "COALESCE", "NULLIF",
+    "LOWER", "UPPER", "TRIM", "LENGTH", "CONCAT", "SUBSTR", "ABS", "CAST", "IFNULL",
+    "SAFE_DIVIDE", "FORMAT_DATETIME", "FORMAT_TIMESTAMP", "FORMAT_DATE", "DATE_TRUNC",
+    "ARRAY_AGG", "EXTRACT", "UNNEST",
+    "IN", "EXISTS", "OVER", "ROW_NUMBER", "RANK", "DENSE_RANK", "STARTS_WITH", "IF",
+    "DATE_DIFF", "TIMESTAMP_DIFF", "DATETIME",
+}
+
+_FQN_RE = re.compile(r"`([\w-]+)\.(\w+)\.(\w+)`")
+_DATE_TRUNC_RE = re.compile(r"DATE_TRUNC\(\s*([^,()]+?)\s*,\s*(\w+)\s*\)", re.IGNORECASE)
+_DIFF_RE = re.compile(r"(?:DATE|TIMESTAMP)_DIFF\(\s*([^,()]+?)\s*,\s*([^,()]+?)\s*,\s*(\w+)\s*\)", re.IGNORECASE)
+_ARRAY_AGG_IGNORE_NULLS_RE = re.compile(
+    r"ARRAY_AGG\(\s*(DISTINCT\s+)?([\w.]+)\s+IGNORE\s+NULLS\s*\)", re.IGNORECASE
+)
+_IN_UNNEST_RE = re.compile(r"\bIN\s+UNNEST\(\s*@(\w+)\s*\)", re.IGNORECASE)
+_PARAM_RE = re.compile(r"@(\w+)")
+_LOCAL_PARAM_RE = re.compile(r"\$(\w+)")
+_FUNCTION_CALL_RE = re.compile(r"\b([A-Za-z_][\w]*)\s*\(")
+_STRING_LITERAL_RE = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+
+
+def local_table_name(project: str, dataset: str, table: str) -> str:
+    """Name of the local copy of a BigQuery table (one schema per dataset)."""
+    return f"{dataset}.{table}"
+
+
+def _strip_literals(sql: str) -> str:
+    return _STRING_LITERAL_RE.sub("''", sql)
+
+
+def unsupported_functions(sql: str) -> set:
+    """Returns the function names in `sql` that have no local translation."""
+    names = {m.group(1).upper() for m in _FUNCTION_CALL_RE.finditer(_strip_literals(sql))}
+    # SQL keywords followed by "(" are not function calls
+    keywords = {
+        "AS", "AND", "OR", "NOT", "WHEN", "THEN", "ELSE", "SELECT", "FROM", "WHERE", "ON", "BY",
+        "WITH", "USING", "JOIN", "VALUES", "UNION", "ALL", "FILTER", "PARTITION", "DISTINCT",
+    }
+    return {n for n in names if n not in SUPPORTED_FUNCTIONS and n not in keywords}
+
+
+def _translate_code(code: str) -> str:
+    out = _FQN_RE.sub(lambda m: local_table_name(m.group(1), m.group(2), m.group(3)), code)
+    out = _DATE_TRUNC_RE.sub(lambda m: f"date_trunc('{m.group(2).lower()}', {m.group(1)})", out)
+    out = _DIFF_RE.sub(lambda m: f"date_diff('{m.group(3).lower()}', {m.group(2)}, {m.group(1)})", out)
+    out = _ARRAY_AGG_IGNORE_NULLS_RE.sub(
+        lambda m: f"ARRAY_AGG({m.group(1) or ''}{m.group(2)}) FILTER (WHERE {m.group(2)} IS NOT NULL)", out
+    )
+    out = re.sub(r"\bCOUNTIF\(", "count_if(", out, flags=re.IGNORECASE)
+    out = _IN_UNNEST_RE.sub(lambda m: f"IN (SELECT UNNEST(${m.group(1)}))", out)
+    return _PARAM_RE.sub(lambda m: f"${m.group(1)}", out)
+
+
+def _top_level_matches(pattern: re.Pattern, masked: str):
+    """Yields matches of `pattern` that sit outside any parentheses."""
+    depth_at = []
+    depth = 0
+    for ch in masked:
+        if ch == "(":
+            depth += 1
+        depth_at.append(depth)
+        if ch == ")":
+            depth -= 1
+    for m in pattern.finditer(masked):
+        if depth_at[m.start()] == 0:
+            yield m
+
+
+_LITERAL_OR_COMMENT_RE = re.compile(_STRING_LITERAL_RE.pattern + r"|--[^\n]*")
+_UNION_RE = re.compile(r"\bUNION\b", re.IGNORECASE)
+_ORDER_BY_RE = re.compile(r"\bORDER\s+BY\b", re.IGNORECASE)
+_SELECT_RE = re.compile(r"\bSELECT\b", re.IGNORECASE)
+
+
+def _wrap_ordered_union(sql: str) -> str:
+    """
+    DuckDB cannot ORDER BY an expression over a UNION unless the expression is
+    selected; BigQuery can. Wrap the union in a subquery so the ORDER BY applies
+    to named columns.
+    """
+    # Blank out literals and comments so their contents are never matched
+    masked = _LITERAL_OR_COMMENT_RE.sub(lambda m: " " * len(m.group(0)), sql)
+    unions = list(_top_level_matches(_UNION_RE, masked))
+    if not unions:
+        return sql
+    orders = [m for m in _top_level_matches(_ORDER_BY_RE, masked) if m.start() > unions[-1].start()]
+    selects = list(_top_level_matches(_SELECT_RE, masked))
+    if not orders or not selects:
+        return sql
+    body_start, order_start = selects[0].start(), orders[-1].start()
+    return f"{sql[:body_start]}SELECT * FROM ({sql[body_start:order_start]}) AS _union\n{sql[order_start:]}"
+
+
+def _single_quoted(literal: str) -> str:
+    """BigQuery allows "double-quoted" strings; DuckDB reads those as identifiers."""
+    if literal.startswith('"'):
+        return "'" + literal[1:-1].replace('\\"', '"').replace("'", "''") + "'"
+    return "'" + literal[1:-1].replace("\\'", "''") + "'"
+
+
+def translate_sql(sql: str, params: Optional[Dict[str, Any]] = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Rewrites a BigQuery query for DuckDB and converts its @params to $params.
+    Returns the translated SQL and the parameter dict DuckDB expects.
+    """
+    segments = []
+    last = 0
+    # Only rewrite code, never the contents of string literals
+    for literal in _STRING_LITERAL_RE.finditer(sql):
+        segments.append(_translate_code(sql[last:literal.start()]))
+        segments.append(_single_quoted(literal.group(0)))
+        last = literal.end()
+    segments.append(_translate_code(sql[last:]))
+    out = _wrap_ordered_union("".join(segments))
+    # BigQuery ignores unused parameters, DuckDB rejects them
+    used = set(_LOCAL_PARAM_RE.findall(out))
+    return out, {k: v for k, v in (params or {}).items() if k in used}
+
+
+def install_macros(connection) -> None:
+    for macro in DUCKDB_MACROS:
+        connection.execute(macro)
@@ -0,0 +1,113 @@
+import io
+import uuid
+import hashlib
+from types import SimpleNamespace
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from google.api_core import exceptions as api_exceptions
+
+# --- In-memory stand-in for google.cloud.storage ---
+# Implements the subset of the Bucket/Blob API used by the report generators,
+# for the offline benchmark and local runs without GCS credentials.
+
+# Resumable uploads take chunks in multiples of 256 KiB, as in GCS
+RESUMABLE_CHUNK_ALIGN = 256 * 1024
+
+_SESSION_PREFIX = "http://fake-gcs.local/upload/"
+# Open resumable sessions: url -> (blob, bytes received)
+_sessions: Dict[str, tuple] = {}
+
+
+class FakeUploadTransport:
+    """
+    Serves the resumable upload protocol for FakeBlob sessions (in place of
+    requests.Session): PUT with Content-Range stores a chunk (308) or, with
+    the total size, commits the object (200); DELETE cancels the session (499).
+    """
+
+    def put(self, url: str, data: bytes = b"", headers: Optional[Dict[str, str]] = None, timeout=None):
+        blob, received = _sessions[url]
+        sent, total = headers["Content-Range"].split(" ", 1)[1].split("/")
+        if total == "*" and len(data) % RESUMABLE_CHUNK_ALIGN:
+            return SimpleNamespace(status_code=400, text="Chunk size must be a multiple of 256 KiB.")
+        if sent != "*" and int(sent.split("-")[0]) != len(received):
+            return SimpleNamespace(status_code=400, text="Chunk does not continue the upload.")
+        received.extend(data)
+        blob.chunks_uploaded += 1
+        if total == "*":
+            return SimpleNamespace(status_code=308, text="")
+        del _sessions[url]
+        blob.bucket.objects[blob.name] = bytes(received)
+        blob.updated = datetime.now(timezone.utc)
+        return SimpleNamespace(status_code=200, text="")
+
+    def delete(self, url: str, timeout=None):
+        _sessions.pop(url, None)
+        return SimpleNamespace(status_code=499, text="")
+
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.content_type: Optional[str] = None
+        # Requests made by the resumable uploads of this blob
+        self.chunks_uploaded = 0
+        self.updated = datetime.now(timezone.utc)
+
+    def upload_from_file(self, file_obj, content_type: Optional[str] = None, timeout: Optional[float] = None):
+        self.bucket.objects[self.name] = file_obj.read()
+        self.content_type = content_type
+
+    def upload_from_string(self, data, content_type: Optional[str] = None):
+        self.bucket.objects[self.name] = data.encode("utf-8") if isinstance(data, str) else bytes(data)
+        self.content_type = content_type
+
+    def create_resumable_upload_session(self, content_type: Optional[str] = None, **kwargs) -> str:
+        url = f"{_SESSION_PREFIX}{uuid.uuid4().hex}"
+        _sessions[url] = (self, bytearray())
+        self.content_type = content_type
+        return url
+
+    def open(self, mode: str = "rb", **kwargs):
+        if mode == "rb":
+            return io.BytesIO(self.bucket.objects[self.name])
+        raise ValueError(f"Unsupported mode {mode!r}.")
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None, **kwargs) -> bytes:
+        if self.name not in self.bucket.objects:
+            raise api_exceptions.NotFound(f"No such object: {self.name}")
+        data = self.bucket.objects[self.name]
+        # end is inclusive, as in GCS
+        return data[start or 0:None if end is None else end + 1]
+
+    def exists(self) -> bool:
+        return self.name in self.bucket.objects
+
+    @property
+    def size(self) -> Optional[int]:
+        data = self.bucket.objects.get(self.name)
+        return len(data) if data is not None else None
+
+    @property
+    def etag(self) -> Optional[str]:
+        data = self.bucket.objects.get(self.name)
+        return hashlib.md5(data).hexdigest() if data is not None else None
+
+    def generate_signed_url(self, version: str = "v4", expiration: timedelta = timedelta(minutes=5),
+                            method: str = "GET", **kwargs) -> str:
+        seconds = int(expiration.total_seconds())
+        return f"http://fake-gcs.local/{self.bucket.name}/{self.name}?X-Goog-Expires={seconds}"
+
+
+class FakeBucket:
+    def __init__(self, name: str = "fake-bucket"):
+        self.name = name
+        self.objects: Dict[str, bytes] = {}
+
+    def blob(self, name: str) -> FakeBlob:
+        return FakeBlob(self, name)
+
+    def get_blob(self, name: str, **kwargs) -> Optional[FakeBlob]:
+        return FakeBlob(self, name) if name in self.objects else None
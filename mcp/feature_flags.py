@@ -0,0 +1,19 @@
+import os
+
+# --- Full-path switch ---
+# FULL_PATH_ONLY=true turns off every feature that lets a request skip work,
+# take a cheaper path or be refused, so each request takes the full Gemini +
+# tool path that benchmarks and load tests measure:
+#   ANSWER_CACHE_ENABLED, PLAN_CACHE_ENABLED, PREFETCH_ENABLED,
+#   SINGLEFLIGHT_ENABLED, LOCAL_MIRROR_ENABLED, ROUTER_ENABLED,
+#   REPORT_DISPATCH_ENABLED, SQL_REPAIR_ENABLED, PROMPT_ASSEMBLY_ENABLED,
+#   RATE_LIMIT_ENABLED, and report reuse (REPORT_REUSE_SECONDS).
+# Only switches read through enabled() are covered; a new feature of this
+# kind has to read its own switch that way.
+
+FULL_PATH_ONLY = os.getenv("FULL_PATH_ONLY", "false").lower() == "true"
+
+
+def enabled(name: str, default: str = "true") -> bool:
+    """The on/off setting `name` from the environment; always off under FULL_PATH_ONLY."""
+    return not FULL_PATH_ONLY and os.getenv(name, default).lower() == "true"
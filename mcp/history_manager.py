@@ -0,0 +1,101 @@
+import os
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from result_shaping import estimate_tokens, CHARS_PER_TOKEN
+
+# --- Token-budgeted chat history ---
+# The transcript sent to Gemini is bounded by estimated tokens instead of a
+# message count. The newest message is always kept. Older messages that are
+# oversized (a 30-row table from an earlier answer, a pasted log) are clipped
+# first; then the newest turns are kept until the budget is reached and the
+# rest is folded into a one-paragraph summary (or dropped when summarizing
+# fails), so the input size stays bounded however long the conversation gets.
+
+# Estimated input tokens for the transcript (system prompt and tools not included)
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+# Older messages above this size are clipped before anything is dropped
+HISTORY_MAX_MESSAGE_TOKENS = int(os.getenv("HISTORY_MAX_MESSAGE_TOKENS", "800"))
+# Input cap for the summary call
+HISTORY_SUMMARY_INPUT_TOKENS = int(os.getenv("HISTORY_SUMMARY_INPUT_TOKENS", "6000"))
+HISTORY_SUMMARIZE = os.getenv("HISTORY_SUMMARIZE", "true").lower() == "true"
+
+SUMMARY_PROMPT = "Please provide a concise, one-paragraph summary of our conversation so far, focusing on key data points, markets, and unresolved questions. Start with 'Summary of previous conversation:'"
+
+Turn = Dict[str, Any]
+
+
+def _role(role: str) -> str:
+    return "user" if role == "user" else "model"
+
+
+def clip_text(text: str, max_tokens: int) -> str:
+    """Keeps the start and the end of an oversized message, with a marker for what was cut."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    keep = max_tokens * CHARS_PER_TOKEN
+    head, tail = text[: keep * 3 // 4], text[-(keep // 4):]
+    cut = estimate_tokens(text) - max_tokens
+    return f"{head}\n[... {cut} tokens of earlier output trimmed ...]\n{tail}"
+
+
+def build_history(messages: List[Any], summarize: Optional[Callable[[List[Turn]], str]] = None
+                  ) -> Tuple[List[Turn], str, Dict[str, int]]:
+    """
+    Returns the Gemini history, the last user message and stats
+    (input_tokens, clipped, summarized, dropped) for `messages`.
+    summarize(turns) produces the summary text for the turns that do not fit.
+    """
+    stats = {"input_tokens": 0, "clipped": 0, "summarized": 0, "dropped": 0}
+    user_query = next((m.content for m in reversed(messages) if m.role == "user"), "")
+    if not messages:
+        return [], user_query, stats
+
+    # 1. Clip oversized older messages; the newest one is what the user just asked
+    turns = []
+    for i, msg in enumerate(messages):
+        text = msg.content or ""
+        if i < len(messages) - 1:
+            clipped = clip_text(text, HISTORY_MAX_MESSAGE_TOKENS)
+            if clipped is not text:
+                stats["clipped"] += 1
+            text = clipped
+        turns.append({"role": _role(msg.role), "parts": [text]})
+
+    # 2. Newest turns first until the budget is used up
+    used = estimate_tokens(turns[-1]["parts"][0])
+    first_kept = len(turns) - 1
+    while first_kept > 0:
+        size = estimate_tokens(turns[first_kept - 1]["parts"][0])
+        if used + size > HISTORY_TOKEN_BUDGET:
+            break
+        used += size
+        first_kept -= 1
+    kept, overflow = turns[first_kept:], turns[:first_kept]
+
+    # 3. Fold what did not fit into a summary
+    history = []
+    if overflow:
+        summary_text = None
+        if HISTORY_SUMMARIZE and summarize:
+            summary_input, budget = [], HISTORY_SUMMARY_INPUT_TOKENS
+            for turn in reversed(overflow):
+                size = estimate_tokens(turn["parts"][0])
+                if size > budget:
+                    break
+                summary_input.insert(0, turn)
+                budget -= size
+            try:
+                summary_text = summarize(summary_input + [{"role": "user", "parts": [SUMMARY_PROMPT]}])
+            except Exception as e:
+                print(f"History summarization failed, dropping {len(overflow)} older messages: {e}")
+        if summary_text:
+            summary_message = {"role": "user", "parts": [f"<system_summary>{summary_text}</system_summary>"]}
+            history.append(summary_message)
+            used += estimate_tokens(summary_message["parts"][0])
+            stats["summarized"] = len(overflow)
+        else:
+            stats["dropped"] = len(overflow)
+
+    history.extend(kept)
+    stats["input_tokens"] = used
+    return history, user_query, stats
@@ -0,0 +1,226 @@
+import threading
+from typing import Any, Dict, List, Optional
+
+import duckdb
+import pyarrow as pa
+
+from bq_dialect import translate_sql, install_macros
+
+# --- Local BigQuery stand-in backed by DuckDB ---
+# Tables live in one DuckDB schema per BigQuery dataset (gost_bq.<table>), so
+# queries written against `gostlm.gost_bq.<table>` run after translate_sql().
+
+DEFAULT_MARKETS = [
+    "Italy", "Germany", "Spain", "Portugal", "Netherlands", "Romania",
+    "Czech Republic", "Greece", "Ireland", "Albania", "Turkey", "GIS",
+]
+
+SEVERITY_SLA_DAYS = {"Critical": 14, "High": 30, "Medium": 45, "Low": 60, "Info": 270}
+
+# Synthetic vulnerabilities_master with the columns our queries use
+_SYNTHETIC_MASTER_SQL = """
+CREATE OR REPLACE TABLE gost_bq.vulnerabilities_master AS
+WITH base AS (
+    SELECT
+        i,
+        random() AS r_sev, random() AS r_state, random() AS r_sub, random() AS r_market,
+        random() AS r_service, random() AS r_type, random() AS r_pub, random() AS r_open
+    FROM range($rows) t(i)
+),
+shaped AS (
+    SELECT
+        i,
+        ['Critical', 'High', 'Medium', 'Low', 'Info'][1 + floor(r_sev * 5)::INT] AS severity,
+        CASE
+            WHEN r_state < 0.45 THEN 'Closed'
+            WHEN r_state < 0.55 THEN 'Parked'
+            WHEN r_state < 0.65 THEN 'New'
+            WHEN r_state < 0.85 THEN 'Open'
+            ELSE 'Validating'
+        END AS state,
+        r_sub, r_market, r_service, r_type, r_pub, r_open
+    FROM base
+)
+SELECT
+    'VULN-' || lpad(i::VARCHAR, 8, '0') AS id,
+    'Synthetic finding #' || i || ' affecting a customer facing component' AS description,
+    severity,
+    state,
+    CASE
+        WHEN state = 'Validating' THEN ['Waiting to Retest', 'Unable to Retest', 'Retesting'][1 + floor(r_sub * 3)::INT]
+        WHEN state = 'Open' AND r_sub < 0.1 THEN 'Pending Park Approval'
+        ELSE ''
+    END AS sub_state,
+    $markets[1 + floor(r_market * len($markets))::INT] AS market,
+    ['White Box', 'Black Box', 'Adversary Simulation'][1 + floor(r_service * 3)::INT] AS service,
+    ['XSS', 'SQL Injection', 'Broken Access Control', 'Misconfiguration', 'Outdated Component',
+     'Weak Cryptography', 'Information Disclosure', 'SSRF', 'CSRF', 'Authentication'][1 + floor(r_type * 10)::INT] AS vuln_type,
+    'asset-' || (i % 250) AS asset_name,
+    TIMESTAMP '2025-01-01 00:00:00' + to_days(floor(r_pub * 300)::INT) AS published_at,
+    CASE severity WHEN 'Critical' THEN 14 WHEN 'High' THEN 30 WHEN 'Medium' THEN 45 WHEN 'Low' THEN 60 ELSE 270 END AS time_to_solve_days,
+    round(r_open * 120, 2) AS total_open_days,
+    round(r_open * 120, 2) > CASE severity WHEN 'Critical' THEN 14 WHEN 'High' THEN 30 WHEN 'Medium' THEN 45 WHEN 'Low' THEN 60 ELSE 270 END AS is_overdue,
+    'https://vulns.example.com/' || i AS vuln_url,
+    'Summary of finding ' || i AS details_summary,
+    TIMESTAMP '2025-06-01 09:30:00' + to_days((i % 90)::INT) AS last_comment_at,
+    'analyst' || (i % 7) AS last_comment_by,
+    'Waiting for the asset owner to deploy the fix.' AS last_comment,
+    'Apply remediation pattern ' || (i % 25) || ' and validate input on the server side.' AS recommendations
+FROM shaped
+"""
+
+# Derived tables that BigQuery maintains as scheduled views/tables
+_SYNTHETIC_DERIVED_SQL = [
+    "CREATE OR REPLACE VIEW gost_bq.vulnerabilities_light AS SELECT * FROM gost_bq.vulnerabilities_master",
+    "CREATE OR REPLACE VIEW gost_bq.state_closed AS SELECT * FROM gost_bq.vulnerabilities_master WHERE state = 'Closed'",
+    "CREATE OR REPLACE VIEW gost_bq.state_open AS SELECT * FROM gost_bq.vulnerabilities_master WHERE state IN ('Open', 'New')",
+    "CREATE OR REPLACE VIEW gost_bq.state_parked AS SELECT * FROM gost_bq.vulnerabilities_master WHERE state = 'Parked'",
+    "CREATE OR REPLACE VIEW gost_bq.state_validating AS SELECT * FROM gost_bq.vulnerabilities_master WHERE state = 'Validating'",
+    """
+    CREATE OR REPLACE VIEW gost_bq.global_severity_state_service AS
+    SELECT severity, state, service, COUNT(*) AS vulnerability_count
+    FROM gost_bq.vulnerabilities_master GROUP BY ALL
+    """,
+    """
+    CREATE OR REPLACE VIEW gost_bq.markets_severity_state_service AS
+    SELECT market, severity, state, service, COUNT(*) AS vulnerability_count
+    FROM gost_bq.vulnerabilities_master GROUP BY ALL
+    """,
+    """
+    CREATE OR REPLACE VIEW gost_bq.vulnerabilities_time_to_overdue AS
+    SELECT id, market, severity, state, time_to_solve_days, total_open_days,
+           time_to_solve_days - total_open_days AS remaining_days_before_overdue
+    FROM gost_bq.vulnerabilities_master
+    WHERE state IN ('New', 'Open', 'Validating') AND NOT is_overdue
+    ORDER BY market, remaining_days_before_overdue
+    """,
+    """
+    CREATE OR REPLACE VIEW gost_bq._risk_base AS
+    SELECT market,
+           CASE WHEN severity IN ('Critical', 'High') THEN 'High' ELSE 'Low' END AS kpi_category,
+           CASE WHEN time_to_solve_days > 0 THEN total_open_days / time_to_solve_days END AS individual_risk_score
+    FROM gost_bq.vulnerabilities_master
+    WHERE state NOT IN ('Closed', 'Parked')
+    """,
+    """
+    CREATE OR REPLACE VIEW gost_bq.global_current_risk_summary AS
+    SELECT kpi_category, COUNT(*) AS total_active_vulnerabilities, ROUND(AVG(individual_risk_score), 2) AS average_risk_score
+    FROM gost_bq._risk_base GROUP BY kpi_category
+    UNION ALL
+    SELECT 'Total', COUNT(*), ROUND(AVG(individual_risk_score), 2) FROM gost_bq._risk_base
+    """,
+    """
+    CREATE OR REPLACE VIEW gost_bq.market_current_risk_summary AS
+    SELECT market, kpi_category, COUNT(*) AS total_active_vulnerabilities, ROUND(AVG(individual_risk_score), 2) AS average_risk_score
+    FROM gost_bq._risk_base GROUP BY market, kpi_category
+    UNION ALL
+    SELECT market, 'Total', COUNT(*), ROUND(AVG(individual_risk_score), 2) FROM gost_bq._risk_base GROUP BY market
+    """,
+    """
+    CREATE OR REPLACE VIEW gost_bq._kpi_base AS
+    SELECT market,
+           CASE WHEN severity IN ('Critical', 'High') THEN 'High' ELSE 'Low' END AS kpi_category,
+           CASE WHEN severity IN ('Critical', 'High') THEN 0.9 ELSE 0.8 END::DOUBLE AS kpi_goal_percentage,
+           state IN ('Closed', 'Parked') AND NOT is_overdue AS on_time_resolved,
+           state NOT IN ('Closed', 'Parked') AND NOT is_overdue AS still_in_play,
+           state NOT IN ('Closed', 'Parked') AND is_overdue AS overdue_open,
+           state IN ('Closed', 'Parked') AND is_overdue AS overdue_closed_parked
+    FROM gost_bq.vulnerabilities_master
+    """,
+]
+
+_KPI_SELECT = """
+    COUNT(*) AS total_vulnerabilities,
+    count_if(on_time_resolved) AS on_time_resolved_count,
+    count_if(still_in_play) AS still_in_play_count,
+    count_if(overdue_open) AS overdue_open_count,
+    ANY_VALUE(kpi_goal_percentage) AS kpi_goal_percentage,
+    count_if(on_time_resolved) / COUNT(*) AS kpi_actual_percentage,
+    CASE WHEN count_if(on_time_resolved) / COUNT(*) >= ANY_VALUE(kpi_goal_percentage) THEN 'Achieved' ELSE 'Not Achieved' END AS kpi_status,
+    count_if(still_in_play) / COUNT(*) AS still_in_play_percentage,
+    count_if(overdue_open) / COUNT(*) AS overdue_open_percentage,
+    count_if(overdue_closed_parked) / COUNT(*) AS overdue_closed_parked_percentage,
+    CASE WHEN (count_if(on_time_resolved) + count_if(still_in_play)) / COUNT(*) >= ANY_VALUE(kpi_goal_percentage)
+         THEN 'Reachable' ELSE 'Unreachable' END AS is_kpi_reachable
+"""
+
+_SYNTHETIC_DERIVED_SQL += [
+    f"CREATE OR REPLACE VIEW gost_bq.global_kpi_summary AS SELECT kpi_category, {_KPI_SELECT} FROM gost_bq._kpi_base GROUP BY kpi_category",
+    f"CREATE OR REPLACE VIEW gost_bq.market_kpi_summary AS SELECT market, kpi_category, {_KPI_SELECT} FROM gost_bq._kpi_base GROUP BY market, kpi_category",
+    "CREATE OR REPLACE TABLE gost_bq.update_history AS SELECT TIMESTAMP '2025-10-30 06:00:00' AS update_time",
+]
+
+
+def _bigquery_integer_types(table):
+    """DuckDB returns COUNT_IF/SUM over integers as HUGEINT (decimal128(38, 0)); BigQuery returns INT64."""
+    for i, field in enumerate(table.schema):
+        if pa.types.is_decimal(field.type) and field.type.scale == 0:
+            table = table.set_column(i, field.name, table.column(i).cast(pa.int64()))
+    return table
+
+
+class LocalBigQuery:
+    """
+    DuckDB database that answers BigQuery-dialect queries with the same
+    result shape as bigquery_client.run_sql.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.connection = duckdb.connect(path)
+        self._lock = threading.Lock()
+        install_macros(self.connection)
+        self.connection.execute("CREATE SCHEMA IF NOT EXISTS gost_bq")
+
+    def load_synthetic(self, rows: int = 50000, markets: Optional[List[str]] = None, seed: float = 0.42):
+        """Fills the dataset with `rows` synthetic vulnerabilities and the derived tables."""
+        with self._lock:
+            self.connection.execute("SELECT setseed(?)", [seed])
+            self.connection.execute(_SYNTHETIC_MASTER_SQL, {"rows": rows, "markets": markets or DEFAULT_MARKETS})
+            for statement in _SYNTHETIC_DERIVED_SQL:
+                self.connection.execute(statement)
+
+    def replace_tables(self, tables: Dict[str, Any]):
+        """
+        Atomically replaces local tables with the given Arrow tables, keyed by
+        local name (e.g. "gost_bq.vulnerabilities_master"). Readers see either
+        the old or the new snapshot, never a mix.
+        """
+        with self._lock:
+            self.connection.execute("BEGIN TRANSACTION")
+            try:
+                for name, arrow_table in tables.items():
+                    self.connection.register("_incoming", arrow_table)
+                    self.connection.execute(f"CREATE OR REPLACE TABLE {name} AS SELECT * FROM _incoming")
+                    self.connection.unregister("_incoming")
+                self.connection.execute("COMMIT")
+            except Exception:
+                self.connection.execute("ROLLBACK")
+                raise
+
+    def run_sql(self, sql: str, params: Optional[Dict[str, Any]] = None, max_results: int = 100):
+        """Drop-in replacement for bigquery_client.run_sql."""
+        local_sql, local_params = translate_sql(sql, params)
+        # One cursor per call: DuckDB cursors are safe to use from worker threads
+        with self._lock:
+            cursor = self.connection.cursor()
+        try:
+            cursor.execute(local_sql, local_params or None)
+            cols = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+        data = [list(row) for row in rows[:max_results]]
+        return {"columns": cols, "rows": data, "total_rows": len(rows)}
+
+    def run_sql_arrow(self, sql: str, params: Optional[Dict[str, Any]] = None, max_results: Optional[int] = None):
+        """Drop-in replacement for bigquery_client.run_sql_arrow."""
+        local_sql, local_params = translate_sql(sql, params)
+        with self._lock:
+            cursor = self.connection.cursor()
+        try:
+            cursor.execute(local_sql, local_params or None)
+            table = cursor.to_arrow_table()
+        finally:
+            cursor.close()
+        table = _bigquery_integer_types(table)
+        return table.slice(0, max_results) if max_results else table
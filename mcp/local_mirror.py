@@ -0,0 +1,116 @@
+import os
+import re
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+from bq_dialect import local_table_name, unsupported_functions
+from local_bq import LocalBigQuery
+from feature_flags import enabled
+from metrics import LOCAL_MIRROR_QUERIES, LOCAL_MIRROR_LATENCY, LOCAL_MIRROR_SYNCS
+from tracing import tracer
+
+# --- Local DuckDB mirror of gost_bq ---
+# A snapshot of the report tables is copied from BigQuery whenever
+# update_history advances. Eligible SELECTs are answered locally in
+# milliseconds; everything else (and any local failure) goes to BigQuery.
+
+LOCAL_MIRROR_ENABLED = enabled("LOCAL_MIRROR_ENABLED", "false")
+LOCAL_MIRROR_PATH = os.getenv("LOCAL_MIRROR_PATH", "/opt/vulnai/mcp/gost_bq_mirror.duckdb")
+# How often update_history is polled for a new load
+LOCAL_MIRROR_SYNC_SECONDS = int(os.getenv("LOCAL_MIRROR_SYNC_SECONDS", "300"))
+
+_FQN_RE = re.compile(r"`([\w-]+)\.(\w+)\.(\w+)`")
+_READ_ONLY_RE = re.compile(r"^\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+
+class LocalMirror:
+    def __init__(self, tables: List[str], version_table: str, path: str = LOCAL_MIRROR_PATH):
+        self.tables = set(tables) | {version_table}
+        self.version_table = version_table
+        self.path = path
+        self.local: Optional[LocalBigQuery] = None
+        self.version = None
+        self._sync_lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.local is not None and self.version is not None
+
+    def can_serve(self, sql: str) -> bool:
+        """True when every table is mirrored and every function has a local translation."""
+        if not self.ready or not _READ_ONLY_RE.match(sql):
+            return False
+        referenced = {".".join(m.groups()) for m in _FQN_RE.finditer(sql)}
+        if not referenced or not referenced <= self.tables:
+            return False
+        return not unsupported_functions(sql)
+
+    def run_sql(self, sql: str, params: Optional[Dict[str, Any]] = None, max_results: int = 100):
+        start = time.perf_counter()
+        with tracer.start_as_current_span("local_mirror.query") as span:
+            span.set_attribute("db.statement", sql[:2000])
+            result = self.local.run_sql(sql, params, max_results)
+            span.set_attribute("local.total_rows", result["total_rows"])
+        LOCAL_MIRROR_LATENCY.observe(time.perf_counter() - start)
+        LOCAL_MIRROR_QUERIES.labels(result="local").inc()
+        return result
+
+    def run_sql_arrow(self, sql: str, params: Optional[Dict[str, Any]] = None, max_results: Optional[int] = None):
+        start = time.perf_counter()
+        with tracer.start_as_current_span("local_mirror.query") as span:
+            span.set_attribute("db.statement", sql[:2000])
+            table = self.local.run_sql_arrow(sql, params, max_results)
+            span.set_attribute("local.total_rows", table.num_rows)
+        LOCAL_MIRROR_LATENCY.observe(time.perf_counter() - start)
+        LOCAL_MIRROR_QUERIES.labels(result="local").inc()
+        return table
+
+    def _open(self):
+        if self.local is None:
+            self.local = LocalBigQuery(self.path)
+            # A mirror file from a previous run is served until the first sync
+            try:
+                self.version = self._local_version()
+            except Exception:
+                self.version = None
+
+    def _local_version(self):
+        name = local_table_name(*self.version_table.split("."))
+        row = self.local.connection.execute(f"SELECT MAX(update_time) FROM {name}").fetchone()
+        return row[0] if row else None
+
+    def sync(self, bq_client, bqstorage_client=None) -> bool:
+        """Copies the mirrored tables when BigQuery has a newer update_time. Returns True if it did."""
+        with self._sync_lock:
+            self._open()
+            row = list(bq_client.query(f"SELECT MAX(update_time) AS v FROM `{self.version_table}`").result())
+            remote_version = row[0]["v"] if row else None
+            if remote_version is None or remote_version == self.version:
+                return False
+
+            start = time.perf_counter()
+            snapshot = {}
+            for fqn in sorted(self.tables):
+                snapshot[local_table_name(*fqn.split("."))] = bq_client.query(f"SELECT * FROM `{fqn}`").to_arrow(
+                    bqstorage_client=bqstorage_client
+                )
+            self.local.replace_tables(snapshot)
+            self.version = remote_version
+            print(f"Local mirror synced to {remote_version} ({len(snapshot)} tables, {time.perf_counter() - start:.1f}s).")
+            return True
+
+    def start(self, client_factory: Callable[[], Any], bqstorage_factory: Optional[Callable[[], Any]] = None):
+        """Runs sync() now and then every LOCAL_MIRROR_SYNC_SECONDS in a daemon thread."""
+        def _loop():
+            while True:
+                try:
+                    with tracer.start_as_current_span("local_mirror.sync"):
+                        synced = self.sync(client_factory(), bqstorage_factory() if bqstorage_factory else None)
+                    LOCAL_MIRROR_SYNCS.labels(status="synced" if synced else "unchanged").inc()
+                except Exception as e:
+                    LOCAL_MIRROR_SYNCS.labels(status="error").inc()
+                    print(f"Local mirror sync failed: {e}")
+                time.sleep(LOCAL_MIRROR_SYNC_SECONDS)
+
+        threading.Thread(target=_loop, name="local-mirror-sync", daemon=True).start()
@@ -0,0 +1,100 @@
+from typing import Any, Dict, Optional
+
+from bigquery_client import run_sql
+from tracing import submit_with_context
+from scheduler import scheduler
+from resilience import report_query, collect_sections, remaining, REPORT_DATA_DEADLINE_SECONDS
+from market_resolver import resolve_markets
+from query_registry import registry
+from risk_layer import risk_layer
+
+# --- Market overview tool ---
+# A "complete overview" used to be five or more run_sql calls, each with its
+# own model round trip. market_overview runs every section concurrently with
+# the report templates (queries/scoped) and the precomputed top-K lists, and
+# returns one compact payload, so the model needs a single tool turn.
+
+# Overview section -> scoped query template
+OVERVIEW_QUERIES = {
+    "vulnerability_state": "VULNS_STATE_COUNT",
+    "open_by_severity": "COUNT_TOT_VULNS_SEVERITY_OPEN",
+    "overdue": "OVERDUE_COUNT",
+    "kpi_high": "KPI_SUMMARY_HIGH",
+    "kpi_low": "KPI_SUMMARY_LOW",
+    "current_risk": "CURRENT_RISK",
+}
+OVERVIEW_TOP_K = 5
+
+
+def _single_row(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A one-row result as {column: value} (the transposed form the prompt asks for)."""
+    if not result or not result["rows"]:
+        return None
+    return dict(zip(result["columns"], result["rows"][0]))
+
+
+def _pairs(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A two-column (label, value) result as {label: value}."""
+    if not result:
+        return None
+    return {row[0]: row[1] for row in result["rows"]}
+
+
+def _table(result: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if not result:
+        return None
+    return {"columns": result["columns"], "rows": result["rows"]}
+
+
+def market_overview(market: str = "global") -> Dict[str, Any]:
+    """
+    Tool entry point: vulnerability states, open vulnerabilities per severity,
+    overdue split, KPI summary, current risk and the top 5 closest to overdue
+    and open longest for 'global' or a market (set), in one call.
+    """
+    is_global = not market or market.lower() == "global"
+    markets = None if is_global else resolve_markets(market)
+    scope_values = {} if is_global else {"markets": markets}
+    queries = registry.for_scope("global" if is_global else "market")
+
+    executor = scheduler.interactive_query_executor
+    futures = {}
+    for section, query_name in OVERVIEW_QUERIES.items():
+        query = queries[query_name]
+        futures[submit_with_context(
+            executor, report_query, f"overview.{section}", run_sql, query.sql, params=query.params(**scope_values)
+        )] = section
+    futures[submit_with_context(executor, run_sql, registry.get("LAST_UPDATE").sql)] = "last_update"
+    for index in ("closest_to_overdue", "open_longest"):
+        futures[submit_with_context(
+            executor, risk_layer.top_k, index, markets=markets, limit=OVERVIEW_TOP_K
+        )] = f"top_{index}"
+
+    left = remaining()
+    timeout = REPORT_DATA_DEADLINE_SECONDS if left is None else min(REPORT_DATA_DEADLINE_SECONDS, left)
+    results, missing = collect_sections(futures, timeout)
+    if len(missing) == len(futures):
+        raise Exception("Overview data unavailable: every section failed.")
+
+    last_update = results.get("last_update")
+    sections: Dict[str, Any] = {
+        "vulnerability_state": _pairs(results.get("vulnerability_state")),
+        "open_by_severity": _single_row(results.get("open_by_severity")),
+        # is_overdue -> count, all states
+        "overdue": _pairs(results.get("overdue")),
+        "kpi_summary": {
+            "High": _single_row(results.get("kpi_high")),
+            "Low": _single_row(results.get("kpi_low")),
+        },
+        "current_risk": _table(results.get("current_risk")),
+        "top_closest_to_overdue": results.get("top_closest_to_overdue"),
+        "top_open_longest": results.get("top_open_longest"),
+    }
+    overview: Dict[str, Any] = {
+        "scope": "global" if is_global else ", ".join(markets),
+        "last_update": str(last_update["rows"][0][0]) if last_update and last_update["rows"] else None,
+        "sections": sections,
+    }
+    if missing:
+        overview["missing_sections"] = missing
+    return overview
@@ -0,0 +1,122 @@
+import os
+import re
+import time
+import threading
+from difflib import get_close_matches
+from typing import Dict, List
+
+from bigquery_client import run_sql, BG_MASTER_TABLE
+
+# --- Market name resolution ---
+# User input ("italy", "vodafone it", "gis") is resolved once against the
+# canonical market names found in the data, so queries can filter with
+# `market IN UNNEST(@markets)` instead of LOWER(market) LIKE '%...%'.
+
+# Seconds before the canonical market list is reloaded from the data
+MARKET_INDEX_TTL_SECONDS = int(os.getenv("MARKET_INDEX_TTL_SECONDS", "900"))
+# Extra names, e.g. "opco it=Italy;uk=United Kingdom;south=Italy|Spain|Portugal"
+MARKET_ALIASES = os.getenv("MARKET_ALIASES", "")
+# Minimum similarity (0-1) for a fuzzy match on a misspelled market
+MARKET_FUZZY_CUTOFF = float(os.getenv("MARKET_FUZZY_CUTOFF", "0.8"))
+
+_MARKETS_SQL = f"SELECT DISTINCT market FROM `{BG_MASTER_TABLE}` WHERE market IS NOT NULL ORDER BY market"
+
+
+class MarketResolutionError(ValueError):
+    """Raised when user input matches no market, or more than one."""
+
+
+def _normalize(name: str) -> str:
+    return " ".join(re.sub(r"[^\w]+", " ", name.lower()).split())
+
+
+def _parse_aliases(spec: str) -> Dict[str, List[str]]:
+    aliases = {}
+    for entry in spec.split(";"):
+        if "=" not in entry:
+            continue
+        alias, targets = entry.split("=", 1)
+        names = [t.strip() for t in targets.split("|") if t.strip()]
+        if alias.strip() and names:
+            aliases[_normalize(alias)] = names
+    return aliases
+
+
+class MarketIndex:
+    def __init__(self):
+        self.markets: List[str] = []
+        self._by_normalized: Dict[str, str] = {}
+        self._aliases = _parse_aliases(MARKET_ALIASES)
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        with self._lock:
+            if self.markets and time.time() - self._loaded_at < MARKET_INDEX_TTL_SECONDS:
+                return
+            result = run_sql(_MARKETS_SQL, max_results=10000)
+            self.markets = [row[0] for row in result["rows"]]
+            self._by_normalized = {_normalize(m): m for m in self.markets}
+            self._loaded_at = time.time()
+
+    def known_markets(self) -> List[str]:
+        self._refresh()
+        return list(self.markets)
+
+    def mentioned_in(self, text: str) -> List[str]:
+        """Canonical markets named as whole words in free text (aliases included)."""
+        self._refresh()
+        words = f" {_normalize(text)} "
+        named = [n for n in self._by_normalized if f" {n} " in words]
+        # "vodafone italy" names one market even if "italy" is a market too
+        named = [n for n in named if not any(n != other and f" {n} " in f" {other} " for other in named)]
+        found = [self._by_normalized[n] for n in named]
+        for alias, names in self._aliases.items():
+            if f" {alias} " in words:
+                found.extend(self._by_normalized.get(_normalize(n), n) for n in names)
+        return list(dict.fromkeys(found))
+
+    def resolve(self, user_input: str) -> List[str]:
+        """Returns the canonical market name(s) for `user_input`."""
+        self._refresh()
+        key = _normalize(user_input)
+        if not key:
+            raise MarketResolutionError("No market given.")
+
+        # 1. Exact name (case and punctuation insensitive)
+        if key in self._by_normalized:
+            return [self._by_normalized[key]]
+
+        # 2. Configured alias, possibly a group of markets
+        if key in self._aliases:
+            return [self._by_normalized.get(_normalize(n), n) for n in self._aliases[key]]
+
+        # 3. Whole-word containment ("vodafone italy" -> "Italy", "ita" is not enough)
+        words = f" {key} "
+        contained = [m for n, m in self._by_normalized.items() if f" {n} " in words or f" {key} " in f" {n} "]
+        if len(contained) == 1:
+            return contained
+        if len(contained) > 1:
+            raise MarketResolutionError(
+                f"'{user_input}' matches several markets: {', '.join(sorted(contained))}. Ask the user which one."
+            )
+
+        # 4. Fuzzy match for typos ("itlay")
+        close = get_close_matches(key, list(self._by_normalized), n=2, cutoff=MARKET_FUZZY_CUTOFF)
+        if len(close) == 1:
+            return [self._by_normalized[close[0]]]
+        if len(close) > 1:
+            raise MarketResolutionError(
+                f"'{user_input}' is ambiguous: {', '.join(self._by_normalized[c] for c in close)}. Ask the user which one."
+            )
+
+        raise MarketResolutionError(
+            f"Unknown market '{user_input}'. Known markets: {', '.join(self.markets)}."
+        )
+
+
+market_index = MarketIndex()
+
+
+def resolve_markets(user_input: str) -> List[str]:
+    return market_index.resolve(user_input)
@@ -4,21 +4,42 @@ import json
 import uuid
 import time
 from typing import Any, Dict, List, Optional
-from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Request, HTTPException, BackgroundTasks, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 from dotenv import load_dotenv
 import google.generativeai as genai
-from datetime import datetime, date
+from opentelemetry import trace
 
 from secret_manager import get_secret
 from bigquery_client import (
     list_tables, get_table_schema, run_sql,
-    log_sql_query_to_bq, log_audit_event_to_bq,
+    log_sql_query_to_bq, log_audit_event_to_bq, start_local_mirror,
     BG_VULNERABILITIES_TABLE, BG_MARKET_KPI_SUMMARY,
     BG_MARKET_SEVERITY_STATE_TABLE
 )
-from adk_tooling import configure_gemini, get_model, AVAILABLE_TOOLS
+from adk_tooling import configure_gemini, get_model, get_fast_model, get_model_for_prompt, AVAILABLE_TOOLS
+from prompt_assembler import prompt_assembler, guide_tables, PROMPT_ASSEMBLY_ENABLED
+from sql_repair import sql_repairer
+from result_shaping import json_serial
+from report_storage import report_store, parse_range, etag_matches
+import report_generator
+from model_router import classify
+from report_dispatch import report_dispatcher, match_report_request, is_status_question, REPORT_DISPATCH_WAIT_SECONDS
+from prefetch import prefetcher
+from answer_cache import answer_cache
+from plan_cache import plan_cache
+from history_manager import build_history
+from market_resolver import market_index
+from tool_encoding import encode_tool_result
+from tracing import tracer, setup_tracing
+from scheduler import scheduler, user_key, Overloaded
+from resilience import deadline, tool_timeout
+from metrics import (
+    CHAT_REQUESTS, CHAT_LATENCY, CHAT_INPUT_TOKENS, SYSTEM_PROMPT_TOKENS, CHAT_ROUTES, CHAT_ROUTE_LATENCY, TOOL_LOOP_ITERATIONS, GEMINI_LATENCY,
+    TOOL_CALLS, TOOL_LATENCY, TOOL_RESULT_TOKENS, REPORT_DOWNLOADS, scope_for_tool, tool_labels, render_metrics
+)
 
 load_dotenv("/opt/vulnai/mcp/mcp.env")
 
@@ -30,6 +51,8 @@ SECRET_ID = os.getenv("GEMINI_SECRET_ID", "gemini_api_key")
 # Configure Gemini from Secret Manager at startup
 GEMINI_API_KEY = None
 MODEL: genai.GenerativeModel = None
+# Lighter model with a trimmed prompt for simple lookups and report requests
+FAST_MODEL: genai.GenerativeModel = None
 TOOL_MAP: Dict[str, callable] = {}
 
 # Define your server's public-facing URL
@@ -50,6 +73,7 @@ class ChatRequest(BaseModel):
     stream: Optional[bool] = False
     temperature: Optional[float] = 0.0
     max_tokens: Optional[int] = 65536
+    user: Optional[str] = None
 
 
 class Choice(BaseModel):
@@ -101,16 +125,11 @@ def get_function_call(response: Any) -> Optional[Any]:
     return None
 
 
-def json_serial(obj):
-    """JSON serializer for objects not serializable by default json code"""
-    if isinstance(obj, (datetime, date)):
-        return obj.isoformat()
-    raise TypeError(f"Type {type(obj)} not serializable")
-
-
 @app.on_event("startup")
 def on_startup():
-    global GEMINI_API_KEY, MODEL, TOOL_MAP
+    global GEMINI_API_KEY, MODEL, FAST_MODEL, TOOL_MAP
+    setup_tracing()
+    start_local_mirror()
     GEMINI_API_KEY = get_secret(PROJECT_ID, SECRET_ID, "latest")
     configure_gemini(GEMINI_API_KEY)
 
@@ -131,7 +150,26 @@ def on_startup():
         print(f"CRITICAL: Failed to preload schemas: {e}")
         schema_info_str = ""
 
-    MODEL = get_model(preloaded_schemas=schema_info_str)
+    try:
+        known_markets = ", ".join(market_index.known_markets())
+    except Exception as e:
+        print(f"Failed to load known markets: {e}")
+        known_markets = ""
+
+    # The assembled prompts pick their schemas per question and SQL repair
+    # matches column names against them, so every guide table is preloaded
+    guide_schemas = {schema["table"]: schema for schema in preloaded_schemas.values()}
+    for table_fqn in guide_tables():
+        if table_fqn not in guide_schemas:
+            try:
+                guide_schemas[table_fqn] = get_table_schema(table_fqn)
+            except Exception as e:
+                print(f"Schema of {table_fqn} not preloaded: {e}")
+    prompt_assembler.configure(guide_schemas, known_markets)
+    sql_repairer.configure(guide_schemas)
+
+    MODEL = get_model(preloaded_schemas=schema_info_str, known_markets=known_markets)
+    FAST_MODEL = get_fast_model(preloaded_schemas=schema_info_str, known_markets=known_markets)
     TOOL_MAP = AVAILABLE_TOOLS
 
     # --- summary model block ---
@@ -148,121 +186,317 @@ def healthz():
     return {"status": "We're cool!"}
 
 
+@app.get("/metrics")
+def metrics():
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
+
+@app.api_route("/v1/reports/{report_id}", methods=["GET", "HEAD"])
+def download_report(report_id: str, request: Request, expires: int = 0, token: str = ""):
+    """
+    Streams a stored report PDF for a link made by report_store.link().
+    Supports conditional requests (ETag) and single byte ranges.
+    """
+    if not report_store.verify(report_id, expires, token):
+        REPORT_DOWNLOADS.labels(result="forbidden").inc()
+        raise HTTPException(status_code=403, detail="This report link is invalid or has expired.")
+
+    # Both report generators write to the same bucket
+    bucket = report_generator.gcs_bucket
+    try:
+        stored = report_store.stat(bucket, report_id)
+    except Exception as e:
+        print(f"Report lookup failed for {report_id}: {e}")
+        REPORT_DOWNLOADS.labels(result="error").inc()
+        raise HTTPException(status_code=503, detail="The report store is not available.")
+    if not stored:
+        REPORT_DOWNLOADS.labels(result="not_found").inc()
+        raise HTTPException(status_code=404, detail="Report not found.")
+
+    size = stored["size"]
+    headers = {
+        "ETag": stored["etag"],
+        "Last-Modified": stored["last_modified"],
+        # A stored report never changes; the browser may keep it as long as the link is valid
+        "Cache-Control": f"private, max-age={max(0, expires - int(time.time()))}, immutable",
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": f'inline; filename="{report_id}"',
+    }
+    if etag_matches(request.headers.get("if-none-match"), stored["etag"]):
+        REPORT_DOWNLOADS.labels(result="not_modified").inc()
+        return Response(status_code=304, headers=headers)
+
+    # A Range with a stale If-Range gets the whole (new) file
+    if_range = request.headers.get("if-range")
+    try:
+        byte_range = parse_range(request.headers.get("range"), size) if not if_range or if_range == stored["etag"] else None
+    except ValueError:
+        REPORT_DOWNLOADS.labels(result="unsatisfiable").inc()
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+    first, last = byte_range or (0, size - 1)
+    status_code = 206 if byte_range else 200
+    if byte_range:
+        headers["Content-Range"] = f"bytes {first}-{last}/{size}"
+    headers["Content-Length"] = str(last - first + 1)
+    REPORT_DOWNLOADS.labels(result="partial" if byte_range else "full").inc()
+    if request.method == "HEAD" or size == 0:
+        return Response(status_code=status_code, headers=headers, media_type="application/pdf")
+    return StreamingResponse(
+        report_store.read(bucket, report_id, first, last),
+        status_code=status_code, headers=headers, media_type="application/pdf",
+    )
+
+
+def _too_many_requests(e: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
 @app.post("/v1/chat/completions", response_model=ChatResponse)
-def chat(req: ChatRequest, background_tasks: BackgroundTasks):
+def chat(req: ChatRequest, background_tasks: BackgroundTasks, request: Request):
+    user = user_key(request.headers, request.client.host if request.client else None)
+    # Root span for the whole conversation turn; Gemini calls, tools,
+    # BigQuery jobs and report phases become its children.
+    with tracer.start_as_current_span("chat") as span:
+        span.set_attribute("chat.messages", len(req.messages))
+        try:
+            scheduler.admit_chat(user)
+        except Overloaded as e:
+            CHAT_REQUESTS.labels(status="429").inc()
+            raise _too_many_requests(e)
+        # "Cache-Control: no-cache" asks for a fresh answer
+        use_cache = "no-cache" not in request.headers.get("cache-control", "").lower()
+        return _chat(req, background_tasks, user, use_cache)
+
+
+def _run_direct_tool(tool_name: str, tool_args: Dict[str, Any], user: str, conversation_id: str,
+                     background_tasks: BackgroundTasks) -> Any:
+    """Runs a tool outside the model loop, with the same pools, deadlines, metrics and audit log."""
+    def audit(tool_response: str):
+        event = dict(conversation_id=conversation_id, tool_name=tool_name, tool_args=tool_args, tool_response=tool_response)
+        if REPORT_DISPATCH_WAIT_SECONDS > 0:
+            # The report may finish after the response, when its background tasks have already run
+            log_audit_event_to_bq(**event)
+        else:
+            background_tasks.add_task(log_audit_event_to_bq, **event)
+
+    print(f"Running tool directly: {tool_name} with args: {tool_args}")
+    scope = scope_for_tool(tool_name, tool_args)
+    tool_start = time.perf_counter()
+    with tracer.start_as_current_span(f"tool.{tool_name}", attributes={"tool.name": tool_name, "tool.scope": scope, "tool.direct": True}):
+        try:
+            try:
+                with deadline(tool_timeout(tool_name)), tool_labels(tool_name, scope):
+                    tool_result = scheduler.run_tool(tool_name, user, TOOL_MAP[tool_name], **tool_args)
+            finally:
+                TOOL_LATENCY.labels(tool=tool_name, scope=scope).observe(time.perf_counter() - tool_start)
+        except Overloaded:
+            TOOL_CALLS.labels(tool=tool_name, scope=scope, status="rejected").inc()
+            raise
+        except Exception as e:
+            TOOL_CALLS.labels(tool=tool_name, scope=scope, status="error").inc()
+            audit(json.dumps({"error": str(e)}))
+            raise
+    TOOL_CALLS.labels(tool=tool_name, scope=scope, status="ok").inc()
+    audit(json.dumps(str(tool_result)))
+    return tool_result
+
+
+def _summarize_history(turns: List[Dict[str, Any]]) -> str:
+    """One-paragraph summary of older turns (NOT part of the main chat)."""
+    with GEMINI_LATENCY.labels(call="summary").time(), \
+            tracer.start_as_current_span("gemini.generate_content", attributes={"gemini.call": "summary"}):
+        summary_response = SUMMARY_MODEL.generate_content(
+            turns,
+            generation_config=genai.types.GenerationConfig(temperature=0.0)
+        )
+    try:
+        return summary_response.text
+    except ValueError as e:
+        print(f"Summarization response was blocked or empty: {e}")
+        return ""
+
+
+def _chat(req: ChatRequest, background_tasks: BackgroundTasks, user: str, use_cache: bool = True):
     created = int(time.time())
     conversation_id = f"conv_{uuid.uuid4()}"
+    trace.get_current_span().set_attribute("chat.conversation_id", conversation_id)
 
     if not MODEL or not TOOL_MAP or not SUMMARY_MODEL:
         raise HTTPException(status_code=500, detail="Model not initialized.")
 
-    history = []
-    user_query = ""
-
-    # --- History Management ---
-    # 1. Check if history is too long
-    messages_to_process = req.messages
-    if len(req.messages) > 10:  # e.g., 5 user, 5 model turns
-        print(f"Conversation {conversation_id} has >10 messages. Attempting summarization.")
-        try:
-            # 2. Create a summarization request
-            summarization_history = []
-            for msg in req.messages[:-4]:  # Summarize all but the last 2 turns
-                role = "user" if msg.role == "user" else "model"
-                summarization_history.append({'role': role, 'parts': [msg.content]})
-
-            summary_prompt = "Please provide a concise, one-paragraph summary of our conversation so far, focusing on key data points, markets, and unresolved questions. Start with 'Summary of previous conversation:'"
-            summarization_history.append({'role': 'user', 'parts': [summary_prompt]})
-
-            # 3. Generate summary (NOT as part of the main chat)
-            summary_response = SUMMARY_MODEL.generate_content(
-                summarization_history,
-                generation_config=genai.types.GenerationConfig(temperature=0.0)
-            )
-
-            # 4. Prepend summary and keep last few messages
-            summary_text = ""
-            try:
-                summary_text = summary_response.text
-            except ValueError as e:
-                print(f"Summarization response was blocked or empty: {e}")
-                summary_text = f"Error during summarization: {e}"
-
-            summary_message = {'role': 'user', 'parts': [f"<system_summary>{summary_text}</system_summary>"]}
-            history.append(summary_message)
-            messages_to_process = req.messages[-4:]  # Keep last 2 turns
-            print(f"Summarization complete for {conversation_id}.")
-        except Exception as e:
-            print(f"Summarization failed for {conversation_id}: {e}. Using truncated history.")
-            messages_to_process = req.messages[-10:]  # Fallback
-
-    # 5. Build the final history for the chat session
-    for msg in messages_to_process:
-        role = "user" if msg.role == "user" else "model"
-        history.append({'role': role, 'parts': [msg.content]})
-        if msg.role == "user":
-            user_query = msg.content  # Get the last user query
+    # --- History Management: newest turns within the token budget, older ones summarized ---
+    history, user_query, history_stats = build_history(req.messages, _summarize_history)
+    if history_stats["summarized"] or history_stats["dropped"] or history_stats["clipped"]:
+        print(f"Conversation {conversation_id} history: {history_stats}")
+    CHAT_INPUT_TOKENS.observe(history_stats["input_tokens"])
+    trace.get_current_span().set_attribute("chat.input_tokens", history_stats["input_tokens"])
     # --- End History Management ---
 
     if not user_query:
         raise HTTPException(status_code=400, detail="No user message provided.")
 
-    chat_session = MODEL.start_chat(history=history[:-1])
+    # --- Routing: simple lookups and report requests take the fast model ---
+    route, route_reason = classify(user_query, SUMMARY_MODEL)
+    # Plain report requests (and "is my report ready?") skip Gemini entirely
+    report_request = match_report_request(user_query) if route == "report" else None
+    # Data questions ("where are most overdue vulns?") never pick up the pending report
+    pending_answer = report_dispatcher.follow_up(user) if route != "lookup" and is_status_question(user_query) else None
+    if report_request or pending_answer:
+        route, route_reason = "direct", "report_intent" if report_request else "report_follow_up"
+    elif route != "full" and not FAST_MODEL:
+        route, route_reason = "full", "no_fast_model"
+
+    # --- Answer cache: the same question on the same data gets the earlier answer ---
+    earlier_user_turns = sum(1 for msg in req.messages if msg.role == "user") - 1
+    cacheable = route in ("full", "lookup") and use_cache and answer_cache.is_cacheable(user_query, earlier_user_turns)
+    cached_answer = answer_cache.get(user_query) if cacheable else None
+    if cached_answer:
+        route, route_reason = "cached", "answer_cache"
+    CHAT_ROUTES.labels(route=route, reason=route_reason).inc()
+    trace.get_current_span().set_attribute("chat.route", route)
+    print(f"Conversation {conversation_id} routed to '{route}' ({route_reason}).")
+
+    if route in ("full", "lookup"):
+        # Warm the result cache with the standard queries while Gemini plans its first call
+        prefetcher.start(user_query)
+
+    # --- Plan cache: a known question shape runs its learned SQL without a model turn ---
+    planned_sql = plan_cache.plan_for(user_query) if cacheable and not cached_answer else None
+    planned_call = None
+    if planned_sql:
+        print(f"Conversation {conversation_id} uses a cached SQL plan.")
+        planned_call = genai.protos.FunctionCall(name="run_sql", args={"sql": planned_sql})
+
+    model = FAST_MODEL if route != "full" else MODEL
+    if route == "full" and PROMPT_ASSEMBLY_ENABLED:
+        # Only the table-guide entries and schemas this question needs; a follow-up
+        # ("and for Spain?") is matched together with the question before it
+        recent_questions = [msg.content for msg in req.messages if msg.role == "user" and msg.content][-2:]
+        system_prompt, prompt_stats = prompt_assembler.assemble("\n".join(recent_questions))
+        model = get_model_for_prompt(system_prompt)
+        SYSTEM_PROMPT_TOKENS.observe(prompt_stats["tokens"])
+        trace.get_current_span().set_attribute("chat.system_prompt_tokens", prompt_stats["tokens"])
+        print(f"Conversation {conversation_id} prompt: {prompt_stats}")
+    if planned_call:
+        # The model sees the plan as its own first call and only has to phrase the result
+        chat_session = model.start_chat(history=history + [{'role': 'model', 'parts': [{'function_call': planned_call}]}])
+    else:
+        chat_session = model.start_chat(history=history[:-1])
 
     gen_config = genai.types.GenerationConfig(
         temperature=req.temperature,
         max_output_tokens=req.max_tokens
     )
 
+    chat_start = time.perf_counter()
+    tool_iterations = 0
+    tool_calls = []
     try:
-        response = chat_session.send_message(
-            history[-1]['parts'],
-            generation_config=gen_config
-        )
+        if route in ("direct", "cached"):
+            content = cached_answer or pending_answer or report_dispatcher.dispatch(
+                user, report_request, lambda name, args: _run_direct_tool(name, args, user, conversation_id, background_tasks)
+            )
+            background_tasks.add_task(log_audit_event_to_bq, conversation_id=conversation_id, final_response=content)
+            CHAT_REQUESTS.labels(status="ok").inc()
+            return ChatResponse(
+                id=f"chatcmpl_{created}",
+                created=created,
+                model=req.model or MODEL_NAME,
+                choices=[Choice(index=0, message=Message(role="assistant", content=content))],
+            )
+
+        if planned_call:
+            fc = planned_call
+        else:
+            with GEMINI_LATENCY.labels(call="initial").time(), \
+                    tracer.start_as_current_span("gemini.send_message", attributes={"gemini.call": "initial"}):
+                response = chat_session.send_message(
+                    history[-1]['parts'],
+                    generation_config=gen_config
+                )
 
-        fc = get_function_call(response)
+            fc = get_function_call(response)
 
         while fc:
+            tool_iterations += 1
             if fc.name not in TOOL_MAP:
                 raise HTTPException(status_code=400, detail=f"Unknown tool: {fc.name}")
 
             tool_function = TOOL_MAP[fc.name]
             tool_args = {key: value for key, value in fc.args.items()}
+            learned_args = tool_args
 
             if fc.name == "run_sql":
                 sql_query = tool_args.get("sql", "")
-                validate_sql(sql_query)
+                # run_sql qualifies bare table names itself; check the query it will run
+                validate_sql(sql_repairer.qualify(sql_query)[0])
                 print(f"SQL_QUERY_LOG: {sql_query}")
                 background_tasks.add_task(log_sql_query_to_bq, sql_query)  # Log to old table
             else:
                 print(f"Running tool: {fc.name} with args: {tool_args}")
 
-            try:
-                # --- Tool Execution ---
-                tool_result = tool_function(**tool_args)
-
-                # --- Handle GCS URL from generate_report ---
-                if fc.name == "generate_report" or fc.name == "application_report":
-                    # tool_result is now the signed URL string
-                    public_url = str(tool_result)
-                    markdown_link = f"[Click here to download your report]({public_url})"
-                    tool_result_for_ai = {
-                        "status": "Success",
-                        "markdown_link": markdown_link,
-                        "message": f"Report generated. The link expires in 5 minutes."
-                    }
-
-                elif not isinstance(tool_result, (str, int, float, list, dict)):
-                    tool_result_for_ai = str(tool_result)
-                else:
-                    tool_result_for_ai = tool_result
-
-                result_json = json.dumps(tool_result_for_ai, default=json_serial)
-
-            except Exception as e:
-                print(f"Tool {fc.name} failed: {e}")
-                tool_result_for_ai = {"error": str(e)}
-                result_json = json.dumps(tool_result_for_ai, default=json_serial)
+            scope = scope_for_tool(fc.name, tool_args)
+            tool_start = time.perf_counter()
+            tool_ok = True
+            with tracer.start_as_current_span(f"tool.{fc.name}", attributes={"tool.name": fc.name, "tool.scope": scope}) as tool_span:
+                try:
+                    # --- Tool Execution ---
+                    # Runs in the tool's scheduler pool (interactive / schema / report),
+                    # with BigQuery/GCS calls bounded by the tool's deadline
+                    try:
+                        with deadline(tool_timeout(fc.name)), tool_labels(fc.name, scope):
+                            tool_result = scheduler.run_tool(fc.name, user, tool_function, **tool_args)
+                    finally:
+                        # Failed and timed-out calls count too: they are the slow ones
+                        TOOL_LATENCY.labels(tool=fc.name, scope=scope).observe(time.perf_counter() - tool_start)
+                    TOOL_CALLS.labels(tool=fc.name, scope=scope, status="ok").inc()
+
+                    # --- Handle GCS URL from generate_report ---
+                    if fc.name == "generate_report" or fc.name == "application_report":
+                        # tool_result is now the signed URL string
+                        public_url = str(tool_result)
+                        markdown_link = f"[Click here to download your report]({public_url})"
+                        tool_result_for_ai = {
+                            "status": "Success",
+                            "markdown_link": markdown_link,
+                            "message": f"Report generated. The link expires in 5 minutes."
+                        }
+
+                    elif isinstance(tool_result, dict) and "repaired_sql" in tool_result:
+                        # The plan cache learns the query that ran, not the one the model wrote
+                        learned_args = dict(tool_args, sql=tool_result["repaired_sql"])
+                        tool_result_for_ai = tool_result
+
+                    elif not isinstance(tool_result, (str, int, float, list, dict)):
+                        tool_result_for_ai = str(tool_result)
+                    else:
+                        tool_result_for_ai = tool_result
+
+                    result_json = json.dumps(tool_result_for_ai, default=json_serial)
+                    # Compact form sent to the model; the audit log keeps the JSON
+                    result_for_model, encoding_stats = encode_tool_result(fc.name, tool_result_for_ai)
+                    print(f"TOOL_ENCODING_LOG: {fc.name} {encoding_stats}")
+                    TOOL_RESULT_TOKENS.labels(tool=fc.name).observe(encoding_stats["encoded_tokens"])
+                    if fc.name in ("generate_report", "application_report"):
+                        cacheable = False  # Signed links expire
+
+                except Overloaded:
+                    TOOL_CALLS.labels(tool=fc.name, scope=scope, status="rejected").inc()
+                    raise
+                except Exception as e:
+                    print(f"Tool {fc.name} failed: {e}")
+                    TOOL_CALLS.labels(tool=fc.name, scope=scope, status="error").inc()
+                    tool_result_for_ai = {"error": str(e)}
+                    result_json = json.dumps(tool_result_for_ai, default=json_serial)
+                    result_for_model = result_json
+                    tool_span.set_attribute("tool.error", str(e))
+                    tool_ok = False
+                    cacheable = False
+                    if fc is planned_call:
+                        plan_cache.forget(user_query, planned_sql)
+            tool_calls.append((fc.name, learned_args, tool_ok))
 
             # --- Rich Audit Logging (Tool Call) ---
             background_tasks.add_task(
@@ -277,15 +511,17 @@ def chat(req: ChatRequest, background_tasks: BackgroundTasks):
                 "function_response": {
                     "name": fc.name,
                     "response": {
-                        "result": result_json
+                        "result": result_for_model
                     }
                 }
             }
 
-            response = chat_session.send_message(
-                function_response_content,
-                generation_config=gen_config
-            )
+            with GEMINI_LATENCY.labels(call="tool_response").time(), \
+                    tracer.start_as_current_span("gemini.send_message", attributes={"gemini.call": "tool_response"}):
+                response = chat_session.send_message(
+                    function_response_content,
+                    generation_config=gen_config
+                )
             fc = get_function_call(response)
 
         # --- End of while loop (no more tool calls) ---
@@ -294,6 +530,7 @@ def chat(req: ChatRequest, background_tasks: BackgroundTasks):
         except ValueError as e:
             print(f"Response was blocked or empty: {e}")
             content = f"My response was blocked. (Error: {e})"
+            cacheable = False
 
         # --- Rich Audit Logging (Final Response) ---
         background_tasks.add_task(
@@ -302,19 +539,34 @@ def chat(req: ChatRequest, background_tasks: BackgroundTasks):
             final_response=content
         )
 
+        if cacheable:
+            answer_cache.put(user_query, content)
+            plan_cache.learn(user_query, tool_calls)
+
         resp = ChatResponse(
             id=f"chatcmpl_{created}",
             created=created,
             model=req.model or MODEL_NAME,
             choices=[Choice(index=0, message=Message(role="assistant", content=content))],
         )
+        CHAT_REQUESTS.labels(status="ok").inc()
         return resp
 
     except HTTPException as he:
+        CHAT_REQUESTS.labels(status=str(he.status_code)).inc()
         raise he
+    except Overloaded as e:
+        print(f"Chat {conversation_id} rejected: {e}")
+        CHAT_REQUESTS.labels(status="429").inc()
+        raise _too_many_requests(e)
     except Exception as e:
         print(f"Error during chat generation: {e}")
+        CHAT_REQUESTS.labels(status="500").inc()
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        CHAT_LATENCY.observe(time.perf_counter() - chat_start)
+        CHAT_ROUTE_LATENCY.labels(route=route).observe(time.perf_counter() - chat_start)
+        TOOL_LOOP_ITERATIONS.observe(tool_iterations)
 
 
 @app.get("/v1/models", response_model=ModelsResponse)
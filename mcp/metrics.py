@@ -0,0 +1,207 @@
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# --- Prometheus metrics for the MCP server ---
+# Label values are kept low-cardinality: tool names come from TOOL_MAP and
+# scope is one of "global", "market", "application" or "none". BigQuery
+# metrics carry the tool and scope of the call they were made for (a context
+# variable, carried into worker threads by submit_with_context); queries
+# outside a tool call (startup, caches, prefetch) are labelled "none".
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+# Chat endpoint
+CHAT_REQUESTS = Counter(
+    "mcp_chat_requests_total", "Chat completion requests.", ["status"]
+)
+CHAT_LATENCY = Histogram(
+    "mcp_chat_latency_seconds", "End-to-end chat completion latency.", buckets=LATENCY_BUCKETS
+)
+CHAT_INPUT_TOKENS = Histogram(
+    "mcp_chat_input_tokens", "Estimated tokens of the conversation history sent to Gemini.",
+    buckets=(100, 250, 500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000)
+)
+SYSTEM_PROMPT_TOKENS = Histogram(
+    "mcp_system_prompt_tokens", "Estimated tokens of the system prompt assembled for a chat request.",
+    buckets=(500, 1000, 1500, 2000, 2500, 3000, 4000, 5000, 6000, 8000, 12000)
+)
+TOOL_LOOP_ITERATIONS = Histogram(
+    "mcp_tool_loop_iterations", "Tool calls per chat request.", buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15)
+)
+
+# Request routing
+CHAT_ROUTES = Counter(
+    "mcp_chat_routes_total", "Chat requests per route and how the route was chosen.", ["route", "reason"]
+)
+CHAT_ROUTE_LATENCY = Histogram(
+    "mcp_chat_route_latency_seconds", "End-to-end chat latency per route.", ["route"], buckets=LATENCY_BUCKETS
+)
+
+# Answer cache
+ANSWER_CACHE_LOOKUPS = Counter(
+    "mcp_answer_cache_lookups_total", "Answer cache lookups (hit, miss, error).", ["result"]
+)
+PLAN_CACHE_EVENTS = Counter(
+    "mcp_plan_cache_events_total", "Question-to-SQL plan cache events (hit, miss, learned, forgotten).", ["event"]
+)
+
+# Gemini
+GEMINI_LATENCY = Histogram(
+    "mcp_gemini_latency_seconds", "Latency of Gemini calls.", ["call"], buckets=LATENCY_BUCKETS
+)
+
+# Tools
+TOOL_CALLS = Counter(
+    "mcp_tool_calls_total", "Tool executions.", ["tool", "scope", "status"]
+)
+TOOL_LATENCY = Histogram(
+    "mcp_tool_latency_seconds", "Tool execution latency.", ["tool", "scope"], buckets=LATENCY_BUCKETS
+)
+TOOL_RESULT_TOKENS = Histogram(
+    "mcp_tool_result_tokens", "Estimated tokens of tool results sent to the model.", ["tool"],
+    buckets=(50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000)
+)
+SQL_REPAIRS = Counter(
+    "mcp_sql_repairs_total", "Local repairs of model SQL (kind: table, error, like_case; result: fixed, failed, no_fix).",
+    ["kind", "result"]
+)
+LLM_TURNS_AVOIDED = Counter(
+    "mcp_llm_turns_avoided_total", "Gemini turns saved by handling a problem locally.", ["reason"]
+)
+
+# BigQuery
+BQ_QUERY_LATENCY = Histogram(
+    "mcp_bq_query_latency_seconds", "BigQuery query job latency (submit to rows fetched).", ["status", "tool", "scope"],
+    buckets=LATENCY_BUCKETS
+)
+BQ_BYTES_PROCESSED = Counter(
+    "mcp_bq_bytes_processed_total", "Bytes processed by BigQuery query jobs.", ["tool", "scope"]
+)
+BQ_COALESCED_CALLS = Counter(
+    "mcp_bq_coalesced_calls_total",
+    "Query calls that started a job (leader) or shared an identical in-flight one (follower).", ["source", "role"]
+)
+BQ_COALESCED_WAITERS = Gauge(
+    "mcp_bq_coalesced_waiters", "Callers currently waiting for an identical in-flight query.", ["source"]
+)
+
+# Speculative prefetch and the result cache it fills
+PREFETCH_QUERIES = Counter(
+    "mcp_prefetch_queries_total", "Standard queries prefetched while the model was thinking.", ["status"]
+)
+PREFETCH_USED = Counter(
+    "mcp_prefetch_used_total", "Prefetched results that a later query used (hit rate = used / prefetched ok)."
+)
+RESULT_CACHE_HITS = Counter(
+    "mcp_result_cache_hits_total", "run_sql calls answered from the result cache."
+)
+
+# Local mirror
+LOCAL_MIRROR_QUERIES = Counter(
+    "mcp_local_mirror_queries_total", "Queries answered by the local mirror or sent back to BigQuery.", ["result"]
+)
+LOCAL_MIRROR_LATENCY = Histogram(
+    "mcp_local_mirror_query_latency_seconds", "Local mirror query latency.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2)
+)
+LOCAL_MIRROR_SYNCS = Counter(
+    "mcp_local_mirror_syncs_total", "Local mirror sync attempts.", ["status"]
+)
+
+# Workload scheduler
+SCHED_IN_FLIGHT = Gauge(
+    "mcp_sched_in_flight", "Tool calls running per scheduler pool.", ["pool"]
+)
+SCHED_QUEUED = Gauge(
+    "mcp_sched_queued", "Tool calls waiting for a slot per scheduler pool.", ["pool"]
+)
+SCHED_QUEUE_WAIT = Histogram(
+    "mcp_sched_queue_wait_seconds", "Time spent waiting for a scheduler slot.", ["pool"],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30)
+)
+SCHED_REJECTED = Counter(
+    "mcp_sched_rejected_total", "Requests rejected with 429.", ["pool", "reason"]
+)
+
+# Resilience (deadlines, retries, hedging, circuit breakers)
+RESILIENCE_RETRIES = Counter(
+    "mcp_retries_total", "Retries after transient errors.", ["operation"]
+)
+RESILIENCE_HEDGES = Counter(
+    "mcp_hedged_requests_total", "Duplicate requests started for slow calls.", ["operation"]
+)
+RESILIENCE_TIMEOUTS = Counter(
+    "mcp_deadline_exceeded_total", "Operations stopped by their deadline.", ["operation"]
+)
+CIRCUIT_STATE = Gauge(
+    "mcp_circuit_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).", ["dependency"]
+)
+CIRCUIT_REJECTED = Counter(
+    "mcp_circuit_rejected_total", "Calls rejected by an open circuit breaker.", ["dependency"]
+)
+
+# Reports
+REPORT_PHASE_LATENCY = Histogram(
+    "mcp_report_phase_latency_seconds", "Report generation latency per phase.", ["report", "phase", "scope"],
+    buckets=LATENCY_BUCKETS
+)
+REPORT_QUERY_QUEUE = Gauge(
+    "mcp_report_queries_pending", "Report queries submitted to the fan-out pool and not yet finished.", ["report"]
+)
+CHART_RENDER_LATENCY = Histogram(
+    "mcp_chart_render_latency_seconds", "Matplotlib chart rendering latency.", ["chart"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 4)
+)
+REPORT_PDF_BYTES = Histogram(
+    "mcp_report_pdf_bytes", "Size of the PDFs streamed to GCS.", ["report"],
+    buckets=(64e3, 128e3, 256e3, 512e3, 1e6, 2e6, 4e6, 8e6, 16e6)
+)
+REPORT_DOWNLOADS = Counter(
+    "mcp_report_downloads_total", "Report download requests (full, partial, not_modified, forbidden, not_found, ...).",
+    ["result"]
+)
+REPORT_REUSED = Counter(
+    "mcp_report_reused_total", "Report requests answered with a new link to a recently stored PDF.", ["report"]
+)
+
+
+# A market filter in model SQL: market = 'Italy', LOWER(market) LIKE ..., market IN UNNEST(@markets)
+_MARKET_FILTER = re.compile(r"\bmarket\)?\s*(=|!=|<>|\bIN\b|\bLIKE\b)", re.IGNORECASE)
+
+_tool_labels: ContextVar[Tuple[str, str]] = ContextVar("tool_labels", default=("none", "none"))
+
+
+def scope_for_tool(tool_name: str, tool_args: dict) -> str:
+    """Maps a tool call to a market scope label."""
+    if tool_name == "application_report":
+        return "application"
+    if tool_name == "run_sql":
+        return "market" if _MARKET_FILTER.search((tool_args or {}).get("sql", "")) else "global"
+    market = tool_args.get("market") if tool_args else None
+    if market is None:
+        return "none"
+    return "global" if str(market).lower() == "global" else "market"
+
+
+@contextmanager
+def tool_labels(tool: str, scope: str):
+    """Labels the BigQuery metrics of everything inside the block with the tool call."""
+    token = _tool_labels.set((tool, scope))
+    try:
+        yield
+    finally:
+        _tool_labels.reset(token)
+
+
+def current_tool_labels() -> Dict[str, str]:
+    tool, scope = _tool_labels.get()
+    return {"tool": tool, "scope": scope}
+
+
+def render_metrics():
+    """Returns the exposition payload and its content type."""
+    return generate_latest(), CONTENT_TYPE_LATEST
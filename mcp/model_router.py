@@ -0,0 +1,75 @@
+import os
+import re
+from typing import Any, Optional, Tuple
+
+from feature_flags import enabled
+
+# --- Request router ---
+# Classifies the last user message so simple requests skip the full model:
+#   "lookup" - a single number / KPI question (fast model, trimmed prompt);
+#              it must ask for a count or metric and not for a list or grouping
+#   "report" - a PDF report request (fast model, trimmed prompt)
+#   "full"   - multi-table analysis, overviews, comparisons (full model)
+# Heuristics decide first; only messages they cannot place go to the lite
+# model when ROUTER_LLM_FALLBACK is enabled.
+
+ROUTER_ENABLED = enabled("ROUTER_ENABLED")
+# Ask the lite model when no heuristic matches (one extra short call)
+ROUTER_LLM_FALLBACK = os.getenv("ROUTER_LLM_FALLBACK", "false").lower() == "true"
+# Longer messages are never treated as simple lookups
+ROUTER_LOOKUP_MAX_WORDS = int(os.getenv("ROUTER_LOOKUP_MAX_WORDS", "25"))
+
+ROUTES = ("lookup", "report", "full")
+
+_REPORT = re.compile(r"\b(report|pdf)s?\b", re.IGNORECASE)
+_COMPLEX = re.compile(
+    r"\b(overview|compare|comparison|versus|vs|trend|trends|breakdown|analy[sz]e|analysis|why|explain|"
+    r"each|every|per|all markets|which markets?|rank|ranking|list|details?|correlat\w*|over time|history|"
+    r"group|grouped|split|by (market|service|severity|state|month|week|year)|top \d+|sort\w*|order\w*)\b",
+    re.IGNORECASE,
+)
+# A count or metric phrasing; state words alone ("open", "overdue") also appear in list questions
+_LOOKUP = re.compile(
+    r"\b(how many|how much|number of|count of|total number|kpis?|target|risk score|current risk|percentage|percent|"
+    r"(average|avg|mean|median) (time|age|days|number))\b",
+    re.IGNORECASE,
+)
+
+_CLASSIFIER_PROMPT = (
+    "Classify the user message for a vulnerability data assistant. Answer with one word:\n"
+    "LOOKUP - asks for one number or one KPI value.\n"
+    "REPORT - asks for a PDF report.\n"
+    "FULL - anything else (overviews, comparisons, lists, analysis).\n\n"
+    "Message: {message}"
+)
+
+
+def _heuristic_route(message: str) -> Tuple[Optional[str], str]:
+    if _REPORT.search(message):
+        return "report", "keyword"
+    if len(message.split()) > ROUTER_LOOKUP_MAX_WORDS:
+        return "full", "length"
+    if _COMPLEX.search(message) or message.count("?") > 1:
+        return "full", "keyword"
+    if _LOOKUP.search(message):
+        return "lookup", "keyword"
+    return None, "no_match"
+
+
+def classify(message: str, classifier_model: Any = None) -> Tuple[str, str]:
+    """Returns (route, reason) for the last user message."""
+    if not ROUTER_ENABLED:
+        return "full", "disabled"
+    route, reason = _heuristic_route(message)
+    if route:
+        return route, reason
+
+    if ROUTER_LLM_FALLBACK and classifier_model is not None:
+        try:
+            response = classifier_model.generate_content(_CLASSIFIER_PROMPT.format(message=message[:2000]))
+            label = response.text.strip().lower()
+            if label in ROUTES:
+                return label, "llm"
+        except Exception as e:
+            print(f"Route classification failed: {e}")
+    return "full", "default"
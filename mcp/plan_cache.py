@@ -0,0 +1,139 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from answer_cache import question_parts
+from prefetch import sql_literal
+from market_resolver import market_index
+from feature_flags import enabled
+from metrics import PLAN_CACHE_EVENTS
+
+# --- Question -> SQL plan cache ---
+# Questions that differ only in the market, service or severity they name
+# ("how many open criticals in Italy?" / "... in Spain?") produce the same
+# SQL. When a conversation turn needed exactly one successful run_sql call,
+# its SQL is kept as a template with @market / @service / @severity slots,
+# keyed by the question's remaining words. Once the same template has been
+# learned PLAN_CACHE_MIN_SUCCESSES times, a matching question runs it straight
+# away and the model only phrases the answer. The audit log has the SQL but
+# not the question, so plans are learned from live traffic only.
+
+PLAN_CACHE_ENABLED = enabled("PLAN_CACHE_ENABLED")
+# Identical templates needed before a plan is used
+PLAN_CACHE_MIN_SUCCESSES = int(os.getenv("PLAN_CACHE_MIN_SUCCESSES", "2"))
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "500"))
+
+# Entity kind -> (column it filters, template slot)
+SLOTS = {"markets": ("market", "@market"), "services": ("service", "@service"), "severities": ("severity", "@severity")}
+# Tools that do not change what the answer is based on
+SCHEMA_TOOLS = {"list_tables", "get_table_schema"}
+
+_COMPARED_LITERAL = re.compile(r"(=|\bIN\s*\()\s*'((?:[^'\\]|\\.)*)'", re.IGNORECASE)
+
+PlanKey = Tuple[Any, ...]
+
+
+def _plan_key(question: str) -> Optional[Tuple[PlanKey, Dict[str, str]]]:
+    """(template key, slot values) for a question, None when it names several values of one kind."""
+    entities, numbers, qualifiers, words = question_parts(question)
+    if any(len(values) > 1 for values in entities.values()):
+        return None
+    values = {SLOTS[kind][1]: found[0] for kind, found in entities.items() if found}
+    return (words, qualifiers, tuple(sorted(values)), numbers), values
+
+
+def _template(sql: str, values: Dict[str, str]) -> Optional[str]:
+    """
+    The SQL with the slot values' filters (`market = 'Italy'`, `severity IN ('Critical')`)
+    replaced by their slots, None if it cannot be templated.
+    """
+    columns = {slot: column for column, slot in SLOTS.values()}
+    if any(slot in sql for slot in columns):
+        return None
+    template = sql
+    for slot, value in values.items():
+        literal = re.escape(sql_literal(value))
+        pattern = re.compile(rf"(\b{columns[slot]}\s*(?:=\s*|IN\s*\(\s*)){literal}", re.IGNORECASE)
+        template, count = pattern.subn(lambda m: m.group(1) + slot, template)
+        if count == 0:
+            return None
+    # A market the question did not name means the SQL leaned on earlier context
+    known = set(market_index.known_markets())
+    if any(m.group(2) in known for m in _COMPARED_LITERAL.finditer(template)):
+        return None
+    return template
+
+
+def render(template: str, values: Dict[str, str]) -> str:
+    for slot, value in values.items():
+        template = template.replace(slot, sql_literal(value))
+    return template
+
+
+class PlanCache:
+    def __init__(self):
+        # plan key -> {template: successful runs}
+        self._plans: "OrderedDict[PlanKey, Dict[str, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan_for(self, question: str) -> Optional[str]:
+        """Ready-to-run SQL for the question, if a validated plan exists."""
+        if not PLAN_CACHE_ENABLED:
+            return None
+        try:
+            parsed = _plan_key(question)
+        except Exception as e:
+            print(f"Plan cache lookup skipped: {e}")
+            return None
+        if parsed is None:
+            return None
+        key, values = parsed
+        with self._lock:
+            templates = self._plans.get(key, {})
+            best = max(templates.items(), key=lambda t: t[1], default=(None, 0))
+            if best[0] is not None:
+                self._plans.move_to_end(key)
+        if best[1] < PLAN_CACHE_MIN_SUCCESSES:
+            PLAN_CACHE_EVENTS.labels(event="miss").inc()
+            return None
+        PLAN_CACHE_EVENTS.labels(event="hit").inc()
+        return render(best[0], values)
+
+    def learn(self, question: str, tool_calls: List[Tuple[str, Dict[str, Any], bool]]):
+        """Keeps the SQL of a turn that was answered from a single successful run_sql call."""
+        if not PLAN_CACHE_ENABLED:
+            return
+        data_calls = [c for c in tool_calls if c[0] not in SCHEMA_TOOLS]
+        if len(data_calls) != 1 or data_calls[0][0] != "run_sql" or not all(ok for _, _, ok in tool_calls):
+            return
+        try:
+            parsed = _plan_key(question)
+            template = _template(data_calls[0][1].get("sql", ""), parsed[1]) if parsed else None
+        except Exception as e:
+            print(f"Plan not learned: {e}")
+            return
+        if template is None:
+            return
+        with self._lock:
+            templates = self._plans.setdefault(parsed[0], {})
+            templates[template] = templates.get(template, 0) + 1
+            self._plans.move_to_end(parsed[0])
+            while len(self._plans) > PLAN_CACHE_MAX_ENTRIES:
+                self._plans.popitem(last=False)
+        PLAN_CACHE_EVENTS.labels(event="learned").inc()
+
+    def forget(self, question: str, sql: str):
+        """Drops a plan whose SQL failed when it was run for `question`."""
+        try:
+            parsed = _plan_key(question)
+            template = _template(sql, parsed[1]) if parsed else None
+        except Exception:
+            return
+        with self._lock:
+            if parsed and self._plans.get(parsed[0], {}).pop(template, None) is not None:
+                PLAN_CACHE_EVENTS.labels(event="forgotten").inc()
+
+
+plan_cache = PlanCache()
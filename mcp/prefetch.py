@@ -0,0 +1,109 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from bigquery_client import (
+    prefetch_sql,
+    BG_GLOBAL_KPI_SUMMARY, BG_MARKET_KPI_SUMMARY,
+    BG_GLOBAL_SEVERITY_STATE_TABLE, BG_MARKET_SEVERITY_STATE_TABLE,
+    BG_GLOBAL_CURRENT_RISK_SUMMARY, BG_MARKET_CURRENT_RISK_SUMMARY,
+)
+from result_shaping import model_query
+from market_resolver import market_index
+from trend_store import TREND_SERVICES
+from feature_flags import enabled
+from metrics import PREFETCH_QUERIES
+from tracing import submit_with_context
+
+# --- Speculative prefetch ---
+# Once a message names a market (or asks for global numbers), the model
+# almost always asks next for the KPI summary, the severity/state counts and
+# the current risk. Those standard queries run in the background during the
+# first Gemini turn and land in the result cache; the system prompt shows the
+# model the same query forms, so its run_sql calls are answered from memory
+# (or join the prefetch job when it is still running).
+
+PREFETCH_ENABLED = enabled("PREFETCH_ENABLED")
+# Background threads for prefetch queries
+PREFETCH_WORKERS = int(os.getenv("PREFETCH_WORKERS", "4"))
+
+SEVERITIES = ["Critical", "High", "Medium", "Low", "Info"]
+
+# Standard query -> (global table, market table, extra filter columns)
+STANDARD_QUERIES = {
+    "kpi_summary": (BG_GLOBAL_KPI_SUMMARY, BG_MARKET_KPI_SUMMARY, ()),
+    "severity_state": (BG_GLOBAL_SEVERITY_STATE_TABLE, BG_MARKET_SEVERITY_STATE_TABLE, ("service", "severity")),
+    "current_risk": (BG_GLOBAL_CURRENT_RISK_SUMMARY, BG_MARKET_CURRENT_RISK_SUMMARY, ()),
+}
+
+_GLOBAL = re.compile(r"\b(global|overall|all markets|every market|group)\b", re.IGNORECASE)
+
+
+def sql_literal(value: str) -> str:
+    """A quoted BigQuery string literal."""
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _condition(column: str, values: List[str]) -> str:
+    if len(values) == 1:
+        return f"{column} = {sql_literal(values[0])}"
+    return f"{column} IN ({', '.join(sql_literal(v) for v in values)})"
+
+
+def _mentioned(text: str, names: List[str]) -> List[str]:
+    return [n for n in names if re.search(rf"\b{re.escape(n)}\b", text, re.IGNORECASE)]
+
+
+def standard_sql(name: str, markets: Optional[List[str]] = None, services: Optional[List[str]] = None,
+                 severities: Optional[List[str]] = None) -> str:
+    """The standard form of a query, e.g. SELECT * FROM `...market_kpi_summary` WHERE market = 'Italy'."""
+    global_table, market_table, extra_columns = STANDARD_QUERIES[name]
+    conditions = [_condition("market", markets)] if markets else []
+    if "service" in extra_columns and services:
+        conditions.append(_condition("service", services))
+    if "severity" in extra_columns and severities:
+        conditions.append(_condition("severity", severities))
+    sql = f"SELECT * FROM `{market_table if markets else global_table}`"
+    return f"{sql} WHERE {' AND '.join(conditions)}" if conditions else sql
+
+
+def detect_entities(message: str) -> Dict[str, List[str]]:
+    """Markets (canonical names), services and severities named in a message."""
+    return {
+        "markets": market_index.mentioned_in(message),
+        "services": _mentioned(message, TREND_SERVICES),
+        "severities": _mentioned(message, SEVERITIES),
+    }
+
+
+class Prefetcher:
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS, thread_name_prefix="prefetch")
+
+    def _prefetch(self, name: str, sql: str):
+        limited_sql, preview_rows, _ = model_query(sql)
+        try:
+            fetched = prefetch_sql(limited_sql, max_results=preview_rows)
+        except Exception as e:
+            PREFETCH_QUERIES.labels(status="error").inc()
+            print(f"Prefetch of {name} failed: {e}")
+            return
+        PREFETCH_QUERIES.labels(status="ok" if fetched else "cached").inc()
+
+    def _run(self, message: str):
+        entities = detect_entities(message)
+        if not entities["markets"] and not _GLOBAL.search(message):
+            return
+        for name in STANDARD_QUERIES:
+            sql = standard_sql(name, entities["markets"], entities["services"], entities["severities"])
+            submit_with_context(self._executor, self._prefetch, name, sql)
+
+    def start(self, message: str):
+        """Starts prefetching for a user message; returns at once."""
+        if PREFETCH_ENABLED:
+            # Entity detection may load the market list, so it runs off the request thread too
+            submit_with_context(self._executor, self._run, message)
+
+
+prefetcher = Prefetcher()
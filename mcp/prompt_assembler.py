@@ -0,0 +1,178 @@
+import os
+import re
+import math
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import google.generativeai as genai
+
+from adk_tooling import CORE_PROMPT, TABLE_GUIDE, TOPIC_GUIDE, guide_text
+from prefetch import detect_entities
+from result_shaping import estimate_tokens
+from feature_flags import enabled
+
+# --- Retrieval-based system prompt ---
+# The full prompt carries all 13 table-guide entries, the multi-table topics
+# and the schemas, while most questions touch one or two tables. The
+# assembled prompt is the core persona/rules block, a one-line catalog of
+# every table (so the model can still reach the others via
+# get_table_schema), and only the guide entries, notes, topics and schemas
+# that match the question. Matching is a local keyword index (idf-weighted
+# overlap with each entry's keywords and text), optionally blended with
+# embeddings when PROMPT_EMBEDDING_MODEL is set.
+
+PROMPT_ASSEMBLY_ENABLED = enabled("PROMPT_ASSEMBLY_ENABLED")
+# Table-guide entries and multi-table topics kept per question
+PROMPT_GUIDE_MAX_ENTRIES = int(os.getenv("PROMPT_GUIDE_MAX_ENTRIES", "4"))
+PROMPT_GUIDE_MAX_TOPICS = int(os.getenv("PROMPT_GUIDE_MAX_TOPICS", "2"))
+# Entries scoring below this share of the best match are left out
+PROMPT_GUIDE_RELATIVE_SCORE = float(os.getenv("PROMPT_GUIDE_RELATIVE_SCORE", "0.5"))
+# e.g. "models/text-embedding-004"; empty ranks on keywords only
+PROMPT_EMBEDDING_MODEL = os.getenv("PROMPT_EMBEDDING_MODEL", "")
+
+# Entries used when nothing in the question matches: the summary tables
+DEFAULT_ENTRIES = {"global": ["global_severity_state", "global_kpi"], "market": ["market_severity_state", "market_kpi"]}
+DEFAULT_TOPICS = ["standard_queries"]
+
+_WORD = re.compile(r"[a-z_]+")
+_STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "at", "to", "is", "are", "was", "be", "me", "my", "i", "we", "our",
+    "you", "your", "please", "can", "could", "would", "give", "show", "tell", "what", "which", "do", "does", "with",
+    "by", "and", "or", "about", "use", "user", "when", "ask", "this", "that", "it", "as", "table", "vulnerability",
+}
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _terms(text: str) -> set:
+    return {_stem(w) for w in _WORD.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1}
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def _schema_line(schema: Dict[str, Any]) -> str:
+    columns = ", ".join(f"{c['name']} {c['type']}" for c in schema.get("schema", []))
+    return f"- `{schema['table']}`: {columns}"
+
+
+class PromptAssembler:
+    def __init__(self, entries: List[Dict[str, Any]], topics: List[Dict[str, Any]]):
+        self.entries = entries
+        self.topics = topics
+        self._docs = entries + topics
+        self._keywords = [_terms(d["keywords"]) for d in self._docs]
+        # Table entries also match on their guide text; topics only on their keywords
+        self._text_terms = [_terms(d["text"]) | k for d, k in zip(entries, self._keywords)] + self._keywords[len(entries):]
+        df: Dict[str, int] = {}
+        for terms in self._text_terms:
+            for term in terms:
+                df[term] = df.get(term, 0) + 1
+        self._idf = {term: math.log(1 + len(self._docs) / count) for term, count in df.items()}
+        self._embeddings: Optional[List[List[float]]] = None
+        self._embedding_lock = threading.Lock()
+        self._schemas: Dict[str, str] = {}
+        self._known_markets = ""
+        self.catalog = "### Tables\nEvery table you can query (details for the relevant ones below; call `get_table_schema` for the others):\n" + "\n".join(
+            f"- `{table}`: {entry['summary']}" for entry in entries for table in entry["tables"]
+        )
+
+    def configure(self, schemas: Dict[str, Dict[str, Any]], known_markets: str):
+        """Sets the preloaded schemas (by table) and the canonical market names."""
+        self._schemas = {table: _schema_line(schema) for table, schema in schemas.items()}
+        self._known_markets = known_markets
+
+    def _doc_embeddings(self) -> Optional[List[List[float]]]:
+        with self._embedding_lock:
+            if self._embeddings is None:
+                texts = [f"{d['keywords']}\n{d['text']}" for d in self._docs]
+                self._embeddings = genai.embed_content(
+                    model=PROMPT_EMBEDDING_MODEL, content=texts, task_type="retrieval_document"
+                )["embedding"]
+            return self._embeddings
+
+    def _similarities(self, question: str) -> Optional[List[float]]:
+        if not PROMPT_EMBEDDING_MODEL:
+            return None
+        try:
+            query = genai.embed_content(model=PROMPT_EMBEDDING_MODEL, content=question, task_type="retrieval_query")["embedding"]
+            return [_cosine(query, doc) for doc in self._doc_embeddings()]
+        except Exception as e:
+            print(f"Prompt embedding failed, ranking on keywords: {e}")
+            return None
+
+    def _scores(self, question: str, markets: List[str]) -> List[float]:
+        # Market names only say which variant of a table; the guide examples name markets too
+        for market in markets:
+            question = re.sub(re.escape(market), " ", question, flags=re.IGNORECASE)
+        terms = _terms(question)
+        markets_named = bool(markets)
+        scores = []
+        for doc, keywords, text_terms in zip(self._docs, self._keywords, self._text_terms):
+            score = sum(self._idf.get(t, 0.0) * (2 if t in keywords else 1) for t in terms if t in text_terms)
+            # A named market points at the market tables, no market at the global ones
+            scope = doc.get("scope")
+            if (scope == "global" and markets_named) or (scope == "market" and not markets_named and "market" not in terms):
+                score *= 0.5
+            scores.append(score)
+        similarities = self._similarities(question)
+        if similarities:
+            best = max(scores) or 1.0
+            scores = [s / best + sim for s, sim in zip(scores, similarities)]
+        return scores
+
+    @staticmethod
+    def _pick(docs: List[Dict[str, Any]], scores: List[float], limit: int) -> List[Dict[str, Any]]:
+        best = max(scores, default=0.0)
+        if best <= 0:
+            return []
+        ranked = sorted(zip(scores, range(len(docs))), key=lambda s: -s[0])
+        keep = sorted(i for score, i in ranked[:limit] if score >= best * PROMPT_GUIDE_RELATIVE_SCORE)
+        return [docs[i] for i in keep]
+
+    def assemble(self, question: str) -> Tuple[str, Dict[str, Any]]:
+        """The system prompt for a question and its stats (tokens, entries, topics, schemas)."""
+        try:
+            markets = detect_entities(question)["markets"]
+        except Exception as e:
+            print(f"Prompt assembly without market detection: {e}")
+            markets = []
+        scores = self._scores(question, markets)
+        entries = self._pick(self.entries, scores[:len(self.entries)], PROMPT_GUIDE_MAX_ENTRIES)
+        topics = self._pick(self.topics, scores[len(self.entries):], PROMPT_GUIDE_MAX_TOPICS)
+        if not entries:
+            defaults = DEFAULT_ENTRIES["market" if markets else "global"]
+            entries = [e for e in self.entries if e["name"] in defaults]
+            topics = topics or [t for t in self.topics if t["name"] in DEFAULT_TOPICS]
+
+        parts = [CORE_PROMPT, self.catalog, guide_text(entries, topics)]
+        schemas = [self._schemas[t] for e in entries for t in e["tables"] if t in self._schemas]
+        if schemas:
+            parts.append("### Table Schemas\nColumns of the tables above. Use these before calling `get_table_schema`.\n" + "\n".join(schemas))
+        if self._known_markets:
+            parts.append(f"### Known Markets\nThe exact values of the `market` column: {self._known_markets}")
+        prompt = "\n\n".join(parts)
+        stats = {
+            "tokens": estimate_tokens(prompt),
+            "entries": [e["name"] for e in entries],
+            "topics": [t["name"] for t in topics],
+            "schemas": len(schemas),
+        }
+        return prompt, stats
+
+
+def guide_tables() -> List[str]:
+    """Every table the guide describes, in guide order."""
+    return [table for entry in TABLE_GUIDE for table in entry["tables"]]
+
+
+prompt_assembler = PromptAssembler(TABLE_GUIDE, TOPIC_GUIDE)
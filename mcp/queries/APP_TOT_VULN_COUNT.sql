@@ -1,6 +0,0 @@
-SELECT
-    COUNT(*) as total_vuln
-FROM
-    `{BG_MASTER_TABLE}`
-WHERE
-    service in ('White Box', 'Black Box')
\ No newline at end of file
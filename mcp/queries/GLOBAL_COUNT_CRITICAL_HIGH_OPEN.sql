@@ -1,7 +0,0 @@
-SELECT
-    COUNT(*) AS Total
-FROM
-    `{BG_MASTER_TABLE}`
-WHERE
-    state IN ('New', 'Open', 'Validating')
-    AND severity IN ('Critical', 'High')
\ No newline at end of file
@@ -1,4 +0,0 @@
-SELECT
-    COUNT(*)
-FROM
-    `{BG_MASTER_TABLE}`
\ No newline at end of file
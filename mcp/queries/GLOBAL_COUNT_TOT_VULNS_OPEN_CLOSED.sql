@@ -1,5 +0,0 @@
-SELECT
-    SUM(CASE WHEN state in ('New', 'Open', 'Validating') THEN 1 ELSE 0 END) AS Open,
-    SUM(CASE WHEN state in ('Closed', 'Parked') THEN 1 ELSE 0 END) AS Closed
-FROM
-    `{BG_MASTER_TABLE}`
\ No newline at end of file
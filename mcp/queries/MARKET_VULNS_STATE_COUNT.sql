@@ -1,9 +0,0 @@
-SELECT
-    state,
-    COUNT(*) AS vulnerability_count
-FROM
-    `{BG_MASTER_TABLE}`
-WHERE
-    LOWER(market) LIKE LOWER(@market)
-GROUP BY
-    state
\ No newline at end of file
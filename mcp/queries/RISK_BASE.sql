@@ -0,0 +1,24 @@
+SELECT
+  id,
+  market,
+  service,
+  severity,
+  state,
+  sub_state,
+  vuln_type,
+  description,
+  vuln_url,
+  CASE
+    WHEN severity IN ('Critical', 'High') THEN 'High'
+    WHEN severity IN ('Medium', 'Low', 'Info') THEN 'Low'
+  END AS kpi_category,
+  CASE
+    WHEN time_to_solve_days > 0 THEN SAFE_DIVIDE(total_open_days, time_to_solve_days)
+    ELSE NULL
+  END AS individual_risk_score,
+  total_open_days,
+  time_to_solve_days,
+  (time_to_solve_days - total_open_days) AS remaining_days,
+  is_overdue
+FROM
+  `{BG_MASTER_TABLE}`
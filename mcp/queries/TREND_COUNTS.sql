@@ -1,10 +1,11 @@
 SELECT
-  FORMAT_DATETIME("%b", published_at) as published_month,
   DATE_TRUNC(published_at, MONTH) AS month_start,
+  market,
+  service,
   COUNT(*) AS item_count
 FROM
   `{BG_MASTER_TABLE}`
+WHERE
+  published_at >= DATETIME(@since)
 GROUP BY
-  published_month, month_start
-ORDER BY
-  month_start ASC
\ No newline at end of file
+  month_start, market, service
@@ -13,6 +13,7 @@ FROM
     `{BG_MASTER_TABLE}`
 WHERE
     state IN ('Closed', 'Parked')
+    AND {SCOPE_FILTER}
 GROUP BY
     severity
 ORDER BY
@@ -5,4 +5,4 @@ FROM
 WHERE
     state IN ('New', 'Open', 'Validating')
     AND severity IN ('Critical', 'High')
-    AND LOWER(market) LIKE LOWER(@market)
\ No newline at end of file
+    AND {SCOPE_FILTER}
\ No newline at end of file
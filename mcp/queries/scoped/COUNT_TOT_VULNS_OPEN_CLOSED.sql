@@ -4,4 +4,4 @@ SELECT
 FROM
     `{BG_MASTER_TABLE}`
 WHERE
-    LOWER(market) LIKE LOWER(@market)
+    {SCOPE_FILTER}
@@ -7,4 +7,4 @@ SELECT
 FROM
   `{BG_MASTER_TABLE}`
 WHERE
-    LOWER(market) LIKE LOWER(@market)
\ No newline at end of file
+    {SCOPE_FILTER}
\ No newline at end of file
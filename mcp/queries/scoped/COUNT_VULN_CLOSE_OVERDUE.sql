@@ -11,4 +11,4 @@ WHERE
     NOT is_overdue
     AND state IN ('Open', 'New', 'Validating')
     AND (time_to_solve_days - total_open_days) < 7
-    AND LOWER(market) LIKE LOWER(@market)
\ No newline at end of file
+    AND {SCOPE_FILTER}
\ No newline at end of file
@@ -5,4 +5,5 @@ FROM
 WHERE
   state IN ('New', 'Open', 'Validating')
   AND severity IN ('Critical', 'High')
+  AND {SCOPE_FILTER}
 ORDER BY severity
\ No newline at end of file
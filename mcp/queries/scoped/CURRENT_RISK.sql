@@ -2,4 +2,7 @@ SELECT
     kpi_category,
     total_active_vulnerabilities,
     average_risk_score
-FROM `{BG_GLOBAL_CURRENT_RISK_SUMMARY}`
\ No newline at end of file
+FROM
+    `{CURRENT_RISK_TABLE}`
+WHERE
+    {SCOPE_FILTER}
\ No newline at end of file
@@ -11,7 +11,7 @@ SELECT
     overdue_closed_parked_percentage,
     is_kpi_reachable
 FROM
-    `{BG_MARKET_KPI_SUMMARY}`
+    `{KPI_SUMMARY_TABLE}`
 WHERE
     kpi_category = 'High'
-    AND LOWER(market) LIKE LOWER(@market)
\ No newline at end of file
+    AND {SCOPE_FILTER}
\ No newline at end of file
@@ -5,7 +5,7 @@ FROM
     `{BG_MASTER_TABLE}`
 WHERE
     state IN ('Open', 'New')
-    AND LOWER(market) LIKE LOWER(@market)
+    AND {SCOPE_FILTER}
 GROUP BY
     current_status
 ORDER BY
@@ -15,7 +15,7 @@ SELECT
 FROM
   `{BG_MASTER_TABLE}`
 WHERE
-    LOWER(market) LIKE LOWER(@market)
+    {SCOPE_FILTER}
 GROUP BY
   asset_name
 ORDER BY
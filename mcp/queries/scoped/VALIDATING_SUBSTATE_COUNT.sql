@@ -5,6 +5,7 @@ FROM
     `{BG_MASTER_TABLE}`
 WHERE
     state = 'Validating'
+    AND {SCOPE_FILTER}
 GROUP BY
     current_status
 ORDER BY
@@ -3,5 +3,7 @@ SELECT
     COUNT(*) AS vulnerability_count
 FROM
     `{BG_MASTER_TABLE}`
+WHERE
+    {SCOPE_FILTER}
 GROUP BY
     state
\ No newline at end of file
@@ -19,6 +19,7 @@ WHERE
   NOT is_overdue
   AND state IN ('Open', 'New', 'Validating')
   AND (time_to_solve_days - total_open_days) < 7
+  AND {SCOPE_FILTER}
 ORDER BY
   CASE severity
     WHEN 'Critical' THEN 1
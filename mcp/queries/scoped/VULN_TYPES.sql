@@ -16,6 +16,7 @@ FROM
     `{BG_MASTER_TABLE}`
 WHERE
     vuln_type IS NOT NULL
+    AND {SCOPE_FILTER}
 GROUP BY
     vuln_type
 )
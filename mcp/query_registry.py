@@ -0,0 +1,126 @@
+import os
+from typing import Any, Dict, List, Optional
+
+from bigquery_client import (
+    BG_MASTER_TABLE, BG_VULNERABILITIES_TABLE,
+    BG_GLOBAL_SEVERITY_STATE_TABLE, BG_MARKET_SEVERITY_STATE_TABLE,
+    BG_GLOBAL_KPI_SUMMARY, BG_MARKET_KPI_SUMMARY,
+    BG_VULNS_TIME_TO_OVERDUE,
+    BG_GLOBAL_CURRENT_RISK_SUMMARY, BG_MARKET_CURRENT_RISK_SUMMARY,
+    BG_VULNS_STATE_CLOSED, BG_VULNS_STATE_OPEN, BG_VULNS_STATE_PARKED, BG_VULNS_STATE_VALIDATING,
+    BG_LAST_UPDATE
+)
+
+# --- Query registry shared by the report generators ---
+# queries/*.sql are rendered once with the table names. queries/scoped/*.sql
+# are metric templates with a {SCOPE_FILTER} placeholder (and optionally
+# {KPI_SUMMARY_TABLE} / {CURRENT_RISK_TABLE}), compiled once per scope.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERY_DIR = os.path.join(BASE_DIR, "queries")
+SCOPED_QUERY_DIR = os.path.join(QUERY_DIR, "scoped")
+
+TABLES = {
+    "BG_MASTER_TABLE": BG_MASTER_TABLE,
+    "BG_VULNERABILITIES_TABLE": BG_VULNERABILITIES_TABLE,
+    "BG_GLOBAL_SEVERITY_STATE_TABLE": BG_GLOBAL_SEVERITY_STATE_TABLE,
+    "BG_MARKET_SEVERITY_STATE_TABLE": BG_MARKET_SEVERITY_STATE_TABLE,
+    "BG_GLOBAL_KPI_SUMMARY": BG_GLOBAL_KPI_SUMMARY,
+    "BG_MARKET_KPI_SUMMARY": BG_MARKET_KPI_SUMMARY,
+    "BG_VULNS_TIME_TO_OVERDUE": BG_VULNS_TIME_TO_OVERDUE,
+    "BG_GLOBAL_CURRENT_RISK_SUMMARY": BG_GLOBAL_CURRENT_RISK_SUMMARY,
+    "BG_MARKET_CURRENT_RISK_SUMMARY": BG_MARKET_CURRENT_RISK_SUMMARY,
+    "BG_VULNS_STATE_CLOSED": BG_VULNS_STATE_CLOSED,
+    "BG_VULNS_STATE_OPEN": BG_VULNS_STATE_OPEN,
+    "BG_VULNS_STATE_PARKED": BG_VULNS_STATE_PARKED,
+    "BG_VULNS_STATE_VALIDATING": BG_VULNS_STATE_VALIDATING,
+    "BG_LAST_UPDATE": BG_LAST_UPDATE,
+}
+
+# A scope is a row filter on vulnerabilities_master, the parameters it needs
+# and, where one exists, the pre-aggregated summary tables at that grain.
+# "market" covers a single market and a market set; "service" covers the
+# application report (White Box + Black Box) and per-service views.
+SCOPES = {
+    "global": {
+        "filter": "TRUE",
+        "param_types": {},
+        "tables": {"KPI_SUMMARY_TABLE": BG_GLOBAL_KPI_SUMMARY, "CURRENT_RISK_TABLE": BG_GLOBAL_CURRENT_RISK_SUMMARY},
+    },
+    "market": {
+        "filter": "market IN UNNEST(@markets)",
+        "param_types": {"markets": "ARRAY<STRING>"},
+        "tables": {"KPI_SUMMARY_TABLE": BG_MARKET_KPI_SUMMARY, "CURRENT_RISK_TABLE": BG_MARKET_CURRENT_RISK_SUMMARY},
+    },
+    "service": {
+        "filter": "service IN UNNEST(@services)",
+        "param_types": {"services": "ARRAY<STRING>"},
+        # No summary tables are kept per service
+        "tables": {},
+    },
+}
+
+APPLICATION_SERVICES = ["White Box", "Black Box"]
+
+
+class CompiledQuery:
+    """Rendered SQL for one metric in one scope, with the parameters it expects."""
+
+    def __init__(self, name: str, scope: Optional[str], sql: str, param_types: Dict[str, str]):
+        self.name = name
+        self.scope = scope
+        self.sql = sql
+        self.param_types = param_types
+
+    def params(self, **values: Any) -> Optional[Dict[str, Any]]:
+        """Checks and returns the query parameters (None when the query takes none)."""
+        missing = set(self.param_types) - set(values)
+        if missing:
+            raise ValueError(f"Query {self.name} ({self.scope}) is missing parameters: {', '.join(sorted(missing))}")
+        return {k: values[k] for k in self.param_types} or None
+
+
+def _read(path: str) -> str:
+    with open(path, "r") as f:
+        return f.read()
+
+
+def _sql_files(directory: str) -> List[str]:
+    return sorted(f for f in os.listdir(directory) if f.endswith(".sql"))
+
+
+class QueryRegistry:
+    def __init__(self):
+        self.queries: Dict[str, CompiledQuery] = {}
+        self.scoped: Dict[str, Dict[str, CompiledQuery]] = {scope: {} for scope in SCOPES}
+        self.load()
+
+    def load(self):
+        for file_name in _sql_files(QUERY_DIR):
+            name = file_name[:-4]
+            try:
+                sql = _read(os.path.join(QUERY_DIR, file_name)).format(**TABLES)
+                self.queries[name] = CompiledQuery(name, None, sql, {})
+            except Exception as e:
+                print(f"Error loading query {name}: {e}")
+
+        for file_name in _sql_files(SCOPED_QUERY_DIR):
+            name = file_name[:-4]
+            template = _read(os.path.join(SCOPED_QUERY_DIR, file_name))
+            for scope, spec in SCOPES.items():
+                try:
+                    sql = template.format(SCOPE_FILTER=spec["filter"], **spec["tables"], **TABLES)
+                except KeyError:
+                    # The metric reads a summary table that this scope does not have
+                    continue
+                self.scoped[scope][name] = CompiledQuery(name, scope, sql, spec["param_types"])
+
+    def get(self, name: str) -> CompiledQuery:
+        return self.queries[name]
+
+    def for_scope(self, scope: str) -> Dict[str, CompiledQuery]:
+        """All metric queries compiled for `scope`, e.g. to batch a report's queries."""
+        return self.scoped[scope]
+
+
+registry = QueryRegistry()
@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+import time
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from market_resolver import market_index
+from feature_flags import enabled
+from scheduler import Overloaded
+from tracing import submit_with_context
+
+# --- Direct dispatch for report requests ---
+# "Give me the report for Italy" does not need Gemini to pick generate_report
+# and then a second turn to wrap the link. Short, unambiguous report requests
+# are matched here, the report tool runs directly and the answer comes from
+# an in-persona template. Anything less clear goes through the model.
+
+REPORT_DISPATCH_ENABLED = enabled("REPORT_DISPATCH_ENABLED")
+# Seconds to wait for the report before answering "still cooking"; 0 waits for it.
+# The user gets the link by asking again ("is my report ready?").
+REPORT_DISPATCH_WAIT_SECONDS = float(os.getenv("REPORT_DISPATCH_WAIT_SECONDS", "0"))
+# Longer messages probably ask for more than a report
+REPORT_DISPATCH_MAX_WORDS = int(os.getenv("REPORT_DISPATCH_MAX_WORDS", "15"))
+# Background reports are kept this long after they started (signed URLs expire in 5 minutes)
+REPORT_DISPATCH_RESULT_TTL_SECONDS = int(os.getenv("REPORT_DISPATCH_RESULT_TTL_SECONDS", "240"))
+
+_REPORT = re.compile(r"\b(report|pdf)s?\b", re.IGNORECASE)
+_APPLICATION = re.compile(r"\b(applications?|apps?|white\s*box|black\s*box)\b", re.IGNORECASE)
+_GLOBAL = re.compile(r"\b(global|overall|all markets|every market|group)\b", re.IGNORECASE)
+# Requests that need the model: analysis on top of the report, or conditions the tools do not take
+_NEEDS_MODEL = re.compile(
+    r"\b(compare|versus|vs|explain|why|and (then|also)|summar\w*|only|without|except|between|"
+    r"last|since|from|until|before|after|email|send)\b",
+    re.IGNORECASE,
+)
+_STATUS = re.compile(r"\b(ready|status|done|finished|where)\b", re.IGNORECASE)
+# A status question must be about the report ("is it ready?", "where's my PDF?"), not about the data
+_REPORT_CONTEXT = re.compile(r"\b(report|pdf|link|it)s?\b", re.IGNORECASE)
+
+_TEMPLATES = {
+    "success": [
+        "Fine. Your {label} report is done: {link}\n\nThe link expires in 5 minutes, so try to click it before it evaporates like my will to live.",
+        "Here it is, the {label} report nobody will read past page two: {link}\n\nThe link expires in 5 minutes.",
+        "Report generated. {label}, in all its depressing glory: {link}\n\nYou have 5 minutes before the link expires. Use them wisely. Or don't.",
+    ],
+    "failed": [
+        "Of course it broke. The {label} report did not make it. The error log, for what it's worth: {url}",
+    ],
+    "error": [
+        "I can't produce the {label} report: {error}",
+    ],
+    "pending": [
+        "The {label} report is still being generated. Even machines need a minute. Ask me again shortly and I'll hand over the link.",
+    ],
+}
+
+ReportRequest = Tuple[str, Dict[str, Any], str]
+
+
+def _render(kind: str, key: str, **values: Any) -> str:
+    # Stable pick per request, so the same question gets the same wording
+    variants = _TEMPLATES[kind]
+    return variants[zlib.crc32(key.encode()) % len(variants)].format(**values)
+
+
+def match_report_request(message: str) -> Optional[ReportRequest]:
+    """
+    Returns (tool_name, tool_args, label) when the message is a plain report
+    request with an explicit scope, otherwise None.
+    """
+    if not REPORT_DISPATCH_ENABLED or not _REPORT.search(message):
+        return None
+    if len(message.split()) > REPORT_DISPATCH_MAX_WORDS or _NEEDS_MODEL.search(message):
+        return None
+
+    markets = market_index.mentioned_in(message)
+    if _APPLICATION.search(message):
+        return ("application_report", {}, "application") if not markets else None
+    if _GLOBAL.search(message):
+        return ("generate_report", {"market": "global"}, "global") if not markets else None
+    if len(markets) == 1:
+        return "generate_report", {"market": markets[0]}, markets[0]
+    # No scope ("the report for it") or several markets: let the model work it out
+    return None
+
+
+def is_status_question(message: str) -> bool:
+    if len(message.split()) > REPORT_DISPATCH_MAX_WORDS:
+        return False
+    return bool(_STATUS.search(message)) and bool(_REPORT_CONTEXT.search(message))
+
+
+class ReportDispatcher:
+    """Runs matched report requests and keeps slow ones for the user's follow-up."""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="report-dispatch")
+        self._pending: Dict[str, Tuple[Future, str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _answer(self, future: Future, label: str) -> str:
+        try:
+            result = str(future.result())
+        except Exception as e:
+            return _render("error", label, label=label, error=e)
+        if result.startswith("Failed to generate report"):
+            return _render("failed", label, label=label, url=result.split("Error log: ", 1)[-1])
+        return _render("success", label, label=label, link=f"[Click here to download your report]({result})")
+
+    def dispatch(self, user: str, request: ReportRequest, run: Callable[[str, Dict[str, Any]], Any]) -> str:
+        """Runs the report via run(tool_name, tool_args) and returns the templated answer."""
+        tool_name, tool_args, label = request
+        if REPORT_DISPATCH_WAIT_SECONDS <= 0:
+            future: Future = Future()
+            try:
+                future.set_result(run(tool_name, tool_args))
+            except Overloaded:
+                raise  # Becomes a 429 like any other rejected tool call
+            except Exception as e:
+                future.set_exception(e)
+            return self._answer(future, label)
+
+        future = submit_with_context(self._executor, run, tool_name, tool_args)
+        try:
+            future.result(timeout=REPORT_DISPATCH_WAIT_SECONDS)
+        except Overloaded:
+            raise
+        except Exception:
+            pass
+        if future.done():
+            return self._answer(future, label)
+        with self._lock:
+            self._pending[user] = (future, label, time.time())
+        return _render("pending", label, label=label)
+
+    def follow_up(self, user: str) -> Optional[str]:
+        """The answer for the user's background report, if there is one."""
+        with self._lock:
+            now = time.time()
+            self._pending = {
+                u: job for u, job in self._pending.items()
+                if not job[0].done() or now - job[2] < REPORT_DISPATCH_RESULT_TTL_SECONDS
+            }
+            job = self._pending.get(user)
+            if not job:
+                return None
+            future, label, _ = job
+            if not future.done():
+                return _render("pending", label, label=label)
+            del self._pending[user]
+        return self._answer(future, label)
+
+
+report_dispatcher = ReportDispatcher()
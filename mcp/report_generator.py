@@ -1,102 +1,64 @@
 import os
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
+from typing import List, Optional
 from jinja2 import Environment, FileSystemLoader
 from weasyprint import HTML
 import io
+import time
 import base64
 import matplotlib
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from google.cloud import storage
 from google.oauth2 import service_account
-from bigquery_client import run_sql
-from bigquery_client import (
-    BG_MASTER_TABLE,
-    BG_VULNERABILITIES_TABLE,
-    BG_GLOBAL_SEVERITY_STATE_TABLE,
-    BG_MARKET_SEVERITY_STATE_TABLE,
-    BG_GLOBAL_KPI_SUMMARY,
-    BG_MARKET_KPI_SUMMARY,
-    BG_VULNS_TIME_TO_OVERDUE,
-    BG_GLOBAL_CURRENT_RISK_SUMMARY,
-    BG_MARKET_CURRENT_RISK_SUMMARY,
-    BG_VULNS_STATE_CLOSED,
-    BG_VULNS_STATE_OPEN,
-    BG_VULNS_STATE_PARKED,
-    BG_VULNS_STATE_VALIDATING,
-    BG_LAST_UPDATE
+from bigquery_client import run_sql, run_sql_arrow
+from metrics import REPORT_PHASE_LATENCY, REPORT_QUERY_QUEUE, CHART_RENDER_LATENCY
+from tracing import submit_with_context, record_span
+from scheduler import scheduler
+from resilience import (
+    report_query, collect_sections, remaining, REPORT_DATA_DEADLINE_SECONDS
 )
+from report_storage import report_store
+from market_resolver import resolve_markets
+from query_registry import registry
+from trend_store import trend_store
 
 # Define directories
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMPLATE_DIR = os.path.join(BASE_DIR, "templates")
-QUERY_DIR = os.path.join(BASE_DIR, "queries")
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME")
+# Rows shown in the detail tables (almost overdue, critical/high open)
+REPORT_DETAIL_MAX_ROWS = int(os.getenv("REPORT_DETAIL_MAX_ROWS", "100"))
+# Without these sections the report is not worth sending
+CRITICAL_SECTIONS = {"total_vulnerabilities_count", "vulns_count_state"}
 
 # Set up Jinja2 environment
 jinja_env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
 key_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-if key_path and os.path.exists(key_path):
-    creds = service_account.Credentials.from_service_account_file(key_path)
-    gcs_client = storage.Client(credentials=creds, project=creds.project_id)
-else:
-    gcs_client = storage.Client()
-gcs_bucket = gcs_client.bucket(GCS_BUCKET_NAME) if GCS_BUCKET_NAME else None
-
-# --- SQL Query Loader ---
-# This dictionary maps query names to their file names
-QUERY_FILES = {
-    "GLOBAL_AVERAGE_TIME_PER_SEVERITY_CLOSED": "GLOBAL_AVERAGE_TIME_PER_SEVERITY_CLOSED.sql",
-    "GLOBAL_AVERAGE_TIME_PER_SEVERITY_OPEN": "GLOBAL_AVERAGE_TIME_PER_SEVERITY_OPEN.sql",
-    "GLOBAL_COUNT_CRITICAL_HIGH_OPEN": "GLOBAL_COUNT_CRITICAL_HIGH_OPEN.sql",
-    "GLOBAL_COUNT_TOT_VULNS": "GLOBAL_COUNT_TOT_VULNS.sql",
-    "GLOBAL_COUNT_TOT_VULNS_OPEN_CLOSED": "GLOBAL_COUNT_TOT_VULNS_OPEN_CLOSED.sql",
-    "GLOBAL_COUNT_TOT_VULNS_SEVERITY": "GLOBAL_COUNT_TOT_VULNS_SEVERITY.sql",
-    "GLOBAL_COUNT_TOT_VULNS_SEVERITY_OPEN": "GLOBAL_COUNT_TOT_VULNS_SEVERITY_OPEN.sql",
-    "GLOBAL_COUNT_VULN_CLOSE_OVERDUE": "GLOBAL_COUNT_VULN_CLOSE_OVERDUE.sql",
-    "GLOBAL_CRITICAL_HIGH_OPEN": "GLOBAL_CRITICAL_HIGH_OPEN.sql",
-    "GLOBAL_CURRENT_RISK": "GLOBAL_CURRENT_RISK.sql",
-    "GLOBAL_KPI_SUMMARY_HIGH": "GLOBAL_KPI_SUMMARY_HIGH.sql",
-    "GLOBAL_KPI_SUMMARY_LOW": "GLOBAL_KPI_SUMMARY_LOW.sql",
-    "GLOBAL_MONTHLY_TREND": "GLOBAL_MONTHLY_TREND.sql",
-    "GLOBAL_SERVICE_MONTHLY_TREND": "GLOBAL_SERVICE_MONTHLY_TREND.sql",
-    "GLOBAL_VULN_CLOSE_OVERDUE": "GLOBAL_VULN_CLOSE_OVERDUE.sql",
-    "GLOBAL_VULN_TYPES": "GLOBAL_VULN_TYPES.sql",
-    "LAST_UPDATE": "LAST_UPDATE.sql",
-    "MARKET_AVERAGE_TIME_PER_SEVERITY_CLOSED": "MARKET_AVERAGE_TIME_PER_SEVERITY_CLOSED.sql",
-    "MARKET_AVERAGE_TIME_PER_SEVERITY_OPEN": "MARKET_AVERAGE_TIME_PER_SEVERITY_OPEN.sql",
-    "MARKET_COUNT_CRITICAL_HIGH_OPEN": "MARKET_COUNT_CRITICAL_HIGH_OPEN.sql",
-    "MARKET_COUNT_TOT_VULNS": "MARKET_COUNT_TOT_VULNS.sql",
-    "MARKET_COUNT_TOT_VULNS_OPEN_CLOSED": "MARKET_COUNT_TOT_VULNS_OPEN_CLOSED.sql",
-    "MARKET_COUNT_TOT_VULNS_SEVERITY": "MARKET_COUNT_TOT_VULNS_SEVERITY.sql",
-    "MARKET_COUNT_TOT_VULNS_SEVERITY_OPEN": "MARKET_COUNT_TOT_VULNS_SEVERITY_OPEN.sql",
-    "MARKET_COUNT_VULN_CLOSE_OVERDUE": "MARKET_COUNT_VULN_CLOSE_OVERDUE.sql",
-    "MARKET_CRITICAL_HIGH_OPEN": "MARKET_CRITICAL_HIGH_OPEN.sql",
-    "MARKET_CURRENT_RISK": "MARKET_CURRENT_RISK.sql",
-    "MARKET_KPI_SUMMARY_HIGH": "MARKET_KPI_SUMMARY_HIGH.sql",
-    "MARKET_KPI_SUMMARY_LOW": "MARKET_KPI_SUMMARY_LOW.sql",
-    "MARKET_MONTHLY_TREND": "MARKET_MONTHLY_TREND.sql",
-    "MARKET_SERVICE_MONTHLY_TREND": "MARKET_SERVICE_MONTHLY_TREND.sql",
-    "MARKET_VULN_CLOSE_OVERDUE": "MARKET_VULN_CLOSE_OVERDUE.sql",
-    "MARKET_VULN_TYPES": "MARKET_VULN_TYPES.sql",
-    "TOP_6_ASSET": "TOP_6_ASSET.sql",
-    "TOP_6_MARKET": "TOP_6_MARKET.sql",
-    "GLOBAL_VULNS_STATE_COUNT": "GLOBAL_VULNS_STATE_COUNT.sql",
-    "MARKET_VULNS_STATE_COUNT": "MARKET_VULNS_STATE_COUNT.sql",
-    "GLOBAL_OPEN_SUBSTATE_COUNT": "GLOBAL_OPEN_SUBSTATE_COUNT.sql",
-    "MARKET_OPEN_SUBSTATE_COUNT": "MARKET_OPEN_SUBSTATE_COUNT.sql",
-    "GLOBAL_VALIDATING_SUBSTATE_COUNT": "GLOBAL_VALIDATING_SUBSTATE_COUNT.sql",
-    "MARKET_VALIDATING_SUBSTATE_COUNT": "MARKET_VALIDATING_SUBSTATE_COUNT.sql",
-    "GLOBAL_OVERDUE_COUNT": "GLOBAL_OVERDUE_COUNT.sql",
-    "MARKET_OVERDUE_COUNT": "MARKET_OVERDUE_COUNT.sql",
-}
-
-QUERIES = {}
+gcs_client = None
+if GCS_BUCKET_NAME:
+    # Only build a client when reports can be uploaded (keeps offline imports working)
+    if key_path and os.path.exists(key_path):
+        creds = service_account.Credentials.from_service_account_file(key_path)
+        gcs_client = storage.Client(credentials=creds, project=creds.project_id)
+    else:
+        gcs_client = storage.Client()
+gcs_bucket = gcs_client.bucket(GCS_BUCKET_NAME) if gcs_client else None
+
+def _observe_phase(phase: str, scope: str, phase_start: int) -> int:
+    """
+    Records a report phase (metric + trace span) and returns the start of the next one.
+    Times are time.time_ns() values.
+    """
+    now = time.time_ns()
+    REPORT_PHASE_LATENCY.labels(report="overview", phase=phase, scope=scope).observe((now - phase_start) / 1e9)
+    record_span(f"report.{phase}", phase_start, now, report="overview", scope=scope)
+    return now
 
 
+@CHART_RENDER_LATENCY.labels(chart="avg_time_bar").time()
 def _create_avg_time_chart(title, data_rows, bar_labels=['SLA (Days)', 'Actual (Days)']):
     """
     Creates a grouped bar chart for SLA vs Average Time and returns a base64 image.
@@ -163,6 +125,7 @@ def _create_avg_time_chart(title, data_rows, bar_labels=['SLA (Days)', 'Actual (
     return f"data:image/png;base64,{img_base64}"
 
 
+@CHART_RENDER_LATENCY.labels(chart="pie").time()
 def _create_pie_chart(title, data_rows):
     """
     Creates a pie chart from a list of [label, count] rows and returns a base64 image.
@@ -227,149 +190,103 @@ def _create_pie_chart(title, data_rows):
     return f"data:image/png;base64,{img_base64}"
 
 
-def load_query(name: str, file_name: str) -> str:
-    """Loads a query from a .sql file and formats it with table names."""
-    try:
-        with open(os.path.join(QUERY_DIR, file_name), 'r') as f:
-            # Format the query with the actual table names from the client
-            return f.read().format(
-                BG_MASTER_TABLE=BG_MASTER_TABLE,
-                BG_VULNERABILITIES_TABLE=BG_VULNERABILITIES_TABLE,
-                BG_GLOBAL_SEVERITY_STATE_TABLE=BG_GLOBAL_SEVERITY_STATE_TABLE,
-                BG_MARKET_SEVERITY_STATE_TABLE=BG_MARKET_SEVERITY_STATE_TABLE,
-                BG_GLOBAL_KPI_SUMMARY=BG_GLOBAL_KPI_SUMMARY,
-                BG_MARKET_KPI_SUMMARY=BG_MARKET_KPI_SUMMARY,
-                BG_VULNS_TIME_TO_OVERDUE=BG_VULNS_TIME_TO_OVERDUE,
-                BG_GLOBAL_CURRENT_RISK_SUMMARY=BG_GLOBAL_CURRENT_RISK_SUMMARY,
-                BG_MARKET_CURRENT_RISK_SUMMARY=BG_MARKET_CURRENT_RISK_SUMMARY,
-                BG_VULNS_STATE_CLOSED=BG_VULNS_STATE_CLOSED,
-                BG_VULNS_STATE_OPEN=BG_VULNS_STATE_OPEN,
-                BG_VULNS_STATE_PARKED=BG_VULNS_STATE_PARKED,
-                BG_VULNS_STATE_VALIDATING=BG_VULNS_STATE_VALIDATING,
-                BG_LAST_UPDATE=BG_LAST_UPDATE
-            )
-    except FileNotFoundError:
-        print(f"Error: Query file not found: {file_name}")
-        return ""
-    except Exception as e:
-        print(f"Error loading query {name}: {e}")
-        return ""
-
-# Load all queries into memory on startup
-for name, file_name in QUERY_FILES.items():
-    QUERIES[name] = load_query(name, file_name)
-
-
-def _get_data(market: str):
+def _get_data(market: str, markets: Optional[List[str]] = None):
     """
     Fetches a comprehensive set of data for the report concurrently.
+    `markets` are canonical market names; resolved from `market` if not given.
     """
     data = {"counts": {}}
     is_global = market.lower() == "global"
     data['is_global'] = is_global
 
     ## Use query parameters to prevent SQL injection
-    market_param = {"market": f"%{market}%"}
+    scope_values = {} if is_global else {"markets": markets or resolve_markets(market)}
+    # Every metric comes from one template compiled for the report's scope
+    queries = registry.for_scope("global" if is_global else "market")
 
-    # Use a ThreadPoolExecutor to run queries in parallel
-    executor = ThreadPoolExecutor(max_workers=20)
+    # Run queries in parallel on the scheduler's shared report executor
+    executor = scheduler.report_query_executor
     futures = {}
 
+    def submit(query, key, fn=run_sql, **kwargs):
+        futures[submit_with_context(
+            executor, report_query, key, fn, query.sql, params=query.params(**scope_values), **kwargs
+        )] = key
+
     # Define all queries to be run
     # --- Last update ---
-    futures[executor.submit(run_sql, QUERIES["LAST_UPDATE"])] = "last_update"
+    submit(registry.get("LAST_UPDATE"), "last_update")
 
     # --- KPI Queries ---
-    high_kpi_sql = QUERIES["GLOBAL_KPI_SUMMARY_HIGH"] if is_global else QUERIES["MARKET_KPI_SUMMARY_HIGH"]
-    low_kpi_sql = QUERIES["GLOBAL_KPI_SUMMARY_LOW"] if is_global else QUERIES["MARKET_KPI_SUMMARY_LOW"]
-    futures[executor.submit(run_sql, high_kpi_sql, params=None if is_global else market_param)] = "high_kpi_details"
-    futures[executor.submit(run_sql, low_kpi_sql, params=None if is_global else market_param)] = "low_kpi_details"
+    submit(queries["KPI_SUMMARY_HIGH"], "high_kpi_details")
+    submit(queries["KPI_SUMMARY_LOW"], "low_kpi_details")
 
     # --- Top 6 Markets/Assets ---
-    top_market_asset_sql = QUERIES["TOP_6_MARKET"] if is_global else QUERIES["TOP_6_ASSET"]
-    futures[executor.submit(run_sql, top_market_asset_sql, params=None if is_global else market_param)] = "top_effected"
+    submit(registry.get("TOP_6_MARKET") if is_global else queries["TOP_6_ASSET"], "top_effected")
 
     # --- Risk Queries ---
-    current_risk_sql = QUERIES["GLOBAL_CURRENT_RISK"] if is_global else QUERIES["MARKET_CURRENT_RISK"]
-    futures[executor.submit(run_sql, current_risk_sql, params=None if is_global else market_param)] = "risk_summary"
+    submit(queries["CURRENT_RISK"], "risk_summary")
 
     # --- Almost Overdue ---
-    vuln_close_to_overdue_sql = QUERIES["GLOBAL_VULN_CLOSE_OVERDUE"] if is_global else QUERIES["MARKET_VULN_CLOSE_OVERDUE"]
-    futures[executor.submit(run_sql, vuln_close_to_overdue_sql, params=None if is_global else market_param)] = "vulns_to_overdue"
+    submit(queries["VULN_CLOSE_OVERDUE"], "vulns_to_overdue", run_sql_arrow, max_results=REPORT_DETAIL_MAX_ROWS)
 
     # --- Critical/High Open ---
-    critical_high_open_sql = QUERIES["GLOBAL_CRITICAL_HIGH_OPEN"] if is_global else QUERIES["MARKET_CRITICAL_HIGH_OPEN"]
-    futures[executor.submit(run_sql, critical_high_open_sql, params=None if is_global else market_param)] = "critical_high_open"
+    submit(queries["CRITICAL_HIGH_OPEN"], "critical_high_open", run_sql_arrow, max_results=REPORT_DETAIL_MAX_ROWS)
 
-    # --- Vulns monthly trend ---
-    vuln_tred_query = QUERIES["GLOBAL_MONTHLY_TREND"] if is_global else QUERIES["MARKET_MONTHLY_TREND"]
-    futures[executor.submit(run_sql, vuln_tred_query, params=None if is_global else market_param)] = "vulns_monthly_trend"
-
-    # --- Service monthly trend ---
-    service_tred_query = QUERIES["GLOBAL_SERVICE_MONTHLY_TREND"] if is_global else QUERIES["MARKET_SERVICE_MONTHLY_TREND"]
-    futures[executor.submit(run_sql, service_tred_query, params=None if is_global else market_param)] = "service_monthly_trend"
+    # --- Vulns and service monthly trends (cumulative, from the trend store) ---
+    futures[submit_with_context(executor, trend_store.monthly_trend, markets=scope_values.get("markets"))] = "monthly_trend"
 
     # --- Vulnerability Types ---
-    vuln_types_sql = QUERIES["GLOBAL_VULN_TYPES"] if is_global else QUERIES["MARKET_VULN_TYPES"]
-    futures[executor.submit(run_sql, vuln_types_sql, params=None if is_global else market_param)] = "vuln_types"
+    submit(queries["VULN_TYPES"], "vuln_types")
 
     # --- Average Time to Solve - Closed ---
-    avg_time_closed_sql = QUERIES["GLOBAL_AVERAGE_TIME_PER_SEVERITY_CLOSED"] if is_global else QUERIES["MARKET_AVERAGE_TIME_PER_SEVERITY_CLOSED"]
-    futures[executor.submit(run_sql, avg_time_closed_sql, params=None if is_global else market_param)] = "avg_time_closed"
+    submit(queries["AVERAGE_TIME_PER_SEVERITY_CLOSED"], "avg_time_closed")
 
     # --- Average Time to Solve - Open ---
-    avg_time_open_sql = QUERIES["GLOBAL_AVERAGE_TIME_PER_SEVERITY_OPEN"] if is_global else QUERIES["MARKET_AVERAGE_TIME_PER_SEVERITY_OPEN"]
-    futures[executor.submit(run_sql, avg_time_open_sql, params=None if is_global else market_param)] = "avg_time_open"
+    submit(queries["AVERAGE_TIME_PER_SEVERITY_OPEN"], "avg_time_open")
 
     # --- Counts Total Vulnerabilities ---
-    total_vulnerabilities_sql = QUERIES["GLOBAL_COUNT_TOT_VULNS"] if is_global else QUERIES["MARKET_COUNT_TOT_VULNS"]
-    futures[executor.submit(run_sql, total_vulnerabilities_sql, params=None if is_global else market_param)] = "total_vulnerabilities_count"
+    submit(queries["COUNT_TOT_VULNS"], "total_vulnerabilities_count")
 
     # --- Counts Total Vulnerabilities Open or Closed ---
-    total_vulnerabilities_open_closed_sql = QUERIES["GLOBAL_COUNT_TOT_VULNS_OPEN_CLOSED"] if is_global else QUERIES["MARKET_COUNT_TOT_VULNS_OPEN_CLOSED"]
-    futures[executor.submit(run_sql, total_vulnerabilities_open_closed_sql, params=None if is_global else market_param)] = "open_closed_count"
+    submit(queries["COUNT_TOT_VULNS_OPEN_CLOSED"], "open_closed_count")
 
     # --- Counts Total Vulnerabilities per severity ---
-    total_vulnerabilities_severity_sql = QUERIES["GLOBAL_COUNT_TOT_VULNS_SEVERITY"] if is_global else QUERIES["MARKET_COUNT_TOT_VULNS_SEVERITY"]
-    futures[executor.submit(run_sql, total_vulnerabilities_severity_sql, params=None if is_global else market_param)] = "severities_count"
+    submit(queries["COUNT_TOT_VULNS_SEVERITY"], "severities_count")
 
     # --- Counts Total Vulnerabilities per severity open ---
-    total_vulnerabilities_severity_open_sql = QUERIES["GLOBAL_COUNT_TOT_VULNS_SEVERITY_OPEN"] if is_global else QUERIES["MARKET_COUNT_TOT_VULNS_SEVERITY_OPEN"]
-    futures[executor.submit(run_sql, total_vulnerabilities_severity_open_sql, params=None if is_global else market_param)] = "severities_open_count"
+    submit(queries["COUNT_TOT_VULNS_SEVERITY_OPEN"], "severities_open_count")
 
     # --- Counts Total Vulnerabilities closed to overdue ---
-    total_vulns_close_to_overdue_sql = QUERIES["GLOBAL_COUNT_VULN_CLOSE_OVERDUE"] if is_global else QUERIES["MARKET_COUNT_VULN_CLOSE_OVERDUE"]
-    futures[executor.submit(run_sql, total_vulns_close_to_overdue_sql, params=None if is_global else market_param)] = "vulns_close_to_overdue_count"
+    submit(queries["COUNT_VULN_CLOSE_OVERDUE"], "vulns_close_to_overdue_count")
 
     # --- Counts Total Vulnerabilities Critical/High Open ---
-    total_critical_high_open_sql = QUERIES["GLOBAL_COUNT_CRITICAL_HIGH_OPEN"] if is_global else QUERIES["MARKET_COUNT_CRITICAL_HIGH_OPEN"]
-    futures[executor.submit(run_sql, total_critical_high_open_sql, params=None if is_global else market_param)] = "critical_high_open_count"
+    submit(queries["COUNT_CRITICAL_HIGH_OPEN"], "critical_high_open_count")
 
     # --- Counts Total Vulnerabilities state ---
-    vulns_count_state_sql = QUERIES["GLOBAL_VULNS_STATE_COUNT"] if is_global else QUERIES["MARKET_VULNS_STATE_COUNT"]
-    futures[executor.submit(run_sql, vulns_count_state_sql, params=None if is_global else market_param)] = "vulns_count_state"
+    submit(queries["VULNS_STATE_COUNT"], "vulns_count_state")
 
     # --- Counts Total open substate ---
-    vulns_count_open_substate_sql = QUERIES["GLOBAL_OPEN_SUBSTATE_COUNT"] if is_global else QUERIES["MARKET_OPEN_SUBSTATE_COUNT"]
-    futures[executor.submit(run_sql, vulns_count_open_substate_sql, params=None if is_global else market_param)] = "vulns_count_open_substate"
+    submit(queries["OPEN_SUBSTATE_COUNT"], "vulns_count_open_substate")
 
     # --- Counts Total validating substate ---
-    vulns_count_validating_substate_sql = QUERIES["GLOBAL_VALIDATING_SUBSTATE_COUNT"] if is_global else QUERIES["MARKET_VALIDATING_SUBSTATE_COUNT"]
-    futures[executor.submit(run_sql, vulns_count_validating_substate_sql, params=None if is_global else market_param)] = "vulns_count_validating_substate"
+    submit(queries["VALIDATING_SUBSTATE_COUNT"], "vulns_count_validating_substate")
 
     # --- Counts Total overdue ---
-    vulns_count_overdue_sql = QUERIES["GLOBAL_OVERDUE_COUNT"] if is_global else QUERIES["MARKET_OVERDUE_COUNT"]
-    futures[executor.submit(run_sql, vulns_count_overdue_sql, params=None if is_global else market_param)] = "vulns_count_overdue"
-
-    # Process results as they complete
-    results = {}
-    for future in as_completed(futures):
-        query_name = futures[future]
-        try:
-            results[query_name] = future.result()
-        except Exception as e:
-            print(f"Error running query {query_name}: {e}")
-            results[query_name] = None  # Handle failures gracefully
+    submit(queries["OVERDUE_COUNT"], "vulns_count_overdue")
+
+    REPORT_QUERY_QUEUE.labels(report="overview").inc(len(futures))
+    for future in futures:
+        future.add_done_callback(lambda _: REPORT_QUERY_QUEUE.labels(report="overview").dec())
+
+    # Wait for the sections until the data deadline; late or failed ones are left out
+    left = remaining()
+    timeout = REPORT_DATA_DEADLINE_SECONDS if left is None else min(REPORT_DATA_DEADLINE_SECONDS, left)
+    results, missing = collect_sections(futures, timeout)
+    critical_missing = sorted(CRITICAL_SECTIONS.intersection(missing))
+    if critical_missing:
+        raise Exception(f"Report data unavailable: {', '.join(critical_missing)}")
+    data['missing_sections'] = [name.replace("_", " ") for name in missing]
 
     # --- Assemble Data ---
     # Last update
@@ -407,30 +324,19 @@ def _get_data(market: str):
 
     # Almost Overdue
     almost_overdue_result = results.get("vulns_to_overdue")
-    data['vulns_to_overdue'] = []
-    if almost_overdue_result and almost_overdue_result['rows']:
-        data['vulns_to_overdue'] = [
-            dict(zip(almost_overdue_result['columns'], row))
-            for row in almost_overdue_result['rows']
-        ]
+    data['vulns_to_overdue'] = almost_overdue_result.to_pylist() if almost_overdue_result is not None else []
 
     # Critical/High Open
     critical_high_open_result = results.get("critical_high_open")
-    data["high_critical_open"] = []
-    if critical_high_open_result and critical_high_open_result['rows']:
-        data["high_critical_open"] = [
-            dict(zip(critical_high_open_result['columns'], row))
-            for row in critical_high_open_result['rows']
-        ]
+    data["high_critical_open"] = critical_high_open_result.to_pylist() if critical_high_open_result is not None else []
 
 
     # Vulns monthly trend
-    vulns_trend_result = results.get("vulns_monthly_trend")
-    if vulns_trend_result and vulns_trend_result['rows']:
-        months = [row[0] for row in vulns_trend_result['rows']]
-        counts = [row[2] for row in vulns_trend_result['rows']]
-
-        counts = np.cumsum(counts)
+    trend = results.get("monthly_trend")
+    if trend and trend["months"]:
+        chart_start = time.perf_counter()
+        months = trend["months"]
+        counts = trend["total"]
 
         plt.figure(figsize=(8, 4))
         plt.plot(months, counts, marker='o', linewidth=2)
@@ -460,20 +366,17 @@ def _get_data(market: str):
         plt.close()
 
         data['vulns_trend_img'] = f"data:image/png;base64,{img_base64}"
+        CHART_RENDER_LATENCY.labels(chart="monthly_trend").observe(time.perf_counter() - chart_start)
     else:
         data['vulns_trend_img'] = None
 
     # Service monthly trend
-    service_tred_result = results.get("service_monthly_trend")
-    if service_tred_result and service_tred_result['rows']:
-        months = [row[0] for row in service_tred_result['rows']]
-        black_box = [row[2] for row in service_tred_result['rows']]
-        white_box = [row[3] for row in service_tred_result['rows']]
-        adversary_sim = [row[4] for row in service_tred_result['rows']]
-
-        black_box = np.cumsum(black_box)
-        white_box = np.cumsum(white_box)
-        adversary_sim = np.cumsum(adversary_sim)
+    if trend and trend["months"]:
+        chart_start = time.perf_counter()
+        months = trend["months"]
+        black_box = trend["by_service"]["Black Box"]
+        white_box = trend["by_service"]["White Box"]
+        adversary_sim = trend["by_service"]["Adversary Simulation"]
 
         plt.figure(figsize=(8, 4))
 
@@ -511,6 +414,7 @@ def _get_data(market: str):
         plt.close()
 
         data['services_trend_img'] = f"data:image/png;base64,{img_base64}"
+        CHART_RENDER_LATENCY.labels(chart="service_trend").observe(time.perf_counter() - chart_start)
     else:
         data['services_trend_img'] = None
 
@@ -601,25 +505,41 @@ def _get_data(market: str):
             zip(vulns_close_to_overdue['columns'], vulns_close_to_overdue['rows'][0]))
 
     total_critical_high_open = results.get("critical_high_open_count")
-    data['counts']['critical_high_open'] = total_critical_high_open['rows'][0][0] if tot_vulns else 0
+    data['counts']['critical_high_open'] = (
+        total_critical_high_open['rows'][0][0] if total_critical_high_open and total_critical_high_open['rows'] else 0
+    )
 
     return data
 
 
 def generate_report(market: str) -> str:
     """
-    Generates a PDF report, uploads it to GCS, and returns a
-    time-limited signed URL..
+    Generates a PDF report, stores it (GCS or the local report store) and
+    returns a time-limited download link.
     """
     print(f"Generating report for: {market}")
-    if not gcs_bucket:
+    if not gcs_bucket and not report_store.local:
         raise Exception("GCS_BUCKET_NAME environment variable is not set.")
 
+    markets = None
+    if market.lower() != "global":
+        # Resolve up front: an unknown or ambiguous market goes back to the model
+        markets = resolve_markets(market)
+        market = ", ".join(markets)
+
+    # Asked again (often because the last link expired): a new link to the same PDF
+    reused = report_store.reuse(f"overview:{market}", gcs_bucket, "overview", minutes=5)
+    if reused:
+        return reused
+
     file_name = f"VULNAI_Report_{market.replace(' ', '_')}_{uuid.uuid4()}.pdf"
+    scope = "global" if market.lower() == "global" else "market"
 
     try:
         # 1. Fetch all raw data concurrently
-        report_data = _get_data(market)
+        phase_start = time.time_ns()
+        report_data = _get_data(market, markets)
+        phase_start = _observe_phase("get_data", scope, phase_start)
 
         # 2. Prepare template context
         context = {
@@ -631,27 +551,17 @@ def generate_report(market: str) -> str:
         # 3. Load and render the HTML template
         template = jinja_env.get_template("overview_template.html")
         html_content = template.render(context)
+        phase_start = _observe_phase("render_html", scope, phase_start)
 
-        # 4. Convert HTML to PDF in memory
-        pdf_buffer = io.BytesIO()
-        HTML(string=html_content).write_pdf(pdf_buffer)
-        pdf_buffer.seek(0)
+        # 4+5. Convert HTML to PDF straight into the report store
+        pdf_bytes = report_store.save(gcs_bucket, file_name, HTML(string=html_content).write_pdf, "overview")
+        phase_start = _observe_phase("stream_pdf", scope, phase_start)
+        print(f"Report stored: {file_name} ({pdf_bytes} bytes)")
 
-        # 5. Upload to GCS
-        blob = gcs_bucket.blob(file_name)
-        blob.upload_from_file(
-            pdf_buffer,
-            content_type='application/pdf'
-        )
-
-        print(f"Report uploaded to GCS: {file_name}")
-
-        # 6. Generate a 5-minute signed URL
-        signed_url = blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(minutes=5),
-            method="GET",
-        )
+        # 6. Generate a 5-minute download link
+        signed_url = report_store.link(gcs_bucket, file_name, minutes=5)
+        _observe_phase("sign_url", scope, phase_start)
+        report_store.remember(f"overview:{market}", file_name)
 
         return signed_url
 
@@ -659,17 +569,8 @@ def generate_report(market: str) -> str:
         print(f"Failed to generate report: {e}")
         # Optionally, upload an error report
         error_html = f"<html><body><h1>Failed to generate report for {market}</h1><p>{e}</p></body></html>"
-        pdf_buffer = io.BytesIO()
-        HTML(string=error_html).write_pdf(pdf_buffer)
-        pdf_buffer.seek(0)
-
-        blob = gcs_bucket.blob(file_name)  # Overwrite if partial
-        blob.upload_from_file(pdf_buffer, content_type='application/pdf')
-
-        signed_url = blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(minutes=1),
-            method="GET",
-        )
+        # Overwrite if partial
+        report_store.save(gcs_bucket, file_name, HTML(string=error_html).write_pdf, "error")
+        signed_url = report_store.link(gcs_bucket, file_name, minutes=1)
         # Return the error URL so the user knows something went wrong
         return f"Failed to generate report. Error log: {signed_url}"
\ No newline at end of file
@@ -0,0 +1,414 @@
+import os
+import re
+import hmac
+import time
+import base64
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from email.utils import formatdate
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+from google.api_core import exceptions as api_exceptions
+from google.oauth2 import service_account
+
+from bigquery_client import run_sql
+from query_registry import registry
+from resilience import resilient_call, remaining
+from feature_flags import FULL_PATH_ONLY
+from metrics import REPORT_PDF_BYTES, REPORT_REUSED
+
+# --- Streaming PDF upload and local URL signing ---
+# WeasyPrint writes the PDF straight into a resumable GCS upload: every
+# GCS_UPLOAD_CHUNK_BYTES written go out as one chunk while the rest of the
+# document is still being serialized, so there is no full in-memory PDF, no
+# second upload buffer and no separate upload phase. The session is driven
+# through the documented resumable upload protocol (the session URL needs no
+# other credentials): the object is committed only by the final request, and
+# a failed render cancels the session, so a truncated PDF is never stored.
+# Signed URLs are made locally with the service account key, loaded once.
+
+# Resumable upload chunk size, a multiple of 256 KiB
+GCS_UPLOAD_CHUNK_BYTES = int(os.getenv("GCS_UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+# Key used to sign report URLs locally; defaults to the GCS client's key
+REPORT_SIGNING_KEY_PATH = os.getenv("REPORT_SIGNING_KEY_PATH", os.getenv("GOOGLE_APPLICATION_CREDENTIALS", ""))
+
+_UPLOAD_CHUNK_ALIGN = 256 * 1024
+# Sends the upload chunks; the session URL is its own authorization
+upload_transport = requests.Session()
+
+
+def _chunk_size() -> int:
+    return max(_UPLOAD_CHUNK_ALIGN, GCS_UPLOAD_CHUNK_BYTES // _UPLOAD_CHUNK_ALIGN * _UPLOAD_CHUNK_ALIGN)
+
+
+class _CountingWriter:
+    """Write-only stream that counts the bytes passed on to `target`."""
+
+    def __init__(self, target):
+        self.target = target
+        self.written = 0
+
+    def write(self, data) -> int:
+        self.written += len(data)
+        return self.target.write(data)
+
+    def flush(self):
+        pass
+
+
+class _ResumableWriter:
+    """
+    Write-only stream over a GCS resumable upload session: full chunks are
+    sent as they fill up, finish() sends the rest and commits the object,
+    abort() cancels the session. Nothing is committed before finish().
+    """
+
+    def __init__(self, session_url: str, chunk_size: int, transport):
+        self.session_url = session_url
+        self.chunk_size = chunk_size
+        self.written = 0
+        self._transport = transport
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def write(self, data) -> int:
+        self._buffer += data
+        self.written += len(data)
+        while len(self._buffer) >= self.chunk_size:
+            self._put(bytes(self._buffer[:self.chunk_size]), last=False)
+            del self._buffer[:self.chunk_size]
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def _put(self, data: bytes, last: bool):
+        total = str(self._offset + len(data)) if last else "*"
+        sent = f"{self._offset}-{self._offset + len(data) - 1}" if data else "*"
+        response = self._transport.put(
+            self.session_url, data=data, headers={"Content-Range": f"bytes {sent}/{total}"}, timeout=remaining() or 60,
+        )
+        # 308 = chunk stored, upload incomplete; 200/201 = object committed
+        if response.status_code not in ((200, 201) if last else (308,)):
+            raise api_exceptions.from_http_status(response.status_code, f"Report upload failed: {response.text[:200]}")
+        self._offset += len(data)
+
+    def finish(self):
+        self._put(bytes(self._buffer), last=True)
+        self._buffer.clear()
+
+    def abort(self):
+        try:
+            self._transport.delete(self.session_url, timeout=10)
+        except Exception as e:
+            # An unfinished session is never committed and expires on its own
+            print(f"Could not cancel the report upload: {e}")
+
+
+def stream_pdf(blob, write_pdf: Callable[[Any], None], report: str) -> int:
+    """
+    Runs write_pdf(stream) with a resumable upload of `blob` as the stream
+    and returns the size of the uploaded PDF. Transient GCS errors re-render
+    from the start (behind the GCS circuit breaker).
+    """
+    def upload() -> int:
+        session_url = blob.create_resumable_upload_session(content_type="application/pdf", timeout=remaining() or 60)
+        writer = _ResumableWriter(session_url, _chunk_size(), upload_transport)
+        try:
+            write_pdf(writer)
+            writer.finish()
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.written
+
+    size = resilient_call("gcs", upload)
+    REPORT_PDF_BYTES.labels(report=report).observe(size)
+    return size
+
+
+_signing_lock = threading.Lock()
+_signing_kwargs: Dict[str, Any] = {}
+_signing_loaded = False
+
+
+def _signing_credentials() -> Dict[str, Any]:
+    """Signing arguments for generate_signed_url: the local key when there is one, else the client's own."""
+    global _signing_loaded, _signing_kwargs
+    with _signing_lock:
+        if not _signing_loaded:
+            if REPORT_SIGNING_KEY_PATH and os.path.exists(REPORT_SIGNING_KEY_PATH):
+                credentials = service_account.Credentials.from_service_account_file(REPORT_SIGNING_KEY_PATH)
+                _signing_kwargs = {"credentials": credentials}
+                print("Report URLs are signed locally with the service account key.")
+            else:
+                print("No signing key found; report URLs are signed by the storage client.")
+            _signing_loaded = True
+        return _signing_kwargs
+
+
+def sign_url(blob, minutes: int = 5) -> str:
+    """A V4 GET URL for `blob` that expires after `minutes`."""
+    return blob.generate_signed_url(
+        version="v4",
+        expiration=timedelta(minutes=minutes),
+        method="GET",
+        **_signing_credentials(),
+    )
+
+
+# --- Report store and download links ---
+# With REPORT_DOWNLOAD_BASE_URL set, report links point at the server's own
+# /v1/reports/{id} endpoint (reached through nginx's /mcp/ location) instead
+# of GCS signed URLs. The link carries an HMAC token that expires like the
+# signed URL did, the PDF is streamed from the store with ETag and Range
+# support, and a report asked for again within REPORT_REUSE_SECONDS gets a
+# new link to the stored PDF instead of being rendered again, as long as the
+# data has not been reloaded since (update_history).
+# REPORT_STORE=local keeps the PDFs on disk and does not need GCS at all.
+
+# "gcs" or "local"
+REPORT_STORE = os.getenv("REPORT_STORE", "gcs").lower()
+REPORT_LOCAL_DIR = os.getenv("REPORT_LOCAL_DIR", "/tmp/vulnai_reports")
+# Local reports older than this are deleted
+REPORT_LOCAL_RETENTION_HOURS = float(os.getenv("REPORT_LOCAL_RETENTION_HOURS", "24"))
+# Public prefix of the MCP server, e.g. https://vulnai.vitobonetti.nl/mcp; empty keeps signed GCS URLs
+REPORT_DOWNLOAD_BASE_URL = os.getenv("REPORT_DOWNLOAD_BASE_URL", "").rstrip("/")
+# HMAC key for download tokens; random per process when empty (links do not survive a restart)
+REPORT_LINK_SECRET = os.getenv("REPORT_LINK_SECRET", "")
+# The same report requested again within this window reuses the stored PDF; 0 always renders
+REPORT_REUSE_SECONDS = 0 if FULL_PATH_ONLY else int(os.getenv("REPORT_REUSE_SECONDS", "900"))
+# Seconds between update_history checks for reuse
+REPORT_VERSION_CHECK_SECONDS = int(os.getenv("REPORT_VERSION_CHECK_SECONDS", "60"))
+# GCS report stats (size, ETag) kept for downloads, least recently used dropped first
+REPORT_STAT_CACHE_SIZE = int(os.getenv("REPORT_STAT_CACHE_SIZE", "256"))
+
+# Report ids are the generated file names
+_REPORT_ID = re.compile(r"^[\w,\-]+\.pdf$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    The (first, last) byte of a single-range Range header. None means send
+    the whole file (no header, or one this server ignores, such as several
+    ranges); ValueError means the range cannot be satisfied (416).
+    """
+    match = _RANGE.match((header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        if int(last) == 0 or size == 0:
+            raise ValueError("Unsatisfiable range.")
+        return max(0, size - int(last)), size - 1
+    if last and int(last) < int(first):
+        return None
+    if int(first) >= size:
+        raise ValueError("Unsatisfiable range.")
+    return int(first), min(int(last), size - 1) if last else size - 1
+
+
+def etag_matches(header: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison)."""
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in [t.removeprefix("W/") for t in tags]
+
+
+class ReportStore:
+    """Where report PDFs are kept (GCS or a local directory) and how links to them are made."""
+
+    def __init__(self):
+        self.local = REPORT_STORE == "local"
+        self.endpoint_links = bool(REPORT_DOWNLOAD_BASE_URL) or self.local
+        self._secret = REPORT_LINK_SECRET.encode() or secrets.token_bytes(32)
+        # key ("overview:Italy") -> (report id, stored at, data version)
+        self._recent: Dict[str, Tuple[str, float, Any]] = {}
+        self._version = None
+        self._checked_at = 0.0
+        # report id -> size, etag, last_modified of GCS reports; a stored report
+        # never changes, but can be deleted (local stats are read every time)
+        self._stats: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        if self.local:
+            os.makedirs(REPORT_LOCAL_DIR, exist_ok=True)
+        if self.endpoint_links and not REPORT_DOWNLOAD_BASE_URL:
+            print("REPORT_DOWNLOAD_BASE_URL is not set; report links are relative to the server.")
+        if self.endpoint_links and not REPORT_LINK_SECRET:
+            print("REPORT_LINK_SECRET is not set; report links stop working when the server restarts.")
+
+    def _path(self, report_id: str) -> str:
+        return os.path.join(REPORT_LOCAL_DIR, os.path.basename(report_id))
+
+    def _forget(self, report_id: str):
+        with self._lock:
+            self._stats.pop(report_id, None)
+
+    def _prune(self):
+        cutoff = time.time() - REPORT_LOCAL_RETENTION_HOURS * 3600
+        for entry in os.scandir(REPORT_LOCAL_DIR):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    self._forget(entry.name)
+            except FileNotFoundError:
+                pass
+
+    def save(self, bucket, report_id: str, write_pdf: Callable[[Any], None], report: str) -> int:
+        """Runs write_pdf(stream) into the store and returns the size of the PDF."""
+        self._forget(report_id)
+        if not self.local:
+            return stream_pdf(bucket.blob(report_id), write_pdf, report)
+
+        path = self._path(report_id)
+        partial = f"{path}.part"
+        try:
+            with open(partial, "wb") as f:
+                counting = _CountingWriter(f)
+                write_pdf(counting)
+            # Readers only ever see a complete PDF
+            os.replace(partial, path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        REPORT_PDF_BYTES.labels(report=report).observe(counting.written)
+        self._prune()
+        return counting.written
+
+    def _token(self, report_id: str, expires: int) -> str:
+        digest = hmac.new(self._secret, f"{report_id}:{expires}".encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+    def verify(self, report_id: str, expires: int, token: str) -> bool:
+        """True for an unexpired token made by link()."""
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._token(report_id, expires), token)
+
+    def link(self, bucket, report_id: str, minutes: int = 5) -> str:
+        """A download link for a stored report that expires after `minutes`."""
+        if not self.endpoint_links:
+            return sign_url(bucket.blob(report_id), minutes=minutes)
+        expires = int(time.time()) + minutes * 60
+        token = self._token(report_id, expires)
+        return f"{REPORT_DOWNLOAD_BASE_URL}/v1/reports/{quote(report_id)}?expires={expires}&token={token}"
+
+    def _data_version(self) -> Any:
+        now = time.time()
+        with self._lock:
+            if self._version is not None and now - self._checked_at < REPORT_VERSION_CHECK_SECONDS:
+                return self._version
+        rows = run_sql(registry.get("LAST_UPDATE").sql)["rows"]
+        with self._lock:
+            self._version = str(rows[0][0]) if rows else None
+            self._checked_at = now
+            return self._version
+
+    def remember(self, key: str, report_id: str):
+        """Records a successfully stored report for reuse()."""
+        if REPORT_REUSE_SECONDS <= 0:
+            return
+        try:
+            version = self._data_version()
+        except Exception as e:
+            print(f"Report {report_id} not kept for reuse: {e}")
+            return
+        with self._lock:
+            now = time.time()
+            self._recent = {k: v for k, v in self._recent.items() if now - v[1] < REPORT_REUSE_SECONDS}
+            self._recent[key] = (report_id, now, version)
+
+    def reuse(self, key: str, bucket, report: str, minutes: int = 5) -> Optional[str]:
+        """
+        A new link to the report stored for `key`, if it is within the reuse
+        window and was built from the current data.
+        """
+        if REPORT_REUSE_SECONDS <= 0:
+            return None
+        with self._lock:
+            recent = self._recent.get(key)
+        if not recent or time.time() - recent[1] >= REPORT_REUSE_SECONDS:
+            return None
+        try:
+            if self._data_version() != recent[2]:
+                return None
+        except Exception as e:
+            print(f"Report reuse skipped: {e}")
+            return None
+        if self.local and not os.path.exists(self._path(recent[0])):
+            return None
+        REPORT_REUSED.labels(report=report).inc()
+        print(f"Reusing stored report {recent[0]} for {key}")
+        return self.link(bucket, recent[0], minutes=minutes)
+
+    def stat(self, bucket, report_id: str) -> Optional[Dict[str, Any]]:
+        """Size, ETag and Last-Modified of a stored report, None if there is no such report."""
+        if not _REPORT_ID.match(report_id):
+            return None
+        if self.local:
+            # A stat is as cheap as a cache lookup, and sees pruned files
+            try:
+                st = os.stat(self._path(report_id))
+            except FileNotFoundError:
+                return None
+            return {
+                "size": st.st_size,
+                "etag": f'"{st.st_size:x}-{st.st_mtime_ns:x}"',
+                "last_modified": formatdate(st.st_mtime, usegmt=True),
+            }
+
+        with self._lock:
+            if report_id in self._stats:
+                self._stats.move_to_end(report_id)
+                return self._stats[report_id]
+        blob = resilient_call("gcs", lambda: bucket.get_blob(report_id, timeout=remaining() or 60))
+        if blob is None:
+            self._forget(report_id)
+            return None
+        stored = {
+            "size": blob.size,
+            "etag": f'"{blob.etag}"',
+            "last_modified": formatdate(blob.updated.timestamp(), usegmt=True),
+        }
+        with self._lock:
+            self._stats[report_id] = stored
+            while len(self._stats) > REPORT_STAT_CACHE_SIZE:
+                self._stats.popitem(last=False)
+        return stored
+
+    def read(self, bucket, report_id: str, first: int, last: int) -> Iterator[bytes]:
+        """Bytes first..last (inclusive) of a stored report, in upload-sized chunks."""
+        chunk = _chunk_size()
+        if self.local:
+            with open(self._path(report_id), "rb") as f:
+                f.seek(first)
+                left = last - first + 1
+                while left > 0:
+                    data = f.read(min(chunk, left))
+                    if not data:
+                        break
+                    left -= len(data)
+                    yield data
+            return
+
+        blob = bucket.blob(report_id)
+        for start in range(first, last + 1, chunk):
+            end = min(start + chunk, last + 1) - 1
+            try:
+                yield resilient_call("gcs", lambda: blob.download_as_bytes(start=start, end=end))
+            except api_exceptions.NotFound:
+                # Deleted since its stat was cached (e.g. by a bucket lifecycle rule)
+                self._forget(report_id)
+                raise
+
+
+report_store = ReportStore()
@@ -0,0 +1,348 @@
+import os
+import time
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.api_core import exceptions as api_exceptions
+
+from metrics import RESILIENCE_RETRIES, RESILIENCE_HEDGES, RESILIENCE_TIMEOUTS, CIRCUIT_STATE, CIRCUIT_REJECTED
+from tracing import submit_with_context
+
+# --- Resilience layer ---
+# Deadlines travel with the call (a context variable that submit_with_context
+# carries into worker threads), so a BigQuery job started for a chat tool or
+# a report section is bounded by the time its caller has left. Transient
+# errors are retried with jittered backoff, slow report queries are hedged
+# with a duplicate request, and per-dependency circuit breakers fail fast
+# while BigQuery or GCS is degraded.
+
+# Per-tool deadlines in seconds, e.g. "run_sql=60,generate_report=180"
+TOOL_TIMEOUTS = os.getenv(
+    "TOOL_TIMEOUTS",
+    "run_sql=60,list_tables=15,get_table_schema=15,top_vulnerabilities=30,market_overview=60,generate_report=180,application_report=180",
+)
+TOOL_DEFAULT_TIMEOUT_SECONDS = float(os.getenv("TOOL_DEFAULT_TIMEOUT_SECONDS", "60"))
+# Deadline of a single report query, and of the whole report data fan-out
+REPORT_QUERY_TIMEOUT_SECONDS = float(os.getenv("REPORT_QUERY_TIMEOUT_SECONDS", "45"))
+REPORT_DATA_DEADLINE_SECONDS = float(os.getenv("REPORT_DATA_DEADLINE_SECONDS", "90"))
+
+# Retries for transient errors (full jitter exponential backoff)
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.5"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "8"))
+
+# Hedging: a duplicate request once the first is slower than this quantile of recent calls
+HEDGE_ENABLED = os.getenv("HEDGE_ENABLED", "true").lower() == "true"
+HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "2"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "8"))
+
+# Circuit breakers: consecutive transient failures before opening, and seconds before a trial call
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+
+class DeadlineExceeded(TimeoutError):
+    """The caller's deadline passed before the operation finished."""
+
+
+class CircuitOpen(Exception):
+    """A dependency is failing; calls are rejected until its breaker lets a trial through."""
+
+
+# --- Deadlines ---
+
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+def _parse_timeouts(raw: str) -> Dict[str, float]:
+    timeouts = {}
+    for item in raw.split(","):
+        if "=" in item:
+            tool, seconds = item.split("=", 1)
+            timeouts[tool.strip()] = float(seconds)
+    return timeouts
+
+
+_TOOL_TIMEOUTS = _parse_timeouts(TOOL_TIMEOUTS)
+
+
+def tool_timeout(tool_name: str) -> float:
+    return _TOOL_TIMEOUTS.get(tool_name, TOOL_DEFAULT_TIMEOUT_SECONDS)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Bounds everything inside the block by `seconds` (never extends an outer deadline)."""
+    new = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(new if current is None else min(current, new))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is none."""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+def check_deadline(what: str):
+    left = remaining()
+    if left is not None and left <= 0:
+        RESILIENCE_TIMEOUTS.labels(operation=what).inc()
+        raise DeadlineExceeded(f"{what} ran out of time.")
+
+
+# --- Retries ---
+
+_TRANSIENT_ERRORS = (
+    api_exceptions.TooManyRequests,
+    api_exceptions.InternalServerError,
+    api_exceptions.BadGateway,
+    api_exceptions.ServiceUnavailable,
+    api_exceptions.GatewayTimeout,
+    ConnectionError,
+)
+# BigQuery reports quota and backend trouble as 403/400 with these reasons
+_TRANSIENT_REASONS = {"rateLimitExceeded", "backendError", "internalError", "jobBackendError"}
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, DeadlineExceeded):
+        return False
+    if isinstance(error, _TRANSIENT_ERRORS):
+        return True
+    reasons = {e.get("reason") for e in getattr(error, "errors", None) or [] if isinstance(e, dict)}
+    return bool(reasons & _TRANSIENT_REASONS)
+
+
+def retry_call(operation: str, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Calls fn, retrying transient errors with jittered backoff while the deadline allows it."""
+    for attempt in range(1, RETRY_MAX_ATTEMPTS + 1):
+        check_deadline(operation)
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == RETRY_MAX_ATTEMPTS or not is_transient(e):
+                raise
+            delay = random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1)))
+            left = remaining()
+            if left is not None and delay >= left:
+                raise
+            RESILIENCE_RETRIES.labels(operation=operation).inc()
+            print(f"{operation} failed ({e}); retry {attempt}/{RETRY_MAX_ATTEMPTS - 1} in {delay:.2f}s.")
+            time.sleep(delay)
+
+
+# --- Circuit breakers ---
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD,
+                 reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(dependency=name).set(0)
+
+    def _set_state(self, state: str):
+        self.state = state
+        CIRCUIT_STATE.labels(dependency=self.name).set({"closed": 0, "half_open": 1, "open": 2}[state])
+
+    def _before_call(self) -> bool:
+        """Returns True when this call is the half-open trial."""
+        with self._lock:
+            if self.state == "closed":
+                return False
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_seconds:
+                self._set_state("half_open")
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+        CIRCUIT_REJECTED.labels(dependency=self.name).inc()
+        raise CircuitOpen(f"{self.name} is unavailable right now (circuit open). Try again later.")
+
+    def _after_call(self, trial: bool, failed: bool):
+        with self._lock:
+            if trial:
+                self._trial_running = False
+            if not failed:
+                self.failures = 0
+                if self.state != "closed":
+                    print(f"Circuit {self.name} closed.")
+                    self._set_state("closed")
+                return
+            self.failures += 1
+            if trial or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"Circuit {self.name} opened after {self.failures} failures.")
+                self._set_state("open")
+                self.opened_at = time.monotonic()
+
+    def call(self, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        trial = self._before_call()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            # Only backend trouble counts: a bad query from the model, or one that
+            # ran out of its caller's deadline, says nothing about BigQuery's health
+            self._after_call(trial, failed=is_transient(e))
+            raise
+        self._after_call(trial, failed=False)
+        return result
+
+
+breakers = {
+    "bigquery": CircuitBreaker("bigquery"),
+    "gcs": CircuitBreaker("gcs"),
+}
+
+
+def resilient_call(dependency: str, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Retries around a circuit-breaker-guarded call to `dependency`."""
+    return retry_call(dependency, breakers[dependency].call, fn, *args, **kwargs)
+
+
+# --- Hedged requests ---
+
+class LatencyTracker:
+    """Recent call durations per operation, for the hedge delay."""
+
+    def __init__(self, size: int = 200):
+        self.size = size
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float):
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.size)).append(seconds)
+
+    def quantile(self, name: str, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+latencies = LatencyTracker()
+# Set inside the duplicate of a hedged call, which must start its own job
+_hedge_attempt: ContextVar[bool] = ContextVar("hedge_attempt", default=False)
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+
+
+def is_hedge_attempt() -> bool:
+    """True in the duplicate request of a hedged call (it must not join the original's in-flight work)."""
+    return _hedge_attempt.get()
+
+
+def _run_as_hedge(fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    _hedge_attempt.set(True)  # Only this worker's copy of the context
+    return fn(*args, **kwargs)
+
+
+def _start_primary(fn: Callable, *args: Any, **kwargs: Any) -> Future:
+    """
+    Runs the first attempt of a hedged call on a thread of its own, started at
+    once with the caller's context. Only duplicates queue for the bounded
+    hedge executor, so hedging never caps how many calls run at a time and
+    queueing never counts toward the hedge delay.
+    """
+    future: Future = Future()
+    context = copy_context()
+
+    def run():
+        try:
+            future.set_result(context.run(fn, *args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+
+    future.set_running_or_notify_cancel()
+    threading.Thread(target=run, name="hedge-primary", daemon=True).start()
+    return future
+
+
+def hedged_call(name: str, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """
+    Runs fn (idempotent reads only). If it is still running after the recent
+    HEDGE_QUANTILE latency of `name`, a duplicate is started and the first
+    successful result wins. Without enough samples fn just runs in the
+    calling thread.
+    """
+    start = time.perf_counter()
+    delay = latencies.quantile(name, HEDGE_QUANTILE) if HEDGE_ENABLED else None
+    if delay is None:
+        result = fn(*args, **kwargs)
+        latencies.observe(name, time.perf_counter() - start)
+        return result
+
+    delay = max(delay, HEDGE_MIN_DELAY_SECONDS)
+    left = remaining()
+    # The caller has to be free to return the duplicate's result, so it waits instead of running fn
+    pending = {_start_primary(fn, *args, **kwargs)}
+    done, pending = wait(pending, timeout=delay if left is None else max(0, min(delay, left)))
+    if not done and (left is None or left > delay):
+        RESILIENCE_HEDGES.labels(operation=name).inc()
+        pending.add(submit_with_context(_hedge_executor, _run_as_hedge, fn, *args, **kwargs))
+
+    error: Optional[BaseException] = None
+    while True:
+        for future in done:
+            if future.exception() is None:
+                latencies.observe(name, time.perf_counter() - start)
+                return future.result()
+            error = future.exception()
+        if not pending:
+            raise error
+        left = remaining()
+        if left is not None and left <= 0:
+            RESILIENCE_TIMEOUTS.labels(operation=name).inc()
+            raise DeadlineExceeded(f"{name} ran out of time.")
+        done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+
+
+def report_query(name: str, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+    """One report section: bounded by REPORT_QUERY_TIMEOUT_SECONDS and hedged on the tail."""
+    with deadline(REPORT_QUERY_TIMEOUT_SECONDS):
+        return hedged_call(f"report.{name}", fn, *args, **kwargs)
+
+
+# --- Partial results ---
+
+def collect_sections(futures: Dict[Future, str], timeout: float) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Waits up to `timeout` for report sections. Sections that failed or did
+    not finish in time come back as None and are listed as missing.
+    """
+    results: Dict[str, Any] = {}
+    missing: List[str] = []
+    done, late = wait(futures, timeout=timeout)
+    for future in done:
+        name = futures[future]
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            print(f"Error running query {name}: {e}")
+            results[name] = None
+            missing.append(name)
+    for future in late:
+        name = futures[future]
+        future.cancel()
+        RESILIENCE_TIMEOUTS.labels(operation=f"report.{name}").inc()
+        print(f"Query {name} did not finish within {timeout}s; rendering without it.")
+        results[name] = None
+        missing.append(name)
+    return results, sorted(missing)
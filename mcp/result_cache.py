@@ -0,0 +1,56 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from metrics import RESULT_CACHE_HITS, PREFETCH_USED
+from singleflight import copy_result
+
+# --- Query result cache ---
+# Holds results that were fetched ahead of time (see prefetch.py) so the
+# run_sql call that follows is answered without a job. Entries expire after
+# RESULT_CACHE_TTL_SECONDS; the data itself changes once a day.
+
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "300"))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512"))
+
+
+class ResultCache:
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # key -> [result, stored_at, used]
+        self._entries: "OrderedDict[Hashable, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[1] > self.ttl_seconds:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            first_use = not entry[2]
+            entry[2] = True
+        RESULT_CACHE_HITS.inc()
+        if first_use:
+            PREFETCH_USED.inc()
+        return copy_result(entry[0])
+
+    def contains(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and time.time() - entry[1] <= self.ttl_seconds
+
+    def put(self, key: Hashable, result: Any):
+        with self._lock:
+            self._entries[key] = [result, time.time(), False]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+result_cache = ResultCache(RESULT_CACHE_TTL_SECONDS, RESULT_CACHE_MAX_ENTRIES)
@@ -0,0 +1,224 @@
+import os
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime, date
+
+from bigquery_client import run_sql
+from singleflight import normalize_sql
+from sql_repair import sql_repairer
+from metrics import SQL_REPAIRS, LLM_TURNS_AVOIDED
+
+# --- Result shaping limits (tool results sent to the LLM) ---
+# Hard ceiling pushed down into the SQL when the query has no LIMIT of its own
+SQL_ROW_LIMIT = int(os.getenv("SQL_ROW_LIMIT", "1000"))
+# Rows fetched from BigQuery and shown to the model (matches the "first 30" rule)
+TOOL_RESULT_MAX_ROWS = int(os.getenv("TOOL_RESULT_MAX_ROWS", "30"))
+# Payload caps applied after the rows are fetched
+TOOL_RESULT_MAX_BYTES = int(os.getenv("TOOL_RESULT_MAX_BYTES", "32768"))
+TOOL_RESULT_MAX_TOKENS = int(os.getenv("TOOL_RESULT_MAX_TOKENS", "8000"))
+# Long free-text cells (descriptions, comments, recommendations) are clipped
+TOOL_RESULT_MAX_CELL_CHARS = int(os.getenv("TOOL_RESULT_MAX_CELL_CHARS", "400"))
+
+# Rough chars-per-token ratio for Gemini on mixed English/JSON text
+CHARS_PER_TOKEN = 4
+
+_TRAILING_LIMIT_RE = re.compile(
+    r"\bLIMIT\s+(\d+)(\s+OFFSET\s+\d+)?\s*$",
+    re.IGNORECASE
+)
+# A -- or # comment to the end of the line; quoted text is matched first so it is kept
+_LINE_COMMENT_RE = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)|(?:--|#).*$""")
+
+
+def json_serial(obj):
+    """JSON serializer for objects not serializable by default json code"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    return str(obj)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate, good enough for budgeting payloads."""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _drop_line_comment(line: str) -> str:
+    return _LINE_COMMENT_RE.sub(lambda m: m.group(1) or "", line)
+
+
+def _strip_sql_tail(sql: str) -> str:
+    """Removes trailing whitespace, semicolons and line comments, including one after the last clause."""
+    lines = sql.rstrip().splitlines()
+    while lines and not _drop_line_comment(lines[-1]).strip():
+        lines.pop()
+    if lines:
+        lines[-1] = _drop_line_comment(lines[-1])
+    return "\n".join(lines).rstrip().rstrip(";").rstrip()
+
+
+def inject_limit(sql: str, limit: int = SQL_ROW_LIMIT) -> Tuple[str, Optional[int]]:
+    """
+    Pushes a LIMIT down into the outermost query.
+
+    An existing trailing LIMIT is kept if it is smaller than `limit`,
+    otherwise it is lowered. Returns the rewritten SQL and the injected limit
+    (None when the query's own LIMIT was kept).
+    """
+    cleaned = _strip_sql_tail(sql)
+    match = _TRAILING_LIMIT_RE.search(cleaned)
+    if match:
+        current = int(match.group(1))
+        if current <= limit:
+            return cleaned, None
+        offset = match.group(2) or ""
+        return f"{cleaned[:match.start()]}LIMIT {limit}{offset}", limit
+    return f"{cleaned}\nLIMIT {limit}", limit
+
+
+def _clip_cell(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > TOOL_RESULT_MAX_CELL_CHARS:
+        return value[:TOOL_RESULT_MAX_CELL_CHARS] + "…"
+    if isinstance(value, list):
+        return [_clip_cell(v) for v in value]
+    return value
+
+
+def _payload_size(payload: Dict[str, Any]) -> Tuple[int, int]:
+    text = json.dumps(payload, default=json_serial)
+    return len(text.encode("utf-8")), estimate_tokens(text)
+
+
+def shape_result(
+        result: Dict[str, Any],
+        max_rows: int = TOOL_RESULT_MAX_ROWS,
+        max_bytes: int = TOOL_RESULT_MAX_BYTES,
+        max_tokens: int = TOOL_RESULT_MAX_TOKENS,
+        row_limit: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Trims a run_sql result to a preview that fits the row, byte and token caps.
+
+    The returned payload always carries `total_rows` (rows in the full result)
+    and `returned_rows` so the model can say "first 30 of N" without a second
+    COUNT query.
+    """
+    columns: List[str] = result.get("columns", [])
+    rows: List[List[Any]] = [[_clip_cell(c) for c in row] for row in result.get("rows", [])[:max_rows]]
+    total_rows = result.get("total_rows")
+    if total_rows is None:
+        total_rows = len(result.get("rows", []))
+
+    payload = {
+        "columns": columns,
+        "rows": rows,
+        "total_rows": total_rows,
+        "returned_rows": len(rows),
+        "truncated": total_rows > len(rows),
+    }
+    # If the pushed-down LIMIT was hit, the real total can be larger
+    if row_limit is not None and total_rows >= row_limit:
+        payload["total_rows_is_lower_bound"] = True
+
+    size_bytes, size_tokens = _payload_size(payload)
+    if size_bytes <= max_bytes and size_tokens <= max_tokens:
+        return payload
+
+    # Binary search for the largest row prefix that fits both caps
+    low, high = 0, len(rows)
+    while low < high:
+        mid = (low + high + 1) // 2
+        payload["rows"] = rows[:mid]
+        size_bytes, size_tokens = _payload_size(payload)
+        if size_bytes <= max_bytes and size_tokens <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+
+    payload["rows"] = rows[:low]
+    payload["returned_rows"] = low
+    payload["truncated"] = total_rows > low
+    payload["note"] = f"Preview trimmed to {low} rows to fit the tool result size limit."
+    return payload
+
+
+def model_query(sql: str, max_results: Optional[int] = None) -> Tuple[str, int, Optional[int]]:
+    """The SQL, preview size and injected limit that run_sql_for_model uses for `sql`."""
+    preview_rows = TOOL_RESULT_MAX_ROWS
+    if max_results:
+        preview_rows = max(1, min(int(max_results), TOOL_RESULT_MAX_ROWS))
+    limited_sql, row_limit = inject_limit(sql, SQL_ROW_LIMIT)
+    return limited_sql, preview_rows, row_limit
+
+
+def _run_for_model(sql: str, max_results: Optional[int]) -> Dict[str, Any]:
+    limited_sql, preview_rows, row_limit = model_query(sql, max_results)
+    result = run_sql(limited_sql, max_results=preview_rows)
+    return shape_result(result, max_rows=preview_rows, row_limit=row_limit)
+
+
+def _found_nothing(payload: Dict[str, Any]) -> bool:
+    """
+    No rows at all. A zero COUNT is a legitimate answer far more often than a
+    case mismatch, and is not worth a second query.
+    """
+    return payload["total_rows"] == 0
+
+
+def _run_repaired(repair: Tuple[str, List[str]], max_results: Optional[int]) -> Dict[str, Any]:
+    """Runs a repaired query; the payload tells the model what was changed."""
+    repaired_sql, changes = repair
+    payload = _run_for_model(repaired_sql, max_results)
+    payload["repaired"] = "; ".join(changes)
+    payload["repaired_sql"] = normalize_sql(repaired_sql)
+    return payload
+
+
+def _repaired(kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    SQL_REPAIRS.labels(kind=kind, result="fixed").inc()
+    LLM_TURNS_AVOIDED.labels(reason="sql_repair").inc()
+    print(f"SQL repaired locally: {payload['repaired']}")
+    return payload
+
+
+def run_sql_for_model(sql: str, max_results: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Tool entry point for LLM-generated SQL: pushes a LIMIT down, fetches only
+    the preview rows and shapes the payload before it reaches the model.
+    Table names are qualified first; failing queries and empty case-sensitive
+    LIKE filters are repaired and retried once locally (see sql_repair.py)
+    before the model has to.
+    """
+    sql, table_changes = sql_repairer.qualify(sql)
+    try:
+        payload = _run_for_model(sql, max_results)
+    except Exception as e:
+        repair = sql_repairer.repair(sql, e)
+        if repair is None:
+            raise
+        try:
+            payload = _run_repaired((repair[0], table_changes + repair[1]), max_results)
+        except Exception as retry_error:
+            SQL_REPAIRS.labels(kind="error", result="failed").inc()
+            print(f"Repaired SQL failed too ({'; '.join(repair[1])}): {retry_error}")
+            raise e
+        return _repaired("error", payload)
+
+    if _found_nothing(payload):
+        repair = sql_repairer.relax_like(sql)
+        if repair:
+            try:
+                relaxed = _run_repaired((repair[0], table_changes + repair[1]), max_results)
+            except Exception as e:
+                print(f"Case-insensitive LIKE retry failed: {e}")
+                relaxed = None
+            if relaxed and not _found_nothing(relaxed):
+                return _repaired("like_case", relaxed)
+            SQL_REPAIRS.labels(kind="like_case", result="failed").inc()
+    if table_changes:
+        payload["repaired"] = "; ".join(table_changes)
+        payload["repaired_sql"] = normalize_sql(sql)
+        return _repaired("table", payload)
+    return payload
@@ -0,0 +1,222 @@
+import os
+import time
+import threading
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bigquery_client import run_sql, run_sql_arrow
+from query_registry import registry
+from market_resolver import resolve_markets
+
+# --- Precomputed risk layer ---
+# individual_risk_score and kpi_category are computed once per load in
+# update_history (queries/RISK_BASE.sql) and kept as numpy columns. The
+# application report's risk tables and the top-K lists ("closest to overdue",
+# "open longest") per market and service are answered from memory.
+
+# Seconds between update_history checks
+RISK_CHECK_SECONDS = int(os.getenv("RISK_CHECK_SECONDS", "60"))
+# Entries kept per top-K list (and the largest `limit` a caller can ask for)
+RISK_TOPK_SIZE = int(os.getenv("RISK_TOPK_SIZE", "10"))
+
+OPEN_STATES = ["New", "Open", "Validating"]
+INACTIVE_STATES = ["Closed", "Parked"]
+
+TOPK_COLUMNS = [
+    "id", "description", "market", "service", "severity", "state", "sub_state",
+    "open_days", "remaining_days", "vuln_url",
+]
+
+GroupKey = Tuple[Optional[str], Optional[str]]
+
+
+def _round2(value: Any) -> Optional[float]:
+    """ROUND(x, 2) as BigQuery does it (half away from zero); NULL stays None."""
+    if value is None or value != value:
+        return None
+    return float(Decimal(repr(float(value))).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+
+
+def _python(value: Any) -> Any:
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _isin(column: np.ndarray, values: List[str]) -> np.ndarray:
+    allowed = set(values)
+    return np.fromiter((v in allowed for v in column), dtype=bool, count=len(column))
+
+
+def _notin(column: np.ndarray, values: List[str]) -> np.ndarray:
+    """`NOT IN` semantics: a NULL value matches neither IN nor NOT IN."""
+    excluded = set(values)
+    return np.fromiter((v is not None and v not in excluded for v in column), dtype=bool, count=len(column))
+
+
+def _mean(scores: np.ndarray) -> Optional[float]:
+    """SUM(score) / COUNT(score), NULL when no row has a score."""
+    scored = scores[~np.isnan(scores)]
+    return _round2(scored.sum() / len(scored)) if len(scored) else None
+
+
+# Top-K definitions: which rows qualify and the column they are ranked by
+TOPK_INDEXES = {
+    "closest_to_overdue": {
+        "description": "Open vulnerabilities that are not overdue yet, fewest remaining days first",
+        "eligible": lambda c: c["open"] & c["not_overdue"] & ~np.isnan(c["remaining_days"]),
+        "rank_by": "remaining_days",
+        "descending": False,
+    },
+    "open_longest": {
+        "description": "Open vulnerabilities with the most days open first",
+        "eligible": lambda c: c["open"] & ~np.isnan(c["total_open_days"]),
+        "rank_by": "total_open_days",
+        "descending": True,
+    },
+}
+
+
+class RiskLayer:
+    def __init__(self):
+        self.columns: Dict[str, np.ndarray] = {}
+        self.topk: Dict[str, Dict[GroupKey, List[int]]] = {}
+        self.version = None
+        self._answers: Dict[Any, Dict[str, Any]] = {}
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, np.ndarray]:
+        table = run_sql_arrow(registry.get("RISK_BASE").sql)
+        columns = {name: table.column(name).to_numpy(zero_copy_only=False) for name in table.column_names}
+        for name in ("individual_risk_score", "total_open_days", "time_to_solve_days", "remaining_days"):
+            columns[name] = np.array([np.nan if v is None else v for v in columns[name]], dtype=np.float64)
+        # `NOT is_overdue` semantics: a NULL flag is neither overdue nor safely not overdue
+        columns["not_overdue"] = np.array([v is not None and not v for v in columns["is_overdue"]], dtype=bool)
+        columns["open"] = _isin(columns["state"], OPEN_STATES)
+        return columns
+
+    def _build_topk(self, columns: Dict[str, np.ndarray]) -> Dict[str, Dict[GroupKey, List[int]]]:
+        """One ranked list per (market, service), per market, per service and overall."""
+        indexes = {}
+        for name, spec in TOPK_INDEXES.items():
+            candidates = np.flatnonzero(spec["eligible"](columns))
+            keys = columns[spec["rank_by"]][candidates]
+            order = candidates[np.argsort(-keys if spec["descending"] else keys, kind="stable")]
+            lists: Dict[GroupKey, List[int]] = {}
+            for i in order:
+                market, service = columns["market"][i], columns["service"][i]
+                for group in ((market, service), (market, None), (None, service), (None, None)):
+                    entries = lists.setdefault(group, [])
+                    if len(entries) < RISK_TOPK_SIZE:
+                        entries.append(int(i))
+            indexes[name] = lists
+        return indexes
+
+    def refresh(self, force: bool = False):
+        """Reloads the risk base when update_history has a new entry."""
+        with self._lock:
+            now = time.time()
+            if not force and self.columns and now - self._checked_at < RISK_CHECK_SECONDS:
+                return
+            last_update = run_sql(registry.get("LAST_UPDATE").sql)["rows"]
+            version = last_update[0][0] if last_update else None
+            self._checked_at = now
+            if not force and self.columns and version == self.version:
+                return
+
+            columns = self._load()
+            self.topk = self._build_topk(columns)
+            self.columns = columns
+            self._answers = {}
+            self.version = version
+            print(f"Risk layer loaded ({len(columns['id'])} vulnerabilities).")
+
+    def _answer(self, key: Any, compute) -> Dict[str, Any]:
+        self.refresh()
+        answers = self._answers
+        if key not in answers:
+            answers[key] = compute(self.columns)
+        return answers[key]
+
+    def active_risk(self, services: List[str], active_only: bool = True) -> Dict[str, Any]:
+        """
+        Vulnerability count and average risk score per kpi_category plus a Total row.
+        With active_only=False closed and parked vulnerabilities are included too.
+        """
+        def compute(c):
+            mask = _isin(c["service"], services)
+            if active_only:
+                mask &= _notin(c["state"], INACTIVE_STATES)
+            categories, scores = c["kpi_category"][mask], c["individual_risk_score"][mask]
+            rows = []
+            for category in (None, "High", "Low"):
+                in_category = np.fromiter((v == category for v in categories), dtype=bool, count=len(categories))
+                if in_category.any():
+                    rows.append([category, int(in_category.sum()), _mean(scores[in_category])])
+            rows.append(["Total", int(mask.sum()), _mean(scores)])
+            return {"columns": ["kpi_category", "total_active_vulnerabilities", "average_risk_score"], "rows": rows}
+
+        return self._answer(("active_risk", tuple(services), active_only), compute)
+
+    def vuln_type_risk(self, services: List[str]) -> Dict[str, Any]:
+        """Count and average risk score per vuln_type (Info excluded), highest risk first, Total last."""
+        def compute(c):
+            mask = _isin(c["service"], services)
+            mask &= np.fromiter(
+                (s is not None and s != "Info" and t is not None for s, t in zip(c["severity"], c["vuln_type"])),
+                dtype=bool, count=len(mask),
+            )
+            types, scores = c["vuln_type"][mask], c["individual_risk_score"][mask]
+            rows = []
+            for vuln_type in sorted(set(types)):
+                in_type = types == vuln_type
+                rows.append([vuln_type, int(in_type.sum()), _mean(scores[in_type])])
+            # average_risk_score DESC, NULLs last
+            rows.sort(key=lambda r: (r[2] is None, -(r[2] or 0)))
+            rows.append(["Total", int(mask.sum()), _mean(scores)])
+            return {"columns": ["vuln_type", "total_active_vulnerabilities", "average_risk_score"], "rows": rows}
+
+        return self._answer(("vuln_type_risk", tuple(services)), compute)
+
+    def top_k(self, index: str, markets: Optional[List[str]] = None, service: Optional[str] = None,
+              limit: int = 5) -> Dict[str, Any]:
+        """The first `limit` entries of a top-K index for a market set (None = all) and service."""
+        if index not in TOPK_INDEXES:
+            raise ValueError(f"Unknown index '{index}'. Use one of: {', '.join(TOPK_INDEXES)}.")
+        limit = max(1, min(int(limit), RISK_TOPK_SIZE))
+        self.refresh()
+        columns, lists = self.columns, self.topk[index]
+
+        if markets:
+            # Each market's list is already ranked; merge them and re-rank
+            spec = TOPK_INDEXES[index]
+            picked = [i for m in set(markets) for i in lists.get((m, service), [])]
+            picked.sort(key=lambda i: columns[spec["rank_by"]][i], reverse=spec["descending"])
+        else:
+            picked = lists.get((None, service), [])
+
+        rows = [
+            [
+                _python(columns["id"][i]), columns["description"][i], columns["market"][i], columns["service"][i],
+                columns["severity"][i], columns["state"][i], columns["sub_state"][i],
+                _round2(columns["total_open_days"][i]), _round2(columns["remaining_days"][i]),
+                columns["vuln_url"][i],
+            ]
+            for i in picked[:limit]
+        ]
+        return {"columns": TOPK_COLUMNS, "rows": rows}
+
+
+risk_layer = RiskLayer()
+
+
+def top_vulnerabilities(index: str, market: str = "global", service: Optional[str] = None, limit: int = 5) -> Dict[str, Any]:
+    """Tool entry point: a ready-made top-K list for 'global' or a market (set)."""
+    markets = None if not market or market.lower() == "global" else resolve_markets(market)
+    result = risk_layer.top_k(index, markets=markets, service=service, limit=limit)
+    result["index"] = index
+    result["description"] = TOPK_INDEXES[index]["description"]
+    return result
@@ -0,0 +1,250 @@
+import os
+import math
+import time
+import uuid
+import ipaddress
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+from feature_flags import enabled
+from metrics import SCHED_IN_FLIGHT, SCHED_QUEUED, SCHED_QUEUE_WAIT, SCHED_REJECTED
+
+# --- Workload scheduler ---
+# Chat tools run in separate concurrency pools: interactive queries, schema
+# lookups and reports. A burst of reports can fill its own (small) pool and
+# queue but never the slots that interactive run_sql calls use. Report query
+# fan-out shares one bounded executor instead of 20 threads per report.
+# Per-user token buckets cap chat and report rates. Anything that cannot be
+# admitted raises Overloaded, which the server turns into 429 + Retry-After.
+
+# Concurrent tool calls per pool
+SCHED_INTERACTIVE_CONCURRENCY = int(os.getenv("SCHED_INTERACTIVE_CONCURRENCY", "8"))
+SCHED_SCHEMA_CONCURRENCY = int(os.getenv("SCHED_SCHEMA_CONCURRENCY", "4"))
+SCHED_REPORT_CONCURRENCY = int(os.getenv("SCHED_REPORT_CONCURRENCY", "2"))
+# Calls allowed to wait for a slot before new ones are rejected
+SCHED_INTERACTIVE_QUEUE = int(os.getenv("SCHED_INTERACTIVE_QUEUE", "32"))
+SCHED_SCHEMA_QUEUE = int(os.getenv("SCHED_SCHEMA_QUEUE", "16"))
+SCHED_REPORT_QUEUE = int(os.getenv("SCHED_REPORT_QUEUE", "4"))
+# Longest wait for a slot (seconds)
+SCHED_INTERACTIVE_QUEUE_TIMEOUT = float(os.getenv("SCHED_INTERACTIVE_QUEUE_TIMEOUT", "10"))
+SCHED_SCHEMA_QUEUE_TIMEOUT = float(os.getenv("SCHED_SCHEMA_QUEUE_TIMEOUT", "10"))
+SCHED_REPORT_QUEUE_TIMEOUT = float(os.getenv("SCHED_REPORT_QUEUE_TIMEOUT", "30"))
+# Threads shared by all report query fan-outs
+SCHED_REPORT_QUERY_WORKERS = int(os.getenv("SCHED_REPORT_QUERY_WORKERS", "20"))
+# Threads for interactive fan-outs (market_overview sections), kept apart from reports
+SCHED_INTERACTIVE_QUERY_WORKERS = int(os.getenv("SCHED_INTERACTIVE_QUERY_WORKERS", "16"))
+
+# Per-user rate limits (token buckets: sustained rate + burst)
+RATE_LIMIT_ENABLED = enabled("RATE_LIMIT_ENABLED")
+RATE_LIMIT_CHAT_PER_MINUTE = float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "20"))
+RATE_LIMIT_CHAT_BURST = int(os.getenv("RATE_LIMIT_CHAT_BURST", "5"))
+RATE_LIMIT_REPORTS_PER_HOUR = float(os.getenv("RATE_LIMIT_REPORTS_PER_HOUR", "10"))
+RATE_LIMIT_REPORTS_BURST = int(os.getenv("RATE_LIMIT_REPORTS_BURST", "2"))
+# Buckets kept per limiter; the longest idle ones are dropped first
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "10000"))
+# Addresses/networks (comma-separated) whose identity headers are believed: Open WebUI and nginx.
+# Empty trusts nobody; every request is then its own user.
+TRUSTED_PROXIES = os.getenv("TRUSTED_PROXIES", "")
+
+# Tool name -> pool; tools not listed are interactive
+TOOL_POOLS = {
+    "list_tables": "schema",
+    "get_table_schema": "schema",
+    "generate_report": "report",
+    "application_report": "report",
+}
+
+
+class Overloaded(Exception):
+    """A request that cannot be admitted now; retry_after is in seconds."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: int):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Takes one token. Returns 0 when admitted, otherwise the seconds until a token is available."""
+        self.refill(time.monotonic())
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 3600.0
+
+
+class RateLimiter:
+    """One token bucket per user, at most max_users of them (least recently used dropped first)."""
+
+    def __init__(self, name: str, rate_per_second: float, capacity: int, max_users: int = RATE_LIMIT_MAX_USERS):
+        self.name = name
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.max_users = max_users
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, user: str):
+        if not RATE_LIMIT_ENABLED:
+            return
+        key = rate_limit_key(user)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                while len(self._buckets) >= self.max_users:
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take()
+        if wait > 0:
+            SCHED_REJECTED.labels(pool=self.name, reason="rate_limit").inc()
+            raise Overloaded(f"Rate limit exceeded for {self.name}. Try again later.", wait)
+
+
+class WorkloadPool:
+    def __init__(self, name: str, concurrency: int, queue_size: int, queue_timeout: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        # Smoothed call duration, used for the Retry-After estimate
+        self.avg_seconds = 1.0
+        self._cond = threading.Condition()
+
+    def _retry_after(self) -> float:
+        return self.avg_seconds * (self.queued + 1) / self.concurrency
+
+    @contextmanager
+    def slot(self):
+        with self._cond:
+            if self.in_flight >= self.concurrency:
+                if self.queued >= self.queue_size:
+                    SCHED_REJECTED.labels(pool=self.name, reason="queue_full").inc()
+                    raise Overloaded(f"The {self.name} queue is full.", self._retry_after())
+                self.queued += 1
+                SCHED_QUEUED.labels(pool=self.name).inc()
+                wait_start = time.perf_counter()
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while self.in_flight >= self.concurrency:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            SCHED_REJECTED.labels(pool=self.name, reason="queue_timeout").inc()
+                            raise Overloaded(f"Timed out waiting for a {self.name} slot.", self._retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self.queued -= 1
+                    SCHED_QUEUED.labels(pool=self.name).dec()
+                    SCHED_QUEUE_WAIT.labels(pool=self.name).observe(time.perf_counter() - wait_start)
+            else:
+                SCHED_QUEUE_WAIT.labels(pool=self.name).observe(0)
+            self.in_flight += 1
+            SCHED_IN_FLIGHT.labels(pool=self.name).inc()
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self.avg_seconds = 0.8 * self.avg_seconds + 0.2 * (time.perf_counter() - start)
+                self.in_flight -= 1
+                SCHED_IN_FLIGHT.labels(pool=self.name).dec()
+                self._cond.notify()
+
+
+class Scheduler:
+    def __init__(self):
+        self.pools = {
+            "interactive": WorkloadPool("interactive", SCHED_INTERACTIVE_CONCURRENCY, SCHED_INTERACTIVE_QUEUE, SCHED_INTERACTIVE_QUEUE_TIMEOUT),
+            "schema": WorkloadPool("schema", SCHED_SCHEMA_CONCURRENCY, SCHED_SCHEMA_QUEUE, SCHED_SCHEMA_QUEUE_TIMEOUT),
+            "report": WorkloadPool("report", SCHED_REPORT_CONCURRENCY, SCHED_REPORT_QUEUE, SCHED_REPORT_QUEUE_TIMEOUT),
+        }
+        self.chat_limiter = RateLimiter("chat", RATE_LIMIT_CHAT_PER_MINUTE / 60, RATE_LIMIT_CHAT_BURST)
+        self.report_limiter = RateLimiter("report", RATE_LIMIT_REPORTS_PER_HOUR / 3600, RATE_LIMIT_REPORTS_BURST)
+        self.report_query_executor = ThreadPoolExecutor(
+            max_workers=SCHED_REPORT_QUERY_WORKERS, thread_name_prefix="report-query"
+        )
+        self.interactive_query_executor = ThreadPoolExecutor(
+            max_workers=SCHED_INTERACTIVE_QUERY_WORKERS, thread_name_prefix="interactive-query"
+        )
+
+    def admit_chat(self, user: str):
+        """Per-user chat rate limit, checked before any Gemini call."""
+        self.chat_limiter.check(user)
+
+    def run_tool(self, tool_name: str, user: str, fn: Callable, **kwargs: Any) -> Any:
+        """Runs a chat tool inside its pool (and the report rate limit for reports)."""
+        pool_name = TOOL_POOLS.get(tool_name, "interactive")
+        if pool_name == "report":
+            self.report_limiter.check(user)
+        with self.pools[pool_name].slot():
+            return fn(**kwargs)
+
+
+scheduler = Scheduler()
+
+
+def _parse_networks(raw: str) -> List[Any]:
+    networks = []
+    for item in raw.split(","):
+        if item.strip():
+            try:
+                networks.append(ipaddress.ip_network(item.strip(), strict=False))
+            except ValueError:
+                print(f"Ignoring invalid TRUSTED_PROXIES entry: {item.strip()}")
+    return networks
+
+
+_TRUSTED_NETWORKS = _parse_networks(TRUSTED_PROXIES)
+
+
+def _trusted(client_host: Optional[str]) -> bool:
+    try:
+        address = ipaddress.ip_address(client_host or "")
+    except ValueError:
+        return False
+    return any(address in network for network in _TRUSTED_NETWORKS)
+
+
+def user_key(headers: Any, client_host: Optional[str]) -> str:
+    """
+    Identifies the caller for rate limits and pending reports. The Open WebUI
+    user headers and X-Forwarded-For are only believed from TRUSTED_PROXIES
+    (nginx strips the user headers, so only Open WebUI can set them); the
+    OpenAI `user` field is whatever the client wrote and is not used. Without
+    a trusted identity the request gets a key of its own: behind a proxy every
+    user shares its address, and a shared key would also share their pending
+    reports. Rate limits still apply to the address (see rate_limit_key).
+    """
+    if _trusted(client_host):
+        for header in ("x-openwebui-user-id", "x-openwebui-user-email"):
+            if headers.get(header):
+                return f"user:{headers[header]}"
+        forwarded = headers.get("x-forwarded-for")
+        if forwarded:
+            # The hop nginx added: the last address before the trusted proxy
+            return f"ip:{forwarded.split(',')[-1].strip()}"
+    return f"request:{client_host or 'unknown'}/{uuid.uuid4().hex}"
+
+
+def rate_limit_key(user: str) -> str:
+    """The bucket a caller is limited by: requests without a trusted identity share their client address's."""
+    if user.startswith("request:"):
+        return "ip:" + user[len("request:"):].rsplit("/", 1)[0]
+    return user
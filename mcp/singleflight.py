@@ -0,0 +1,92 @@
+import re
+import json
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Dict, Hashable, Optional
+
+from feature_flags import enabled
+from metrics import BQ_COALESCED_CALLS, BQ_COALESCED_WAITERS
+from resilience import remaining, is_hedge_attempt, DeadlineExceeded
+
+# --- Request coalescing (singleflight) ---
+# Identical queries that arrive while the same query is already running
+# (several users asking the same dashboard question, two reports for one
+# market) wait for that job and share its result instead of starting their
+# own BigQuery job. Nothing is kept once the job has finished: this is not a
+# cache, only de-duplication of work that is in flight. The duplicate of a
+# hedged call always runs its own job: joining the slow original would make
+# the hedge pointless.
+
+SINGLEFLIGHT_ENABLED = enabled("SINGLEFLIGHT_ENABLED")
+
+# String literals, quoted identifiers and backquoted table names are kept as written
+_QUOTED = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapses whitespace outside quoted text and drops trailing semicolons."""
+    parts = _QUOTED.split(sql.strip().rstrip(";").strip())
+    return "".join(part if i % 2 else _SPACE.sub(" ", part) for i, part in enumerate(parts)).strip()
+
+
+def query_key(sql: str, params: Optional[Dict[str, Any]], *extra: Any) -> str:
+    """Coalescing key: normalized SQL, parameters and whatever else shapes the result."""
+    return json.dumps([normalize_sql(sql), params or {}, *extra], sort_keys=True, default=str)
+
+
+def copy_result(result: Any) -> Any:
+    # Row payloads are plain dicts/lists; each caller gets its own containers
+    if isinstance(result, dict):
+        return {k: list(v) if isinstance(v, list) else v for k, v in result.items()}
+    return result
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"leaders": 0, "followers": 0}
+
+    def coalescing_ratio(self) -> float:
+        """Share of calls that were answered by another caller's job."""
+        with self._lock:
+            total = self.stats["leaders"] + self.stats["followers"]
+            return self.stats["followers"] / total if total else 0.0
+
+    def do(self, key: Hashable, fn: Callable, *args: Any, **kwargs: Any) -> Any:
+        """Runs fn(*args, **kwargs) unless the same key is in flight, then waits for that call."""
+        if not SINGLEFLIGHT_ENABLED or is_hedge_attempt():
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self.stats["leaders"] += 1
+            else:
+                self.stats["followers"] += 1
+        BQ_COALESCED_CALLS.labels(source=self.name, role="leader" if leader else "follower").inc()
+
+        if leader:
+            try:
+                call.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                call.set_exception(e)
+            finally:
+                with self._lock:
+                    del self._calls[key]
+            return call.result()
+
+        BQ_COALESCED_WAITERS.labels(source=self.name).inc()
+        try:
+            # Followers keep their own deadline, whatever the leader's is
+            return copy_result(call.result(timeout=remaining()))
+        except FutureTimeoutError:
+            if call.done():
+                raise  # The leader's own error
+            raise DeadlineExceeded("Timed out waiting for an identical query that is already running.")
+        finally:
+            BQ_COALESCED_WAITERS.labels(source=self.name).dec()
@@ -0,0 +1,178 @@
+import os
+import re
+import difflib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from bigquery_client import get_table_schema, MIRROR_TABLES, BG_LAST_UPDATE
+from resilience import DeadlineExceeded
+from metrics import SQL_REPAIRS
+from feature_flags import enabled
+
+# --- Local SQL repair ---
+# A misspelled column or a bare table name makes run_sql fail, and the error
+# costs a full Gemini turn (often more) to fix. Table names are qualified and
+# corrected against the dataset's tables before the query runs. When it still
+# fails, the unknown name from the error message is matched against the
+# columns of the tables the query reads (cached schemas, loaded on demand) and
+# the repaired query is retried once; if that fails too, the model gets the
+# original error. A case-sensitive LIKE that finds nothing is retried
+# case-insensitively.
+
+SQL_REPAIR_ENABLED = enabled("SQL_REPAIR_ENABLED")
+# Minimum difflib ratio between a wrong name and its replacement
+SQL_REPAIR_MIN_SIMILARITY = float(os.getenv("SQL_REPAIR_MIN_SIMILARITY", "0.75"))
+
+# Strings and backticked identifiers are left alone when replacing names
+_QUOTED = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|`[^`]*`)")
+# String literals only: table references may be backticked
+_STRING = re.compile(r"('(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\")")
+_TABLE_REF = re.compile(r"\b(FROM|JOIN)\s+(`[^`]+`|[A-Za-z_][\w\-]*(?:\.[\w\-]+)*)", re.IGNORECASE)
+_UNKNOWN_NAME = [
+    re.compile(r"Unrecognized name: (\w+)"),                     # BigQuery
+    re.compile(r"Name (\w+) not found inside"),                  # BigQuery, qualified column
+    re.compile(r"Field name (\w+) does not exist"),              # BigQuery, STRUCT field
+    re.compile(r"Referenced column \"(\w+)\" not found"),        # DuckDB (local mirror)
+]
+# EXTRACT(DAY FROM ts) is not a table reference
+_DATE_PART = re.compile(r"\b(YEAR|ISOYEAR|QUARTER|MONTH|WEEK|ISOWEEK|DAY|DAYOFWEEK|DAYOFYEAR|HOUR|MINUTE|SECOND|DATE|TIME)\s*$", re.IGNORECASE)
+_CTE_NAME = re.compile(r"\b(\w+)\s+AS\s*\(", re.IGNORECASE)
+_LIKE = re.compile(r"(?<![\w(])([A-Za-z_][\w.]*)\s+(NOT\s+)?LIKE\s+('(?:[^'\\]|\\.)*')", re.IGNORECASE)
+
+Repair = Tuple[str, List[str]]
+
+
+def _replace_unquoted(sql: str, pattern: re.Pattern, replacement) -> Tuple[str, int]:
+    """pattern.subn on the parts of `sql` outside strings and backticks."""
+    parts, total = [], 0
+    for i, part in enumerate(_QUOTED.split(sql)):
+        if i % 2 == 0:
+            part, count = pattern.subn(replacement, part)
+            total += count
+        parts.append(part)
+    return "".join(parts), total
+
+
+def _close_match(name: str, candidates: List[str]) -> Optional[str]:
+    lowered = {c.lower(): c for c in candidates}
+    if name.lower() in lowered:
+        return lowered[name.lower()]
+    match = difflib.get_close_matches(name.lower(), list(lowered), n=1, cutoff=SQL_REPAIR_MIN_SIMILARITY)
+    return lowered[match[0]] if match else None
+
+
+class SqlRepairer:
+    def __init__(self, tables: List[str]):
+        self.tables = list(dict.fromkeys(tables))
+        # table -> column names (None when the schema could not be loaded)
+        self._columns: Dict[str, Optional[List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, schemas: Dict[str, Dict[str, Any]]):
+        """Seeds the column cache with schemas that were loaded at startup."""
+        with self._lock:
+            for table, schema in schemas.items():
+                self._columns[table] = [c["name"] for c in schema.get("schema", [])]
+
+    def _table_columns(self, table: str) -> List[str]:
+        with self._lock:
+            if table in self._columns:
+                return self._columns[table] or []
+        try:
+            columns = [c["name"] for c in get_table_schema(table)["schema"]]
+        except Exception as e:
+            print(f"SQL repair could not load the schema of {table}: {e}")
+            columns = None
+        with self._lock:
+            self._columns[table] = columns
+        return columns or []
+
+    def _known_table(self, reference: str) -> Optional[str]:
+        """The dataset table a FROM/JOIN reference means: exact, by table name, or by a close spelling."""
+        name = reference.strip("`")
+        if name in self.tables:
+            return name
+        by_short_name = {t.rsplit(".", 1)[-1]: t for t in self.tables}
+        match = _close_match(name.rsplit(".", 1)[-1], list(by_short_name))
+        return by_short_name[match] if match else None
+
+    def _fix_references(self, code: str, ctes: set, read: List[str], changes: List[str]) -> str:
+        """Qualifies and corrects the FROM/JOIN references in SQL text outside string literals."""
+        fixed_sql, parts = [], _TABLE_REF.split(code)
+        # split() with two groups yields: text, keyword, reference, text, ...
+        fixed_sql.append(parts[0])
+        for i in range(1, len(parts), 3):
+            keyword, reference, rest = parts[i], parts[i + 1], parts[i + 2]
+            skip = reference.lower() in ctes or _DATE_PART.search(parts[i - 1])
+            table = None if skip else self._known_table(reference)
+            if table:
+                read.append(table)
+                if reference != f"`{table}`" and reference != table:
+                    changes.append(f"{reference} -> `{table}`")
+                    reference = f"`{table}`"
+            fixed_sql.append(f"{keyword} {reference}{rest}")
+        return "".join(fixed_sql)
+
+    def _fix_tables(self, sql: str, changes: List[str]) -> Tuple[str, List[str]]:
+        """Qualifies and corrects table references; returns the SQL and the tables it reads."""
+        read: List[str] = []
+        # '... from state_open ...' in a filter is text, not a table
+        segments = _STRING.split(sql)
+        ctes = {name.lower() for name in _CTE_NAME.findall(" ".join(segments[::2]))}
+        fixed = [
+            segment if i % 2 else self._fix_references(segment, ctes, read, changes)
+            for i, segment in enumerate(segments)
+        ]
+        return "".join(fixed), read
+
+    def qualify(self, sql: str) -> Repair:
+        """
+        The query with bare, partly qualified or misspelled dataset tables
+        replaced by their full names, and the list of changes.
+        """
+        changes: List[str] = []
+        if not SQL_REPAIR_ENABLED:
+            return sql, changes
+        fixed, _ = self._fix_tables(sql, changes)
+        return fixed, changes
+
+    def repair(self, sql: str, error: Exception) -> Optional[Repair]:
+        """A corrected query and what was changed, or None when there is nothing to fix."""
+        if not SQL_REPAIR_ENABLED or isinstance(error, DeadlineExceeded):
+            return None
+        changes: List[str] = []
+        fixed, read = self._fix_tables(sql, changes)
+
+        message = str(error)
+        unknown = next((m.group(1) for p in _UNKNOWN_NAME for m in [p.search(message)] if m), None)
+        if unknown:
+            columns = [c for table in read for c in self._table_columns(table)]
+            column = _close_match(unknown, columns)
+            if column and column != unknown:
+                fixed, count = _replace_unquoted(fixed, re.compile(rf"\b{re.escape(unknown)}\b"), column)
+                if count:
+                    changes.append(f"{unknown} -> {column}")
+
+        if not changes:
+            SQL_REPAIRS.labels(kind="error", result="no_fix").inc()
+            return None
+        return fixed, changes
+
+    def relax_like(self, sql: str) -> Optional[Repair]:
+        """The query with case-sensitive LIKE filters made case-insensitive, None if it has none."""
+        if not SQL_REPAIR_ENABLED:
+            return None
+        changes: List[str] = []
+
+        def lower(m: re.Match) -> str:
+            if not re.search(r"[A-Za-z]", m.group(3)):
+                return m.group(0)
+            changes.append(f"{m.group(1)} LIKE -> LOWER({m.group(1)}) LIKE")
+            return f"LOWER({m.group(1)}) {m.group(2) or ''}LIKE LOWER({m.group(3)})"
+
+        # LIKE patterns are string literals, so this pattern runs on the whole text
+        fixed = _LIKE.sub(lower, sql)
+        return (fixed, changes) if changes else None
+
+
+sql_repairer = SqlRepairer(MIRROR_TABLES + [BG_LAST_UPDATE])
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The server modules are flat and import each other by top-level name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
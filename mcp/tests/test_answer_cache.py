@@ -0,0 +1,76 @@
+import re
+
+import pytest
+
+import answer_cache as answer_cache_module
+from answer_cache import AnswerCache, question_parts
+
+MARKETS = ["Italy", "Spain"]
+SEVERITIES = ["Critical", "High"]
+
+
+def fake_entities(message):
+    def named(values):
+        return [v for v in values if re.search(rf"\b{v}\b", message, re.IGNORECASE)]
+    return {"markets": named(MARKETS), "services": [], "severities": named(SEVERITIES)}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    version = {"value": "2025-01-01"}
+    monkeypatch.setattr(answer_cache_module, "detect_entities", fake_entities)
+    monkeypatch.setattr(answer_cache_module, "run_sql", lambda sql: {"rows": [[version["value"]]]})
+    monkeypatch.setattr(answer_cache_module, "ANSWER_CACHE_VERSION_CHECK_SECONDS", 0)
+    monkeypatch.setattr(answer_cache_module, "ANSWER_CACHE_EMBEDDING_MODEL", "")
+    cache = AnswerCache()
+    cache.version = version
+    return cache
+
+
+def test_rephrased_question_hits(cache):
+    cache.put("What is the KPI status for Italy?", "answer")
+    assert cache.get("KPI status for italy, please") == "answer"
+
+
+def test_other_market_misses(cache):
+    cache.put("What is the KPI status for Italy?", "answer")
+    assert cache.get("What is the KPI status for Spain?") is None
+
+
+def test_negation_misses(cache):
+    cache.put("How many Critical vulnerabilities have been open for more than ninety days and are overdue?", "overdue")
+    assert cache.get("How many Critical vulnerabilities have been open for more than ninety days and are not overdue?") is None
+    assert cache.get("How many Critical vulnerabilities have been open for more than ninety days and aren't overdue?") is None
+
+
+def test_comparison_misses(cache):
+    cache.put("How many High vulnerabilities are open for more than 30 days in Italy?", "more")
+    assert cache.get("How many High vulnerabilities are open for less than 30 days in Italy?") is None
+    assert cache.get("How many High vulnerabilities are open more than 30 days in Italy") == "more"
+
+
+def test_data_reload_invalidates(cache):
+    cache.put("What is the KPI status for Italy?", "answer")
+    cache.version["value"] = "2025-01-02"
+    assert cache.get("What is the KPI status for Italy?") is None
+
+
+def test_expired_entries_miss(cache, monkeypatch):
+    cache.put("What is the KPI status for Italy?", "answer")
+    monkeypatch.setattr(answer_cache_module, "ANSWER_CACHE_TTL_SECONDS", -1)
+    assert cache.get("What is the KPI status for Italy?") is None
+
+
+def test_follow_ups_are_not_cacheable(cache):
+    assert cache.is_cacheable("What is the KPI status for Italy?", earlier_user_turns=0)
+    assert not cache.is_cacheable("And for Spain?", earlier_user_turns=1)
+    assert not cache.is_cacheable("Why is that?", earlier_user_turns=2)
+
+
+def test_question_parts_split_qualifiers(monkeypatch):
+    monkeypatch.setattr(answer_cache_module, "detect_entities", fake_entities)
+    entities, numbers, qualifiers, words = question_parts("Critical vulns in Italy open over 30 days, not parked")
+    assert entities["markets"] == ["Italy"] and entities["severities"] == ["Critical"]
+    assert numbers == ("30",)
+    assert qualifiers == ("not", "over")
+    assert "not" not in words and "parked" in words
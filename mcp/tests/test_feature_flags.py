@@ -0,0 +1,23 @@
+import feature_flags
+import scheduler
+from feature_flags import enabled
+
+
+def test_enabled_reads_the_environment(monkeypatch):
+    monkeypatch.setenv("SOME_FEATURE_ENABLED", "false")
+    assert not enabled("SOME_FEATURE_ENABLED")
+    assert enabled("OTHER_FEATURE_ENABLED")
+    assert not enabled("OTHER_FEATURE_ENABLED", default="false")
+
+
+def test_full_path_only_turns_features_off(monkeypatch):
+    monkeypatch.setattr(feature_flags, "FULL_PATH_ONLY", True)
+    monkeypatch.setenv("SOME_FEATURE_ENABLED", "true")
+    assert not enabled("SOME_FEATURE_ENABLED")
+
+
+def test_rate_limits_can_be_turned_off(monkeypatch):
+    limiter = scheduler.RateLimiter("chat", 0.0, 1)
+    monkeypatch.setattr(scheduler, "RATE_LIMIT_ENABLED", False)
+    for _ in range(5):
+        limiter.check("user:a")
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from prometheus_client import REGISTRY
+
+import bigquery_client
+from metrics import current_tool_labels, scope_for_tool, tool_labels
+from tracing import submit_with_context
+
+
+@pytest.mark.parametrize("tool, args, scope", [
+    ("run_sql", {"sql": "SELECT * FROM t WHERE market = 'Italy'"}, "market"),
+    ("run_sql", {"sql": "SELECT * FROM t WHERE LOWER(market) LIKE '%ital%'"}, "market"),
+    ("run_sql", {"sql": "SELECT * FROM t WHERE market IN UNNEST(@markets)"}, "market"),
+    ("run_sql", {"sql": "SELECT market, COUNT(*) FROM t GROUP BY market"}, "global"),
+    ("generate_report", {"market": "global"}, "global"),
+    ("generate_report", {"market": "Italy"}, "market"),
+    ("application_report", {}, "application"),
+    ("list_tables", {}, "none"),
+])
+def test_scope_for_tool(tool, args, scope):
+    assert scope_for_tool(tool, args) == scope
+
+
+def test_tool_labels_follow_worker_threads():
+    assert current_tool_labels() == {"tool": "none", "scope": "none"}
+    with ThreadPoolExecutor(max_workers=1) as executor, tool_labels("generate_report", "market"):
+        labels = submit_with_context(executor, current_tool_labels).result()
+    assert labels == {"tool": "generate_report", "scope": "market"}
+    assert current_tool_labels() == {"tool": "none", "scope": "none"}
+
+
+class FakeJob:
+    job_id = "job-1"
+    total_bytes_processed = 1234
+    cache_hit = False
+
+
+class FakeClient:
+    def query(self, sql, job_config=None, timeout=None):
+        return FakeJob()
+
+
+def test_bigquery_metrics_carry_the_tool(monkeypatch):
+    monkeypatch.setattr(bigquery_client, "get_bq_client", lambda: FakeClient())
+    labels = {"tool": "top_vulnerabilities", "scope": "market"}
+    before = REGISTRY.get_sample_value("mcp_bq_bytes_processed_total", labels) or 0
+    with tool_labels("top_vulnerabilities", "market"):
+        bigquery_client._run_job_once("SELECT 1", None, lambda job, timeout: ({"rows": []}, 0), "rows")
+    assert REGISTRY.get_sample_value("mcp_bq_bytes_processed_total", labels) == before + 1234
+    assert REGISTRY.get_sample_value("mcp_bq_query_latency_seconds_count", dict(labels, status="ok")) >= 1
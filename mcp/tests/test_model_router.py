@@ -0,0 +1,39 @@
+import pytest
+
+from model_router import classify
+
+
+@pytest.mark.parametrize("message", [
+    "How many open Critical vulnerabilities in Italy?",
+    "What is the KPI for Spain?",
+    "Number of overdue vulns in Germany",
+    "What percentage of High findings are closed in Italy?",
+    "Average time to close Critical vulnerabilities in Italy",
+])
+def test_count_and_metric_questions_are_lookups(message):
+    assert classify(message) == ("lookup", "keyword")
+
+
+@pytest.mark.parametrize("message", [
+    "show me open critical vulns in Italy grouped by service",
+    "How many open vulnerabilities per market?",
+    "List the overdue vulnerabilities in Spain",
+    "How many Critical vulns in Italy by service?",
+    "Compare the number of open findings in Italy and Spain",
+    "Explain the KPI for Italy",
+])
+def test_lists_groupings_and_analysis_are_full(message):
+    assert classify(message) == ("full", "keyword")
+
+
+@pytest.mark.parametrize("message", [
+    "show me open critical vulns in Italy",
+    "closed vulnerabilities in Spain last month",
+    "anything overdue?",
+])
+def test_state_words_alone_are_not_lookups(message):
+    assert classify(message)[0] == "full"
+
+
+def test_reports_are_routed_as_reports():
+    assert classify("Give me the PDF report for Italy") == ("report", "keyword")
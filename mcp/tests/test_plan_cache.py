@@ -0,0 +1,76 @@
+import re
+
+import pytest
+
+import answer_cache
+import plan_cache as plan_cache_module
+from plan_cache import PlanCache
+
+MARKETS = ["Italy", "Spain"]
+
+
+def fake_entities(message):
+    markets = [m for m in MARKETS if re.search(rf"\b{m}\b", message, re.IGNORECASE)]
+    severities = [s for s in ("Critical", "High") if re.search(rf"\b{s}\b", message, re.IGNORECASE)]
+    return {"markets": markets, "services": [], "severities": severities}
+
+
+class FakeMarketIndex:
+    def known_markets(self):
+        return MARKETS
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(answer_cache, "detect_entities", fake_entities)
+    monkeypatch.setattr(plan_cache_module, "market_index", FakeMarketIndex())
+    monkeypatch.setattr(plan_cache_module, "PLAN_CACHE_MIN_SUCCESSES", 2)
+    return PlanCache()
+
+
+def run_sql_call(sql, ok=True):
+    return [("run_sql", {"sql": sql}, ok)]
+
+
+SQL_ITALY = "SELECT COUNT(*) FROM `gostlm.gost_bq.vulnerabilities_light` WHERE market = 'Italy' AND severity = 'Critical'"
+
+
+def test_plan_is_used_after_enough_successes(cache):
+    question = "How many open Critical vulnerabilities in Italy?"
+    cache.learn(question, run_sql_call(SQL_ITALY))
+    assert cache.plan_for("How many open Critical vulnerabilities in Spain?") is None
+    cache.learn(question, run_sql_call(SQL_ITALY))
+    assert cache.plan_for("How many open High vulnerabilities in Spain?") == (
+        "SELECT COUNT(*) FROM `gostlm.gost_bq.vulnerabilities_light` WHERE market = 'Spain' AND severity = 'High'"
+    )
+
+
+def test_negated_question_gets_no_plan(cache):
+    for _ in range(2):
+        cache.learn("How many Critical vulnerabilities in Italy are overdue?", run_sql_call(SQL_ITALY))
+    assert cache.plan_for("How many Critical vulnerabilities in Spain are not overdue?") is None
+
+
+def test_turns_with_several_or_failed_calls_are_not_learned(cache):
+    question = "How many open Critical vulnerabilities in Italy?"
+    for _ in range(2):
+        cache.learn(question, run_sql_call(SQL_ITALY) * 2)
+        cache.learn(question, run_sql_call(SQL_ITALY, ok=False))
+    assert cache.plan_for(question) is None
+
+
+def test_sql_naming_another_market_is_not_learned(cache):
+    sql = "SELECT COUNT(*) FROM t WHERE market = 'Italy' AND severity = 'Critical' OR market = 'Spain'"
+    for _ in range(2):
+        cache.learn("How many open Critical vulnerabilities in Italy?", run_sql_call(sql))
+    assert cache.plan_for("How many open Critical vulnerabilities in Italy?") is None
+
+
+def test_forget_drops_a_failing_plan(cache):
+    question = "How many open Critical vulnerabilities in Italy?"
+    for _ in range(2):
+        cache.learn(question, run_sql_call(SQL_ITALY))
+    planned = cache.plan_for(question)
+    assert planned == SQL_ITALY
+    cache.forget(question, planned)
+    assert cache.plan_for(question) is None
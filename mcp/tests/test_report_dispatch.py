@@ -0,0 +1,24 @@
+import pytest
+
+from report_dispatch import is_status_question
+
+
+@pytest.mark.parametrize("message", [
+    "is my report ready?",
+    "Is it done?",
+    "where's the link?",
+    "where is my PDF",
+    "report status?",
+])
+def test_report_status_questions(message):
+    assert is_status_question(message)
+
+
+@pytest.mark.parametrize("message", [
+    "Where are most overdue vulnerabilities?",
+    "Which ones are done?",
+    "link",
+    "How many are finished in Italy?",
+])
+def test_data_questions_are_not_status_questions(message):
+    assert not is_status_question(message)
@@ -0,0 +1,133 @@
+import time
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import report_storage
+from fake_gcs import FakeBucket, FakeUploadTransport, RESUMABLE_CHUNK_ALIGN
+from report_storage import ReportStore, etag_matches, parse_range, stream_pdf
+
+
+@pytest.fixture(autouse=True)
+def fake_transport(monkeypatch):
+    monkeypatch.setattr(report_storage, "upload_transport", FakeUploadTransport())
+
+
+def pdf_writer(size, fail=False):
+    def write_pdf(target):
+        for start in range(0, size, 100_000):
+            target.write(b"x" * min(100_000, size - start))
+            if fail and start > size // 2:
+                raise RuntimeError("render failed")
+    return write_pdf
+
+
+def test_stream_pdf_uploads_in_aligned_chunks():
+    bucket = FakeBucket()
+    blob = bucket.blob("r.pdf")
+    size = 3 * RESUMABLE_CHUNK_ALIGN * 4 + 123
+    assert stream_pdf(blob, pdf_writer(size), "test") == size
+    assert len(bucket.objects["r.pdf"]) == size
+    assert blob.chunks_uploaded == 4  # three full 1 MiB chunks and the rest
+
+
+def test_failed_render_commits_nothing():
+    bucket = FakeBucket()
+    with pytest.raises(RuntimeError):
+        stream_pdf(bucket.blob("r.pdf"), pdf_writer(3_000_000, fail=True), "test")
+    assert "r.pdf" not in bucket.objects
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-9", (0, 9)),
+    ("bytes=90-", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=50-500", (50, 99)),
+    ("bytes=0-1,5-9", None),
+    ("bytes=9-1", None),
+    ("items=0-9", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
+
+
+def test_etag_matches():
+    assert etag_matches('"a", "b"', '"b"')
+    assert etag_matches('W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
+
+
+@pytest.fixture
+def store(monkeypatch):
+    version = {"value": "2025-01-01"}
+    monkeypatch.setattr(report_storage, "run_sql", lambda sql: {"rows": [[version["value"]]]})
+    monkeypatch.setattr(report_storage, "REPORT_VERSION_CHECK_SECONDS", 0)
+    monkeypatch.setattr(report_storage, "REPORT_REUSE_SECONDS", 900)
+    monkeypatch.setattr(report_storage, "REPORT_DOWNLOAD_BASE_URL", "https://example.test/mcp")
+    store = ReportStore()
+    store.endpoint_links = True
+    store.version = version
+    return store
+
+
+def test_link_tokens_verify_and_expire(store):
+    link = store.link(None, "VULNAI_Report_global_1.pdf", minutes=5)
+    query = dict(p.split("=", 1) for p in link.split("?", 1)[1].split("&"))
+    expires = int(query["expires"])
+    assert link.startswith("https://example.test/mcp/v1/reports/VULNAI_Report_global_1.pdf?")
+    assert store.verify("VULNAI_Report_global_1.pdf", expires, query["token"])
+    assert not store.verify("VULNAI_Report_global_2.pdf", expires, query["token"])
+    assert not store.verify("VULNAI_Report_global_1.pdf", expires + 1, query["token"])
+    assert not store.verify("VULNAI_Report_global_1.pdf", int(time.time()) - 1,
+                            store._token("VULNAI_Report_global_1.pdf", int(time.time()) - 1))
+
+
+def test_reuse_needs_the_same_data_version(store):
+    store.remember("overview:Italy", "VULNAI_Report_Italy_1.pdf")
+    assert "VULNAI_Report_Italy_1.pdf" in store.reuse("overview:Italy", None, "overview")
+    assert store.reuse("overview:Spain", None, "overview") is None
+    store.version["value"] = "2025-01-02"
+    assert store.reuse("overview:Italy", None, "overview") is None
+
+
+def test_reuse_window_expires(store, monkeypatch):
+    store.remember("application", "VULNAI_Application_Report_1.pdf")
+    monkeypatch.setattr(report_storage, "REPORT_REUSE_SECONDS", 0)
+    assert store.reuse("application", None, "application") is None
+
+
+def test_stat_cache_is_bounded(store, monkeypatch):
+    monkeypatch.setattr(report_storage, "REPORT_STAT_CACHE_SIZE", 3)
+    bucket = FakeBucket()
+    for i in range(5):
+        bucket.objects[f"r{i}.pdf"] = b"%PDF"
+        assert store.stat(bucket, f"r{i}.pdf")["size"] == 4
+    assert list(store._stats) == ["r2.pdf", "r3.pdf", "r4.pdf"]
+
+
+def test_deleted_report_is_dropped_from_the_stat_cache(store):
+    bucket = FakeBucket()
+    bucket.objects["r.pdf"] = b"%PDF"
+    assert store.stat(bucket, "r.pdf")
+    del bucket.objects["r.pdf"]
+    with pytest.raises(api_exceptions.NotFound):
+        list(store.read(bucket, "r.pdf", 0, 3))
+    assert store.stat(bucket, "r.pdf") is None
+
+
+def test_local_stat_sees_pruned_reports(store, monkeypatch, tmp_path):
+    monkeypatch.setattr(report_storage, "REPORT_LOCAL_DIR", str(tmp_path))
+    store.local = True
+    store.save(None, "r.pdf", pdf_writer(1000), "test")
+    assert store.stat(None, "r.pdf")["size"] == 1000
+    (tmp_path / "r.pdf").unlink()
+    assert store.stat(None, "r.pdf") is None
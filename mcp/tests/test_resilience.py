@@ -0,0 +1,188 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from google.api_core import exceptions as api_exceptions
+
+import resilience
+from resilience import (
+    CircuitBreaker, CircuitOpen, DeadlineExceeded, LatencyTracker,
+    collect_sections, deadline, hedged_call, remaining, retry_call,
+)
+from tracing import submit_with_context
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(resilience.time, "sleep", lambda seconds: None)
+
+
+def _failing(errors, result="ok"):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fn, calls
+
+
+def test_transient_errors_are_retried():
+    fn, calls = _failing([api_exceptions.ServiceUnavailable("down"), api_exceptions.TooManyRequests("slow down")])
+    assert retry_call("op", fn) == "ok"
+    assert len(calls) == 3
+
+
+def test_other_errors_are_not_retried():
+    fn, calls = _failing([api_exceptions.BadRequest("Unrecognized name: x")])
+    with pytest.raises(api_exceptions.BadRequest):
+        retry_call("op", fn)
+    assert len(calls) == 1
+
+
+def test_bigquery_quota_reasons_are_transient():
+    error = api_exceptions.Forbidden("quota", errors=[{"reason": "rateLimitExceeded"}])
+    assert resilience.is_transient(error)
+    assert not resilience.is_transient(api_exceptions.Forbidden("denied", errors=[{"reason": "accessDenied"}]))
+
+
+def test_retries_stop_after_the_last_attempt():
+    fn, calls = _failing([ConnectionError("reset")] * 5)
+    with pytest.raises(ConnectionError):
+        retry_call("op", fn)
+    assert len(calls) == resilience.RETRY_MAX_ATTEMPTS
+
+
+def test_nested_deadline_never_extends_the_outer_one():
+    with deadline(1):
+        with deadline(60):
+            assert remaining() <= 1
+    assert remaining() is None
+
+
+def test_expired_deadline_stops_retries():
+    fn, calls = _failing([])
+    with deadline(-1), pytest.raises(DeadlineExceeded):
+        retry_call("op", fn)
+    assert calls == []
+
+
+def test_deadline_follows_worker_threads():
+    with ThreadPoolExecutor(max_workers=1) as executor, deadline(30):
+        left = submit_with_context(executor, remaining).result()
+    assert 0 < left <= 30
+
+
+def test_circuit_opens_and_closes_after_a_successful_trial(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=30)
+
+    def down():
+        raise api_exceptions.ServiceUnavailable("down")
+
+    for _ in range(2):
+        with pytest.raises(api_exceptions.ServiceUnavailable):
+            breaker.call(down)
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpen):
+        breaker.call(lambda: "ok")
+
+    now[0] += 31
+    assert breaker.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_failed_trial_reopens_the_circuit(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_seconds=30)
+    with pytest.raises(ConnectionError):
+        breaker.call(lambda: (_ for _ in ()).throw(ConnectionError("reset")))
+    now[0] += 31
+    with pytest.raises(ConnectionError):
+        breaker.call(lambda: (_ for _ in ()).throw(ConnectionError("reset")))
+    assert breaker.state == "open"
+    assert breaker.opened_at == now[0]
+
+
+def test_query_errors_do_not_open_the_circuit():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    with pytest.raises(api_exceptions.BadRequest):
+        breaker.call(lambda: (_ for _ in ()).throw(api_exceptions.BadRequest("syntax error")))
+    assert breaker.state == "closed"
+
+
+def test_deadlines_do_not_open_the_circuit():
+    breaker = CircuitBreaker("test", failure_threshold=1)
+    with pytest.raises(DeadlineExceeded):
+        breaker.call(lambda: (_ for _ in ()).throw(DeadlineExceeded("slow query")))
+    assert breaker.state == "closed"
+
+
+def test_first_attempts_do_not_queue_for_the_hedge_executor(monkeypatch):
+    tracker = LatencyTracker()
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        tracker.observe("op", 10)
+    monkeypatch.setattr(resilience, "latencies", tracker)
+    busy = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as hedges, ThreadPoolExecutor(max_workers=4) as callers:
+        monkeypatch.setattr(resilience, "_hedge_executor", hedges)
+        hedges.submit(busy.wait, 5)
+        try:
+            started = threading.Barrier(4, timeout=2)
+
+            def query():
+                started.wait()  # Only passes when all four run at once
+                return "ok"
+
+            results = [callers.submit(hedged_call, "op", query) for _ in range(4)]
+            assert [r.result(timeout=5) for r in results] == ["ok"] * 4
+        finally:
+            busy.set()
+
+
+def test_slow_call_is_hedged_and_the_first_result_wins(monkeypatch):
+    tracker = LatencyTracker()
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        tracker.observe("op", 0.01)
+    monkeypatch.setattr(resilience, "latencies", tracker)
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY_SECONDS", 0.05)
+    release = threading.Event()
+    calls = []
+
+    def query():
+        calls.append(resilience.is_hedge_attempt())
+        if len(calls) == 1:
+            release.wait(5)
+            return "original"
+        return "hedge"
+
+    try:
+        assert hedged_call("op", query) == "hedge"
+    finally:
+        release.set()
+    assert calls == [False, True]
+
+
+def test_no_hedge_without_enough_samples(monkeypatch):
+    monkeypatch.setattr(resilience, "latencies", LatencyTracker())
+    fn, calls = _failing([])
+    assert hedged_call("op", fn) == "ok"
+    assert len(calls) == 1
+
+
+def test_collect_sections_reports_failed_and_late_sections():
+    release = threading.Event()
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        futures = {
+            executor.submit(lambda: 1): "ok",
+            executor.submit(lambda: 1 / 0): "broken",
+            executor.submit(release.wait, 5): "slow",
+        }
+        results, missing = collect_sections(futures, timeout=0.2)
+        release.set()
+    assert results == {"ok": 1, "broken": None, "slow": None}
+    assert missing == ["broken", "slow"]
@@ -0,0 +1,19 @@
+import pytest
+
+from result_shaping import inject_limit
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM t LIMIT 10 -- top ten", ("SELECT * FROM t LIMIT 10", None)),
+    ("SELECT * FROM t LIMIT 10; # top ten", ("SELECT * FROM t LIMIT 10", None)),
+    ("SELECT * FROM t LIMIT 500 -- everything", ("SELECT * FROM t LIMIT 50", 50)),
+    ("SELECT * FROM t\nLIMIT 10\n-- top ten\n", ("SELECT * FROM t\nLIMIT 10", None)),
+    ("SELECT * FROM t;", ("SELECT * FROM t\nLIMIT 50", 50)),
+])
+def test_inject_limit(sql, expected):
+    assert inject_limit(sql, 50) == expected
+
+
+def test_comment_markers_inside_strings_are_kept():
+    sql = "SELECT * FROM t WHERE note = 'a -- b' AND tag = \"#1\" LIMIT 10"
+    assert inject_limit(sql, 50) == (sql, None)
@@ -0,0 +1,31 @@
+import numpy as np
+
+import risk_layer
+from risk_layer import RiskLayer
+
+
+def _layer(monkeypatch):
+    layer = RiskLayer()
+    layer.columns = {
+        "service": np.array(["Black Box"] * 4, dtype=object),
+        "state": np.array(["Open", "Closed", None, "Parked"], dtype=object),
+        "kpi_category": np.array(["High", "High", "Low", "Low"], dtype=object),
+        "individual_risk_score": np.array([4.0, 2.0, 8.0, 6.0]),
+    }
+    monkeypatch.setattr(layer, "refresh", lambda force=False: None)
+    return layer
+
+
+def test_active_risk_excludes_null_states_like_not_in(monkeypatch):
+    result = _layer(monkeypatch).active_risk(["Black Box"])
+    assert result["rows"] == [["High", 1, 4.0], ["Total", 1, 4.0]]
+
+
+def test_total_risk_keeps_every_state(monkeypatch):
+    result = _layer(monkeypatch).active_risk(["Black Box"], active_only=False)
+    assert result["rows"][-1] == ["Total", 4, 5.0]
+
+
+def test_notin_treats_null_as_unknown():
+    column = np.array(["Open", None, "Closed"], dtype=object)
+    assert risk_layer._notin(column, ["Closed"]).tolist() == [True, False, False]
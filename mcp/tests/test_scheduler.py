@@ -0,0 +1,74 @@
+import pytest
+
+import scheduler
+from scheduler import Overloaded, RateLimiter, user_key
+
+
+@pytest.fixture
+def trusted(monkeypatch):
+    monkeypatch.setattr(scheduler, "_TRUSTED_NETWORKS", scheduler._parse_networks("172.16.0.0/12, 127.0.0.1"))
+
+
+def test_identity_headers_from_a_trusted_proxy(trusted):
+    headers = {"x-openwebui-user-id": "u-1", "x-forwarded-for": "203.0.113.9"}
+    assert user_key(headers, "172.18.0.3") == "user:u-1"
+    assert user_key({"x-forwarded-for": "198.51.100.1, 203.0.113.9"}, "127.0.0.1") == "ip:203.0.113.9"
+
+
+def test_identity_headers_from_anyone_else_are_ignored(trusted):
+    headers = {"x-openwebui-user-id": "u-1", "x-forwarded-for": "203.0.113.9"}
+    key = user_key(headers, "198.51.100.7")
+    assert key.startswith("request:")
+
+
+def test_no_identity_never_shares_a_key(trusted):
+    # Open WebUI without user headers: every user would share its address
+    first = user_key({}, "172.18.0.3")
+    second = user_key({}, "172.18.0.3")
+    assert first.startswith("request:") and first != second
+
+
+def test_nothing_is_trusted_by_default(monkeypatch):
+    monkeypatch.setattr(scheduler, "_TRUSTED_NETWORKS", scheduler._parse_networks(""))
+    assert user_key({"x-openwebui-user-id": "u-1"}, "127.0.0.1").startswith("request:")
+    assert user_key({}, None).startswith("request:")
+
+
+def test_rate_limiter_is_per_user():
+    limiter = RateLimiter("test", rate_per_second=0.001, capacity=2)
+    limiter.check("user:a")
+    limiter.check("user:a")
+    with pytest.raises(Overloaded) as rejected:
+        limiter.check("user:a")
+    assert rejected.value.retry_after >= 1
+    limiter.check("user:b")
+
+
+def test_callers_without_identity_share_their_address_bucket(trusted):
+    limiter = RateLimiter("test", rate_per_second=0.001, capacity=2)
+    limiter.check(user_key({}, "198.51.100.7"))
+    limiter.check(user_key({}, "198.51.100.7"))
+    with pytest.raises(Overloaded):
+        limiter.check(user_key({}, "198.51.100.7"))
+    limiter.check(user_key({}, "198.51.100.8"))
+
+
+def test_bucket_count_is_capped(monkeypatch):
+    limiter = RateLimiter("test", rate_per_second=1, capacity=1, max_users=100)
+    for i in range(150):
+        limiter.check(f"user:{i}")
+    assert len(limiter._buckets) == 100
+    # The most recently seen users keep their state
+    with pytest.raises(Overloaded):
+        limiter.check("user:149")
+
+
+def test_idle_bucket_refills(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    limiter = RateLimiter("test", rate_per_second=1, capacity=1)
+    limiter.check("user:a")
+    with pytest.raises(Overloaded):
+        limiter.check("user:a")
+    now[0] += 2
+    limiter.check("user:a")
@@ -0,0 +1,82 @@
+import time
+import threading
+
+import resilience
+from resilience import hedged_call, LatencyTracker
+from singleflight import SingleFlight, normalize_sql, query_key
+
+
+def test_normalize_sql_keeps_quoted_text():
+    assert normalize_sql("SELECT  *\n FROM t WHERE a = 'x  y';") == "SELECT * FROM t WHERE a = 'x  y'"
+
+
+def test_query_key_differs_by_params_and_extra():
+    sql = "SELECT 1"
+    assert query_key(sql, {"m": "Italy"}) != query_key(sql, {"m": "Spain"})
+    assert query_key(sql, None, "rows", 10) != query_key(sql, None, "arrow", 10)
+    assert query_key(sql + " ", None) == query_key(sql, None)
+
+
+def test_concurrent_identical_calls_share_one_run():
+    flight = SingleFlight("test")
+    started = []
+    release = threading.Event()
+
+    def job():
+        started.append(1)
+        release.wait(2)
+        return {"rows": [[1]]}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", job))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(started) == 1
+    assert results == [{"rows": [[1]]}] * 5
+    # Followers get their own containers
+    assert len({id(r["rows"]) for r in results}) == 5
+
+
+def test_errors_reach_every_caller_and_are_not_kept():
+    flight = SingleFlight("test")
+
+    def fail():
+        raise ValueError("boom")
+
+    for _ in range(2):
+        try:
+            flight.do("k", fail)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("expected the error")
+    assert flight.stats["leaders"] == 2
+
+
+def test_hedge_duplicate_runs_its_own_job(monkeypatch):
+    # Regression: the hedge's duplicate had the same key, joined the slow original and never ran
+    monkeypatch.setattr(resilience, "latencies", LatencyTracker())
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY_SECONDS", 0.1)
+    monkeypatch.setattr(resilience, "HEDGE_MIN_SAMPLES", 1)
+    resilience.latencies.observe("test.hedge", 0.1)
+
+    flight = SingleFlight("test")
+    jobs = []
+
+    def job():
+        jobs.append(time.perf_counter())
+        time.sleep(1.5 if len(jobs) == 1 else 0.05)
+        return {"rows": [[len(jobs)]]}
+
+    start = time.perf_counter()
+    result = hedged_call("test.hedge", flight.do, "same-sql", job)
+    elapsed = time.perf_counter() - start
+
+    assert len(jobs) == 2
+    assert elapsed < 1.0
+    assert result == {"rows": [[2]]}
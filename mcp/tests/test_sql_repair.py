@@ -0,0 +1,65 @@
+import pytest
+
+import result_shaping
+from sql_repair import SqlRepairer
+
+TABLES = ["proj.ds.vulnerabilities", "proj.ds.services"]
+
+
+@pytest.fixture
+def repairer():
+    repairer = SqlRepairer(TABLES)
+    repairer.configure({"proj.ds.vulnerabilities": {"schema": [{"name": "severity"}, {"name": "market"}]}})
+    return repairer
+
+
+def test_qualify_bare_and_misspelled_tables(repairer):
+    fixed, changes = repairer.qualify("SELECT * FROM vulnerabilites v JOIN `services` s ON v.id = s.id")
+    assert fixed == "SELECT * FROM `proj.ds.vulnerabilities` v JOIN `proj.ds.services` s ON v.id = s.id"
+    assert len(changes) == 2
+
+
+def test_qualify_leaves_string_literals_alone(repairer):
+    sql = "SELECT * FROM vulnerabilities WHERE title = 'moved from services to vulnerabilities'"
+    fixed, changes = repairer.qualify(sql)
+    assert fixed == "SELECT * FROM `proj.ds.vulnerabilities` WHERE title = 'moved from services to vulnerabilities'"
+    assert changes == ["vulnerabilities -> `proj.ds.vulnerabilities`"]
+
+
+def test_qualify_skips_ctes_and_date_parts(repairer):
+    sql = ("WITH services AS (SELECT EXTRACT(DAY FROM created) AS d FROM `proj.ds.services`) "
+           "SELECT * FROM services")
+    assert repairer.qualify(sql) == (sql, [])
+
+
+def test_repair_unknown_column(repairer):
+    error = Exception("Unrecognized name: severty at [1:8]")
+    fixed, changes = repairer.repair("SELECT severty, 'severty' FROM `proj.ds.vulnerabilities`", error)
+    assert fixed == "SELECT severity, 'severty' FROM `proj.ds.vulnerabilities`"
+    assert changes == ["severty -> severity"]
+
+
+def test_relax_like(repairer):
+    fixed, _ = repairer.relax_like("SELECT * FROM t WHERE market LIKE '%Italy%' AND code LIKE '%42%'")
+    assert fixed == "SELECT * FROM t WHERE LOWER(market) LIKE LOWER('%Italy%') AND code LIKE '%42%'"
+    assert repairer.relax_like("SELECT * FROM t WHERE code LIKE '%42%'") is None
+
+
+def _result(rows):
+    return {"columns": ["n"], "rows": rows, "total_rows": len(rows)}
+
+
+def test_zero_count_is_not_retried(monkeypatch):
+    calls = []
+    monkeypatch.setattr(result_shaping, "run_sql", lambda sql, **kw: calls.append(sql) or _result([[0]]))
+    result_shaping.run_sql_for_model("SELECT COUNT(*) AS n FROM t WHERE market LIKE '%Italy%'")
+    assert len(calls) == 1
+
+
+def test_empty_like_is_retried_case_insensitively(monkeypatch):
+    calls = []
+    monkeypatch.setattr(result_shaping, "run_sql",
+                        lambda sql, **kw: calls.append(sql) or _result([["x"]] if "LOWER" in sql else []))
+    payload = result_shaping.run_sql_for_model("SELECT name FROM t WHERE market LIKE '%Italy%'")
+    assert len(calls) == 2
+    assert "LOWER(market)" in payload["repaired"]
@@ -0,0 +1,35 @@
+import json
+from datetime import datetime, date, timezone
+
+from tool_encoding import encode_columnar, encode_tsv
+
+RESULT = {
+    "columns": ["name", "note", "seen"],
+    "rows": [
+        ["a", None, datetime(2024, 5, 1, 9, 30, 15, tzinfo=timezone.utc)],
+        ["b", "", date(2024, 5, 2)],
+    ],
+    "total_rows": 2,
+}
+
+
+def test_tsv_null_differs_from_empty_string():
+    lines = encode_tsv(RESULT).split("\n")
+    assert lines[0] == "# total_rows=2"
+    assert lines[2].split("\t")[1] == "\\N"
+    assert lines[3].split("\t")[1] == ""
+
+
+def test_text_that_looks_like_the_null_marker_is_escaped():
+    result = {"columns": ["note"], "rows": [["NULL"], ["\\N"], ["\\\\N"], [None]]}
+    cells = encode_tsv(result).split("\n")[1:]
+    assert cells == ["NULL", "\\\\N", "\\\\\\N", "\\N"]
+
+
+def test_timestamps_keep_seconds_and_timezone():
+    lines = encode_tsv(RESULT).split("\n")
+    assert lines[2].split("\t")[2] == "2024-05-01T09:30:15+00:00"
+    assert lines[3].split("\t")[2] == "2024-05-02"
+    data = json.loads(encode_columnar(RESULT))["data"]
+    assert data["seen"] == ["2024-05-01T09:30:15+00:00", "2024-05-02"]
+    assert data["note"] == [None, ""]
@@ -0,0 +1,131 @@
+import os
+import re
+import json
+from typing import Any, Dict, List, Tuple
+from datetime import datetime, date
+
+from result_shaping import estimate_tokens, json_serial
+
+# Encoding used for tool results that are not listed in the overrides below.
+# Supported: "json" (row arrays, the original format), "tsv", "columnar".
+DEFAULT_TOOL_ENCODING = os.getenv("TOOL_RESULT_ENCODING", "json")
+# Per-tool overrides, e.g. "run_sql=tsv,get_table_schema=json"
+TOOL_ENCODING_OVERRIDES = os.getenv("TOOL_RESULT_ENCODING_OVERRIDES", "run_sql=tsv,top_vulnerabilities=tsv")
+
+# String columns with at most this many distinct values get dictionary-encoded
+COLUMNAR_DICT_MAX_DISTINCT = 32
+# TSV cell for NULL, as in MySQL/PostgreSQL dumps; a text cell that looks like it gets one more backslash
+TSV_NULL = "\\N"
+_LOOKS_LIKE_NULL = re.compile(r"^\\+N$")
+
+
+def _parse_overrides(raw: str) -> Dict[str, str]:
+    overrides = {}
+    for item in raw.split(","):
+        if "=" in item:
+            tool, encoding = item.split("=", 1)
+            overrides[tool.strip()] = encoding.strip().lower()
+    return overrides
+
+
+_OVERRIDES = _parse_overrides(TOOL_ENCODING_OVERRIDES)
+
+
+def encoding_for_tool(tool_name: str) -> str:
+    return _OVERRIDES.get(tool_name, DEFAULT_TOOL_ENCODING)
+
+
+def _short_value(value: Any) -> Any:
+    """Rounds floats; dates and timestamps stay ISO, as in the JSON form."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, float):
+        return round(value, 4)
+    return value
+
+
+def _is_tabular(result: Any) -> bool:
+    return isinstance(result, dict) and "columns" in result and "rows" in result
+
+
+def _meta(result: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in result.items() if k not in ("columns", "rows")}
+
+
+def _tsv_cell(value: Any) -> str:
+    value = _short_value(value)
+    if value is None:
+        return TSV_NULL
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value, default=json_serial)
+    text = str(value).replace("\t", " ").replace("\r", " ").replace("\n", " ")
+    return "\\" + text if _LOOKS_LIKE_NULL.match(text) else text
+
+
+def encode_tsv(result: Dict[str, Any]) -> str:
+    """
+    Header line + one tab-separated line per row. Metadata such as
+    total_rows goes on a leading '#' line. NULL cells are written as \\N.
+    """
+    lines = []
+    meta = _meta(result)
+    if meta:
+        lines.append("# " + " ".join(f"{k}={v}" for k, v in meta.items()))
+    lines.append("\t".join(result["columns"]))
+    for row in result["rows"]:
+        lines.append("\t".join(_tsv_cell(c) for c in row))
+    return "\n".join(lines)
+
+
+def encode_columnar(result: Dict[str, Any]) -> str:
+    """
+    One array per column. Low-cardinality string columns are sent as
+    {"dict": [...values], "idx": [...positions]} instead of repeating values.
+    """
+    columns: List[str] = result["columns"]
+    rows: List[List[Any]] = result["rows"]
+    data = {}
+    for i, name in enumerate(columns):
+        values = [_short_value(row[i]) for row in rows]
+        distinct = list(dict.fromkeys(v for v in values if isinstance(v, str)))
+        if (
+            len(rows) > 2
+            and distinct
+            and len(distinct) <= COLUMNAR_DICT_MAX_DISTINCT
+            and len(distinct) < len(rows)
+            and all(v is None or isinstance(v, str) for v in values)
+        ):
+            positions = {v: j for j, v in enumerate(distinct)}
+            data[name] = {"dict": distinct, "idx": [None if v is None else positions[v] for v in values]}
+        else:
+            data[name] = values
+    payload = _meta(result)
+    payload["data"] = data
+    return json.dumps(payload, default=json_serial, separators=(",", ":"))
+
+
+def encode_tool_result(tool_name: str, result: Any) -> Tuple[str, Dict[str, Any]]:
+    """
+    Encodes a tool result for the model using the encoding selected for the tool.
+    Returns the encoded text and a stats dict comparing it with the plain JSON form.
+    """
+    json_text = json.dumps(result, default=json_serial)
+    encoding = encoding_for_tool(tool_name) if _is_tabular(result) else "json"
+
+    if encoding == "tsv":
+        encoded = encode_tsv(result)
+    elif encoding == "columnar":
+        encoded = encode_columnar(result)
+    else:
+        encoding = "json"
+        encoded = json_text
+
+    json_tokens = estimate_tokens(json_text)
+    encoded_tokens = estimate_tokens(encoded)
+    stats = {
+        "encoding": encoding,
+        "json_tokens": json_tokens,
+        "encoded_tokens": encoded_tokens,
+        "saved_tokens": json_tokens - encoded_tokens,
+    }
+    return encoded, stats
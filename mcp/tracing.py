@@ -0,0 +1,58 @@
+import os
+import contextvars
+from typing import Any, Callable
+
+from opentelemetry import trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+# Where spans go: "otlp" (local collector), "file" (JSON lines) or "none"
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+# OTLP/HTTP collector endpoint, e.g. a local otel-collector or Jaeger
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+TRACE_FILE = os.getenv("TRACE_FILE", "/opt/vulnai/mcp/traces.jsonl")
+
+tracer = trace.get_tracer("vulnai.mcp")
+
+
+def setup_tracing():
+    """Installs the tracer provider and exporter selected by TRACE_EXPORTER."""
+    if TRACE_EXPORTER == "none":
+        print("Tracing disabled (TRACE_EXPORTER=none).")
+        return
+
+    provider = TracerProvider(resource=Resource.create({"service.name": "vulnai-mcp"}))
+    if TRACE_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        exporter = OTLPSpanExporter(endpoint=TRACE_OTLP_ENDPOINT)
+    elif TRACE_EXPORTER == "file":
+        trace_file = open(TRACE_FILE, "a")
+        exporter = ConsoleSpanExporter(
+            out=trace_file,
+            formatter=lambda span: span.to_json(indent=None) + "\n"
+        )
+    else:
+        print(f"Unknown TRACE_EXPORTER '{TRACE_EXPORTER}'. Tracing disabled.")
+        return
+
+    provider.add_span_processor(BatchSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    print(f"Tracing enabled ({TRACE_EXPORTER}).")
+
+
+def submit_with_context(executor, fn: Callable, *args: Any, **kwargs: Any):
+    """
+    executor.submit() that carries the caller's context into the worker
+    thread: the trace context, so spans opened there (e.g. BigQuery jobs)
+    attach to the report span, and the caller's deadline (resilience.deadline).
+    """
+    # OpenTelemetry keeps the current span in a contextvar, so one copy carries both
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
+
+
+def record_span(name: str, start_ns: int, end_ns: int, **attributes: Any):
+    """Records an already-finished phase (start/end in time.time_ns()) as a child span."""
+    span = tracer.start_span(name, start_time=start_ns, attributes=attributes)
+    span.end(end_time=end_ns)
@@ -0,0 +1,116 @@
+import os
+import time
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bigquery_client import run_sql
+from query_registry import registry
+
+# --- Incremental monthly trend store ---
+# Keeps vulnerability counts per (month, market, service). After a new load
+# in update_history only the months from the previous load onwards are
+# re-aggregated, and trend charts read cumulative series from memory
+# instead of scanning the whole history on every report.
+
+# Seconds between update_history checks
+TREND_CHECK_SECONDS = int(os.getenv("TREND_CHECK_SECONDS", "60"))
+# Months before the previous load that are re-aggregated too (late or corrected publish dates)
+TREND_LOOKBACK_MONTHS = int(os.getenv("TREND_LOOKBACK_MONTHS", "1"))
+# A full rebuild every so often catches changes to older months
+TREND_FULL_REBUILD_SECONDS = int(os.getenv("TREND_FULL_REBUILD_SECONDS", "86400"))
+
+TREND_SERVICES = ["Black Box", "White Box", "Adversary Simulation"]
+
+_FULL_HISTORY = "1970-01-01"
+
+Key = Tuple[Any, str, str]
+
+
+def _month_floor(value: datetime, months_back: int = 0) -> str:
+    month_index = value.year * 12 + (value.month - 1) - months_back
+    return f"{month_index // 12:04d}-{month_index % 12 + 1:02d}-01"
+
+
+def _as_datetime(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    return datetime(value.year, value.month, value.day)
+
+
+class TrendStore:
+    def __init__(self):
+        self.counts: Dict[Key, int] = {}
+        self.version: Optional[datetime] = None
+        self._checked_at = 0.0
+        self._rebuilt_at = 0.0
+        self._lock = threading.Lock()
+
+    def _load(self, since: str) -> Dict[Key, int]:
+        query = registry.get("TREND_COUNTS")
+        result = run_sql(query.sql, params={"since": since}, max_results=1000000)
+        return {(row[0], row[1], row[2]): row[3] for row in result["rows"]}
+
+    def refresh(self, force: bool = False):
+        """Brings the store up to date with the latest update_history entry."""
+        with self._lock:
+            now = time.time()
+            if not force and self.counts and now - self._checked_at < TREND_CHECK_SECONDS:
+                return
+            last_update = run_sql(registry.get("LAST_UPDATE").sql)["rows"]
+            version = last_update[0][0] if last_update else None
+            self._checked_at = now
+            if not force and self.counts and version == self.version:
+                return
+
+            if not self.counts or self.version is None or now - self._rebuilt_at > TREND_FULL_REBUILD_SECONDS:
+                self.counts = self._load(_FULL_HISTORY)
+                self._rebuilt_at = now
+                print(f"Trend store rebuilt ({len(self.counts)} cells).")
+            else:
+                # Only months that the new load can have touched are re-aggregated
+                since = _month_floor(self.version, TREND_LOOKBACK_MONTHS)
+                fresh = self._load(since)
+                since_month = datetime.strptime(since, "%Y-%m-%d")
+                kept = {k: v for k, v in self.counts.items() if _as_datetime(k[0]) < since_month}
+                kept.update(fresh)
+                self.counts = kept
+                print(f"Trend store updated from {since} ({len(fresh)} cells).")
+            self.version = version
+
+    def monthly_trend(self, markets: Optional[List[str]] = None, services: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Cumulative monthly series for the given markets/services (None = all).
+        Returns month labels, the cumulative total and one cumulative series per service.
+        """
+        self.refresh()
+        counts = self.counts  # Snapshot; refresh() swaps in a new dict
+        market_set = set(markets) if markets else None
+        service_set = set(services) if services else None
+
+        per_month: Dict[Any, Dict[str, int]] = {}
+        for (month, market, service), count in counts.items():
+            if market_set is not None and market not in market_set:
+                continue
+            if service_set is not None and service not in service_set:
+                continue
+            by_service = per_month.setdefault(month, {})
+            by_service[service] = by_service.get(service, 0) + count
+
+        months = sorted(per_month, key=_as_datetime)
+        total = np.cumsum([sum(per_month[m].values()) for m in months], dtype=np.int64)
+        by_service = {
+            service: np.cumsum([per_month[m].get(service, 0) for m in months], dtype=np.int64)
+            for service in TREND_SERVICES
+        }
+        return {
+            "months": [_as_datetime(m).strftime("%b") for m in months],
+            "month_starts": months,
+            "total": total,
+            "by_service": by_service,
+        }
+
+
+trend_store = TrendStore()